@@ -0,0 +1,60 @@
+"""
+Measure NearDuplicateStage throughput on a synthetic stream,
+where some of the statuses are variants of a few spam texts.
+
+Usage: python benchmarks/bench_dedupe.py [number of tweets]
+"""
+
+import random
+import sys
+import time
+
+from twitter_monitor.dedupe import simhash, NearDuplicateStage
+
+WORDS = ("the a to of and in is it you that he was for on are with as his they be at one have this from "
+         "or had by hot word but what some we can out other were all there when up use your how said an "
+         "each she which do their time if will way about many then them write would like so these her long "
+         "make thing see him two has look more day could go come did number sound no most people my over").split()
+
+SPAM = [
+    "Win a free iPhone today, just click the link and enter your details to claim the prize",
+    "Earn thousands a week working from home, no experience needed, sign up now for free",
+    "Follow back everyone who retweets this and gain a thousand new followers in an hour",
+]
+
+
+def make_statuses(count, spam_share=0.3, seed=1):
+    rng = random.Random(seed)
+    statuses = []
+    for i in range(count):
+        if rng.random() < spam_share:
+            words = rng.choice(SPAM).split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            text = " ".join(words) + " http://t.co/%d" % i
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+        statuses.append({'id': i, 'text': text})
+    return statuses
+
+
+def bench(count):
+    statuses = make_statuses(count)
+
+    start = time.time()
+    for status in statuses:
+        simhash(status['text'])
+    hashing = time.time() - start
+
+    stage = NearDuplicateStage(capacity=count // 2)
+    start = time.time()
+    for status in statuses:
+        stage.process(status)
+    elapsed = time.time() - start
+
+    print("simhash only:  %.3fs (%d tweets/s)" % (hashing, count / hashing))
+    print("full stage:    %.3fs (%d tweets/s)" % (elapsed, count / elapsed))
+    print("near duplicates: %d of %d, %d signatures kept" % (stage.duplicates, stage.seen, len(stage.index)))
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,64 @@
+"""
+Compare the memory held by decoded status dicts with
+projected records, with and without the raw JSON.
+
+Usage: python benchmarks/bench_projection.py [number of tweets]
+"""
+
+import json
+import sys
+import tracemalloc
+
+from twitter_monitor.projection import Projection
+
+
+def make_status(i):
+    return json.dumps({
+        "id": 1000000 + i,
+        "id_str": str(1000000 + i),
+        "in_reply_to_status_id": None,
+        "created_at": "Sat Sep 10 22:23:38 +0000 2011",
+        "text": "Tweet number %d about #something and @someone http://t.co/abc" % i,
+        "lang": "en",
+        "source": "<a href=\"http://twitter.com\" rel=\"nofollow\">Twitter Web Client</a>",
+        "user": dict(("field_%d" % f, "value %d %d" % (i, f)) for f in range(40)),
+        "entities": {
+            "hashtags": [{"text": "something", "indices": [21, 31]}],
+            "user_mentions": [{"screen_name": "someone", "id": 12, "indices": [36, 44]}],
+            "urls": [{"url": "http://t.co/abc", "expanded_url": "http://example.com/%d" % i,
+                      "indices": [45, 60]}],
+        },
+        "retweet_count": 0,
+        "favorited": False,
+        "coordinates": None,
+        "place": None,
+    })
+
+
+def measure(count, build):
+    # As received from the stream, delimiter included
+    raw = [make_status(i) + "\r\n" for i in range(count)]
+    tracemalloc.start()
+    kept = [build(data) for data in raw]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    projection = Projection()
+    raw_projection = Projection(keep_raw=True)
+
+    results = [
+        ("status dicts", measure(count, json.loads)),
+        ("projected records", measure(count, lambda data: projection(json.loads(data)))),
+        ("records with raw json", measure(count, lambda data: raw_projection(json.loads(data), raw=data.strip()))),
+    ]
+    for name, size in results:
+        print("%-22s %8.0f bytes/tweet" % (name, float(size) / count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare tweepy's read loop with FastStream's, reading
+tweets from a local stand-in server over a real socket.
+Listener work is kept to a minimum so the reading dominates.
+
+Usage: python benchmarks/bench_reader.py [number of tweets]
+"""
+
+import json
+import socket
+import sys
+import threading
+import time
+
+import requests
+import tweepy
+
+from twitter_monitor.reader import FastStream
+
+CHUNK = 16384
+
+
+def make_body(count):
+    """A length-delimited stream body, with keep-alives now and then"""
+    parts = []
+    for i in range(count):
+        tweet = json.dumps({
+            "id": 1000000 + i,
+            "in_reply_to_status_id": None,
+            "text": "Tweet number %d about #something and @someone http://t.co/abc" % i,
+            "user": dict(("field_%d" % f, "value %d %d" % (i, f)) for f in range(40)),
+        }).encode('utf8') + b'\r\n'
+        parts.append(str(len(tweet)).encode('ascii') + b'\r\n' + tweet)
+        if i % 100 == 0:
+            parts.append(b'\r\n')
+    return b''.join(parts)
+
+
+def serve(body):
+    """Serve the body once, chunked, and return the URL"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def handle():
+        connection, _ = server.accept()
+        stream = connection.makefile('rwb')
+        while stream.readline() not in (b'\r\n', b''):
+            pass
+        stream.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n')
+        for start in range(0, len(body), CHUNK):
+            chunk = body[start:start + CHUNK]
+            stream.write(('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n')
+        stream.write(b'0\r\n\r\n')
+        stream.close()
+        connection.close()
+        server.close()
+
+    thread = threading.Thread(target=handle)
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:%d/' % server.getsockname()[1]
+
+
+class CountingListener(tweepy.StreamListener):
+    def __init__(self):
+        super(CountingListener, self).__init__()
+        self.count = 0
+        self.bytes = 0
+
+    def on_data(self, data):
+        self.count += 1
+        self.bytes += len(data)
+        return True
+
+
+def measure(stream_class, body):
+    listener = CountingListener()
+    stream = stream_class(None, listener)
+    stream.running = True
+
+    response = requests.get(serve(body), stream=True)
+    start = time.time()
+    stream._read_loop(response)
+    return time.time() - start, listener.count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    body = make_body(count)
+
+    for name, stream_class in [("tweepy.Stream", tweepy.Stream), ("FastStream", FastStream)]:
+        elapsed, received = measure(stream_class, body)
+        print("%-14s %6d tweets in %6.3fs  %8.0f tweets/s  %6.1f MB/s" %
+              (name, received, elapsed, received / elapsed, len(body) / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare SQLiteListener's batched writer with
+committing one tweet at a time.
+
+Usage: python benchmarks/bench_sqlite_sink.py [number of tweets]
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from twitter_monitor.sqlite_sink import SQLiteListener
+
+
+def make_tweets(count):
+    tweets = []
+    for i in range(count):
+        tweets.append(json.dumps({
+            "id": 1000000 + i,
+            "in_reply_to_status_id": None,
+            "created_at": "Sat Sep 10 22:23:38 +0000 2011",
+            "text": "Tweet number %d about #something and more words" % i,
+            "lang": "en",
+            "user": {"id": i % 5000, "screen_name": "user%d" % (i % 5000)},
+        }))
+    return tweets
+
+
+def bench_one_by_one(filename, tweets):
+    connection = sqlite3.connect(filename)
+    connection.execute('CREATE TABLE tweets (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT)')
+    start = time.time()
+    for data in tweets:
+        status = json.loads(data)
+        connection.execute('INSERT INTO tweets VALUES (?, ?, ?)',
+                           (status['id'], status['user']['id'], status['text']))
+        connection.commit()
+    elapsed = time.time() - start
+    connection.close()
+    return elapsed
+
+
+def bench_listener(filename, tweets):
+    listener = SQLiteListener(filename)
+    start = time.time()
+    for data in tweets:
+        listener.on_data(data)
+    listener.close()
+    return time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    tweets = make_tweets(count)
+    directory = tempfile.mkdtemp()
+    try:
+        slow_count = min(count, 2000)
+        elapsed = bench_one_by_one(os.path.join(directory, 'naive.db'), tweets[:slow_count])
+        print("one commit per tweet: %8.0f tweets/sec" % (slow_count / elapsed))
+
+        elapsed = bench_listener(os.path.join(directory, 'batched.db'), tweets)
+        print("SQLiteListener:       %8.0f tweets/sec" % (count / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,3 +20,11 @@ class TestBasicFileTermChecker(TestCase):
 
         self.assertTrue(self.listener.print_status.called)
         self.assertTrue(super_update_tracking_terms.called)
+
+    @mock.patch("twitter_monitor.checker.FileTermChecker.update_tracking_terms")
+    def test_prints_attached_stream_status(self, super_update_tracking_terms):
+        stream = mock.Mock()
+        self.checker.attach(stream)
+
+        self.checker.update_tracking_terms()
+        self.listener.print_status.assert_called_once_with(stream)
@@ -87,12 +87,34 @@ class TestBasicStreamSignals(TestCase):
         self.assertTrue(signal.SIGTERM in signals)
         self.assertTrue(signal.SIGINT in signals)
 
-    def test_terminate(self):
-        """Should stop the listener and raise a SystemExit"""
+    @mock.patch('twitter_monitor.basic_stream.signal')
+    def test_terminate(self, signal):
+        """Should stop the listener and polling without exiting"""
+
+        stream = mock.Mock()
+        basic_stream.set_terminate_listeners(stream)
+        self.assertTrue(basic_stream.should_continue())
 
-        listener = mock.Mock()
-        self.assertRaises(SystemExit, basic_stream.terminate, listener)
-        self.assertTrue(listener.set_terminate.called)
+        basic_stream.terminate(stream)
+
+        self.assertTrue(stream.listener.set_terminate.called)
+        self.assertFalse(stream.polling)
+        self.assertTrue(stream.wake.called)
+        self.assertFalse(basic_stream.should_continue())
+
+        # Stopping the stream blocks, so it is left to the main thread
+        self.assertFalse(stream.stop_polling.called)
+
+    @mock.patch('twitter_monitor.basic_stream.signal')
+    def test_terminate_twice(self, signal):
+        """A second signal should raise a SystemExit"""
+
+        stream = mock.Mock()
+        basic_stream.set_terminate_listeners(stream)
+
+        basic_stream.terminate(stream)
+        self.assertRaises(SystemExit, basic_stream.terminate, stream)
+        self.assertEqual(stream.wake.call_count, 1)
 
 
 class TestBasicStream(TestCase):
@@ -112,7 +134,7 @@ class TestBasicStream(TestCase):
 
         mock_open.assert_called_once_with(outfile, 'wb')
 
-        PrintingListener.assert_called_once_with(out=mock_open.return_value)
+        PrintingListener.assert_called_once_with(out=mock_open.return_value, stats_path=outfile + ".stats.json")
         self.assertEqual(result, PrintingListener.return_value)
 
     @mock.patch('os.path.exists')
@@ -135,6 +157,27 @@ class TestBasicStream(TestCase):
         self.assertEqual(mock_open.call_count, 0)
 
 
+    @mock.patch('twitter_monitor.basic_stream.DurableFileWriter')
+    @mock.patch('twitter_monitor.basic_stream.PrintingListener')
+    def test_construct_listener_durable(self, PrintingListener, DurableFileWriter):
+        result = basic_stream.construct_listener("some_file.txt", durable=True,
+                                                 commit_every=10, commit_interval=0.5)
+
+        DurableFileWriter.assert_called_once_with("some_file.txt", commit_every=10, commit_interval=0.5)
+        PrintingListener.assert_called_once_with(out=DurableFileWriter.return_value,
+                                                 stats_path="some_file.txt.stats.json")
+        self.assertEqual(result, PrintingListener.return_value)
+
+    @mock.patch('twitter_monitor.basic_stream.PrintingListener')
+    def test_construct_listener_collapse_retweets(self, PrintingListener):
+        basic_stream.construct_listener(None, collapse_retweets=True, retweet_cache_size=7)
+
+        collapser = PrintingListener.call_args[1]['collapser']
+        self.assertEqual(collapser.stored.size, 7)
+
+    def test_construct_listener_durable_needs_file(self):
+        self.assertRaises(ValueError, basic_stream.construct_listener, None, durable=True)
+
     def test_get_tweepy_auth(self):
         twitter_api_key = b'ak'
         twitter_api_secret = b'as'
@@ -187,3 +230,60 @@ class TestBasicStream(TestCase):
         self.assertEqual(stream.start_polling.call_count, desired_loop_count - 1)
         self.assertEqual(loggerMock.error.call_count, 1)
         time.sleep.assert_called_once_with(1)
+
+
+class TestStart(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+    @mock.patch('twitter_monitor.basic_stream.set_terminate_listeners')
+    @mock.patch('twitter_monitor.basic_stream.begin_stream_loop')
+    @mock.patch('twitter_monitor.basic_stream.Supervisor')
+    def test_start_with_workers(self, Supervisor, begin_stream_loop, set_terminate_listeners):
+        extra = [dict(api_key='k2', api_secret='s2', access_token='t2', access_token_secret='ts2'),
+                 dict(api_key='k3', api_secret='s3', access_token='t3', access_token_secret='ts3')]
+
+        basic_stream.start('track.txt', 'k1', 's1', 't1', 'ts1', workers=2, credentials=extra)
+
+        credentials = Supervisor.call_args[0][0]
+        self.assertEqual([c['api_key'] for c in credentials], ['k1', 'k2'])
+        begin_stream_loop.assert_called_once_with(Supervisor.return_value, 15)
+        Supervisor.return_value.shutdown.assert_called_once_with(timeout=10)
+
+    @mock.patch('twitter_monitor.basic_stream.set_profile_listener')
+    @mock.patch('twitter_monitor.basic_stream.set_terminate_listeners')
+    @mock.patch('twitter_monitor.basic_stream.begin_stream_loop')
+    @mock.patch('twitter_monitor.basic_stream.DynamicTwitterStream')
+    @mock.patch('twitter_monitor.basic_stream.Profiler')
+    def test_start_with_profiling(self, Profiler, DynamicTwitterStream, begin_stream_loop,
+                                  set_terminate_listeners, set_profile_listener):
+        basic_stream.start('track.txt', 'k1', 's1', 't1', 'ts1', profile_dir='/tmp/profiles')
+
+        Profiler.assert_called_once_with('/tmp/profiles', mode='sample')
+        profiler = Profiler.return_value
+        profiler.attach.assert_called_once_with(DynamicTwitterStream.return_value)
+        set_profile_listener.assert_called_once_with(profiler)
+        profiler.close.assert_called_once_with()
+
+    @mock.patch('twitter_monitor.basic_stream.set_terminate_listeners')
+    @mock.patch('twitter_monitor.basic_stream.begin_stream_loop')
+    @mock.patch('twitter_monitor.basic_stream.DynamicTwitterStream')
+    @mock.patch('twitter_monitor.basic_stream.MemoryMonitor')
+    def test_start_with_memory_monitor(self, MemoryMonitor, DynamicTwitterStream, begin_stream_loop,
+                                       set_terminate_listeners):
+        basic_stream.start('track.txt', 'k1', 's1', 't1', 'ts1', memory_interval=60, memory_frames=5)
+
+        MemoryMonitor.assert_called_once_with(interval=60, frames=5)
+        MemoryMonitor.return_value.start.assert_called_once_with()
+        MemoryMonitor.return_value.stop.assert_called_once_with()
+
+    @mock.patch('twitter_monitor.basic_stream.set_terminate_listeners')
+    @mock.patch('twitter_monitor.basic_stream.begin_stream_loop')
+    @mock.patch('twitter_monitor.basic_stream.DynamicTwitterStream')
+    def test_start_with_gzip(self, DynamicTwitterStream, begin_stream_loop, set_terminate_listeners):
+        basic_stream.start('track.txt', 'k1', 's1', 't1', 'ts1', gzip=True)
+
+        self.assertTrue(DynamicTwitterStream.call_args[1]['gzip'])
+
+    def test_start_with_too_few_credentials(self):
+        self.assertRaises(ValueError, basic_stream.start, 'track.txt', 'k1', 's1', 't1', 'ts1', workers=2)
@@ -9,6 +9,8 @@ except ImportError:
     from io import StringIO
 
 import sys, os
+import tempfile
+import shutil
 import json
 import time
 
@@ -37,6 +39,25 @@ class TestPrintingListener(TestCase):
         output = self.out.getvalue().strip()
         self.assertEqual(output, json.dumps(self.example_status))
 
+    def test_collapses_retweets(self):
+        from twitter_monitor.retweets import RetweetCollapser
+        listener = PrintingListener(out=self.out, collapser=RetweetCollapser())
+
+        original = {"id": 1, "text": "hi", "user": {"screen_name": "a"}}
+        listener.on_status({"id": 2, "retweeted_status": original})
+        listener.write_raw(json.dumps({"id": 3, "retweeted_status": original}))
+
+        records = [json.loads(line) for line in self.out.getvalue().splitlines()]
+        self.assertEqual(records[0]["id"], 1)
+        self.assertEqual([r["id"] for r in records[1:] if "retweet_ref" in r], [2, 3])
+
+    def test_write_raw(self):
+        """Already encoded tweets are printed as they are"""
+        self.listener.write_raw('{"id": 1}')
+
+        self.assertEqual(self.out.getvalue(), '{"id": 1}' + os.linesep)
+        self.assertEqual(self.listener.total, 1)
+
     def test_prints_newlines_between_tweets(self):
         """There must be newlines between tweets"""
 
@@ -80,8 +101,60 @@ class TestPrintingListener(TestCase):
         self.listener.print_status()
         self.assertTrue(logger.info.called)
 
+    @mock.patch('twitter_monitor.basic_stream.logger')
+    def test_logs_compression(self, logger):
+        stream = mock.Mock(compressed_bytes=100, decompressed_bytes=900)
+        stream.compression_ratio.return_value = 9.0
+
+        self.listener.print_status(stream)
+        logger.info.assert_called_with("Received %d compressed bytes as %d bytes (%.1fx)", 100, 900, 9.0)
+
+    def test_close_writes_stats(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "out.json.stats.json")
+            listener = PrintingListener(out=self.out, stats_path=path)
+            listener.on_status(self.example_status)
+            listener.on_status(self.example_status)
+            listener.set_terminate()
+            listener.close()
+
+            with open(path) as infile:
+                stats = json.load(infile)
+            self.assertEqual(stats['tweets'], 2)
+            self.assertTrue(stats['terminated'])
+            self.assertTrue(stats['finished_at'] >= stats['started_at'])
+            self.assertEqual(os.listdir(directory), ["out.json.stats.json"])
+        finally:
+            shutil.rmtree(directory)
+
     def test_resets_received_after_stats(self):
         self.listener.received = 1
         self.listener.print_status()
         self.assertEqual(self.listener.received, 0)
 
+    @mock.patch('twitter_monitor.basic_stream.logger')
+    def test_close_flushes(self, logger):
+        out = mock.Mock()
+        out.fileno.side_effect = ValueError("no file")
+        listener = PrintingListener(out=out)
+
+        listener.on_status(self.example_status)
+        listener.close()
+
+        self.assertTrue(out.flush.called)
+        self.assertEqual(listener.total, 1)
+        self.assertTrue(logger.info.called)
+
+    def test_close_syncs_real_files(self):
+        import tempfile
+        with tempfile.TemporaryFile(mode='w+') as out:
+            listener = PrintingListener(out=out)
+            listener.on_status(self.example_status)
+
+            with mock.patch('os.fsync') as fsync:
+                listener.close()
+                fsync.assert_called_once_with(out.fileno())
+
+            out.seek(0)
+            self.assertEqual(out.read().strip(), json.dumps(self.example_status))
@@ -0,0 +1,69 @@
+"""
+Stand-ins shared by the tests.
+"""
+
+from twitter_monitor import JsonStreamListener, TermChecker
+
+
+class ListChecker(TermChecker):
+    """
+    Basic term checker that checks a list of terms.
+    Add/remove terms to this list externally.
+    """
+
+    def __init__(self, list):
+        super(ListChecker, self).__init__()
+        self._list = list
+
+    def update_tracking_terms(self):
+        return set(self._list)
+
+
+class StaticTermChecker(TermChecker):
+    """A term checker with its own set of terms, changed through .terms"""
+
+    def __init__(self, terms=()):
+        super(StaticTermChecker, self).__init__()
+        self.terms = set(terms)
+
+    def update_tracking_terms(self):
+        return set(self.terms)
+
+
+class RecordingListener(JsonStreamListener):
+    """Keeps the ids of statuses, limit notices, keep-alives and raw lines it is given"""
+
+    def __init__(self):
+        super(RecordingListener, self).__init__()
+        self.statuses = []
+        self.limits = []
+        self.keep_alives = 0
+        self.lines = []
+        self.closed = False
+
+    def on_status(self, status):
+        self.statuses.append(status['id'])
+        return True
+
+    def on_limit(self, track):
+        self.limits.append(track)
+        return True
+
+    def keep_alive(self):
+        self.keep_alives += 1
+
+    def write_raw(self, raw):
+        self.lines.append(raw)
+
+    def close(self, timeout=None):
+        self.closed = True
+
+
+class Clock(object):
+    """A clock that only moves when now is changed"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,82 @@
+from unittest import TestCase
+import logging
+
+from twitter_monitor.aggregation import TermVolumeAggregator
+from tests.helpers import Clock, ListChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class TestTermVolumeAggregator(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.clock = Clock(1000.0)
+        self.aggregator = TermVolumeAggregator(windows=(10, 60), clock=self.clock)
+        self.aggregator.sync_terms(["a", "b"])
+
+    def test_counts_within_windows(self):
+        for second in range(30):
+            self.aggregator.observe(["a"], now=self.clock.now + second)
+        self.clock.now += 29
+
+        self.assertEqual(self.aggregator.count("a", 10), 10)
+        self.assertEqual(self.aggregator.count("a", 60), 30)
+        self.assertEqual(self.aggregator.count("b", 60), 0)
+        self.assertEqual(self.aggregator.rate("a", 10), 1.0)
+
+    def test_counts_expire(self):
+        self.aggregator.observe(["a"], now=self.clock.now)
+        self.clock.now += 30
+        self.assertEqual(self.aggregator.count("a", 10), 0)
+        self.assertEqual(self.aggregator.count("a", 60), 1)
+
+        self.clock.now += 3600
+        self.assertEqual(self.aggregator.count("a", 60), 0)
+
+        # Still counting after a long gap
+        self.aggregator.observe(["a"], now=self.clock.now)
+        self.assertEqual(self.aggregator.count("a", 60), 1)
+
+    def test_unknown_window(self):
+        self.assertRaises(ValueError, self.aggregator.count, "a", 30)
+
+    def test_top(self):
+        self.aggregator.sync_terms(["a", "b", "c"])
+        self.aggregator.observe(["a", "b"])
+        self.aggregator.observe(["b"])
+        self.aggregator.observe(["b", "c", "untracked"])
+
+        self.assertEqual(self.aggregator.top(2, 60), [("b", 3), ("a", 1)])
+        self.assertEqual(self.aggregator.counts(60), {"a": 1, "b": 3, "c": 1})
+
+    def test_follows_checker(self):
+        terms = ["hello"]
+        checker = ListChecker(terms)
+        checker.check()
+        aggregator = TermVolumeAggregator(checker, windows=(60,), clock=self.clock)
+
+        aggregator.process({"id": 1, "text": "hello world"})
+        self.assertEqual(aggregator.count("hello"), 1)
+
+        terms.remove("hello")
+        terms.append("world")
+        checker.check()
+        aggregator.process({"id": 2, "text": "hello world"})
+
+        self.assertEqual(sorted(aggregator.terms), ["world"])
+        self.assertEqual(aggregator.count("world"), 1)
+
+    def test_uses_attributed_terms(self):
+        self.aggregator.process({"id": 1, "text": "nothing", "matched_terms": ["a"]})
+        self.assertEqual(self.aggregator.count("a"), 1)
+
+    def test_limit_loss(self):
+        self.aggregator.process({"id": 1, "matched_terms": ["a"]})
+        self.aggregator.on_limit(10)
+        self.aggregator.on_limit(25)
+
+        # A reconnect starts the count again
+        self.aggregator.on_limit(5)
+
+        self.assertEqual(self.aggregator.lost_count(60), 30)
+        self.assertEqual(self.aggregator.received_count(60), 1)
@@ -0,0 +1,225 @@
+from unittest import TestCase, skipIf
+import threading
+import logging
+import socket
+import json
+import sys
+import mock
+
+import tweepy
+
+from tests.helpers import RecordingListener, StaticTermChecker
+
+if sys.version_info >= (3, 6):
+    import asyncio
+    from twitter_monitor.aio import AsyncTwitterStream, AsyncTermChecker, open_stream
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def status(status_id):
+    return json.dumps({'id': status_id, 'text': 'hello', 'in_reply_to_status_id': None}).encode('utf8')
+
+
+class StandInServer(object):
+    """
+    A local stand-in for the streaming API. Each connection gets
+    the next response: (status code, list of body chunks).
+    Connections are kept open after the body until the client goes.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.closed = threading.Event()
+
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(5)
+        self.url = 'http://127.0.0.1:%d/1.1/statuses/filter.json' % self.socket.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self.handle, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, connection):
+        stream = connection.makefile('rwb')
+        head = []
+        while True:
+            line = stream.readline()
+            if line in (b'\r\n', b''):
+                break
+            head.append(line.decode('latin-1').strip())
+        headers = dict((name.lower(), value.strip()) for name, _, value in
+                       (line.partition(':') for line in head[1:]))
+        body = stream.read(int(headers.get('content-length', 0)))
+        self.requests.append((head[0], headers, body.decode('utf8')))
+
+        code, chunks = self.responses.pop(0) if self.responses else (200, [])
+        stream.write(('HTTP/1.1 %d Whatever\r\nTransfer-Encoding: chunked\r\n\r\n' % code).encode('latin-1'))
+        for chunk in chunks:
+            stream.write(('%x\r\n' % len(chunk)).encode('latin-1') + chunk + b'\r\n')
+            stream.flush()
+
+        if code != 200:
+            stream.write(b'0\r\n\r\n')
+            stream.flush()
+        else:
+            # Wait for the client to hang up
+            connection.recv(1)
+            self.closed.set()
+        connection.close()
+
+    def close(self):
+        self.socket.close()
+
+
+class AsyncRecordingListener(RecordingListener):
+    def on_status(self, status):
+        super(AsyncRecordingListener, self).on_status(status)
+        # An async hook
+        return asyncio.sleep(0, result=True)
+
+
+@skipIf(sys.version_info < (3, 6), "asyncio streams need Python 3.6")
+class TestAsyncTwitterStream(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.servers = []
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        for server in self.servers:
+            server.close()
+
+    def server(self, *responses):
+        server = StandInServer(responses)
+        self.servers.append(server)
+        return server
+
+    def run_until(self, streams, condition, timeout=5):
+        """Poll the streams until condition() is true, then stop them"""
+        def stop():
+            for stream in streams:
+                stream.stop_polling()
+
+        def watch():
+            if condition():
+                stop()
+            else:
+                self.loop.call_later(0.01, watch)
+
+        self.loop.call_later(timeout, stop)
+        self.loop.call_soon(watch)
+        self.loop.run_until_complete(asyncio.gather(*[stream.start_polling(60) for stream in streams]))
+
+    def test_chunked_lines(self):
+        # Messages split across chunks, with keep-alive newlines between
+        server = self.server((200, [status(1)[:10], status(1)[10:] + b'\r\n\r\n',
+                                    status(2) + b'\r\n' + status(3)[:5], status(3)[5:] + b'\r\n']))
+
+        async_lines = []
+
+        def read():
+            response = self.loop.run_until_complete(open_stream('POST', server.url, {'track': 'a'}, timeout=5))
+            self.assertEqual(response.status, 200)
+            lines = response.lines()
+            for _ in range(4):
+                async_lines.append(self.loop.run_until_complete(lines.__anext__()))
+            response.close()
+            self.loop.run_until_complete(lines.aclose())
+
+        read()
+        self.assertEqual(async_lines, [status(1), b'', status(2), status(3)])
+
+    def test_streams_statuses(self):
+        server = self.server((200, [status(1) + b'\r\n\r\n' + status(2)[:7], status(2)[7:] + b'\r\n']))
+        listener = AsyncRecordingListener()
+
+        auth = tweepy.OAuthHandler('key', 'secret')
+        auth.set_access_token('token', 'token_secret')
+        stream = AsyncTwitterStream(auth, listener, StaticTermChecker(["cats", "dogs"]),
+                                    filter_url=server.url, languages=['en'])
+
+        self.run_until([stream], lambda: len(listener.statuses) == 2)
+
+        self.assertEqual(listener.statuses, [1, 2])
+        self.assertEqual(listener.keep_alives, 1)
+        self.assertFalse(stream.running)
+
+        request_line, headers, body = server.requests[0]
+        self.assertTrue(request_line.startswith('POST /1.1/statuses/filter.json'))
+        self.assertTrue(headers['authorization'].startswith('OAuth '))
+        self.assertIn('oauth_signature=', headers['authorization'])
+        self.assertIn('language=en', body)
+        self.assertTrue('track=cats%2Cdogs' in body or 'track=dogs%2Ccats' in body)
+
+        # Stopping closes the connection
+        self.assertTrue(server.closed.wait(2))
+
+    def test_async_checker(self):
+        server = self.server((200, [status(1) + b'\r\n']))
+        listener = AsyncRecordingListener()
+
+        class Checker(AsyncTermChecker):
+            def update_tracking_terms(self):
+                return asyncio.sleep(0, result=set(["birds"]))
+
+        stream = AsyncTwitterStream(None, listener, Checker(), filter_url=server.url)
+        self.run_until([stream], lambda: listener.statuses)
+
+        self.assertEqual(listener.statuses, [1])
+        self.assertEqual(stream.term_checker.tracking_terms(), ["birds"])
+        self.assertIn('track=birds', server.requests[0][2])
+
+    def test_error_status(self):
+        server = self.server((420, []))
+        listener = AsyncRecordingListener()
+        listener.on_error = mock.Mock(return_value=False)
+
+        stream = AsyncTwitterStream(None, listener, StaticTermChecker(["cats"]), filter_url=server.url)
+        self.run_until([stream], lambda: listener.on_error.called and not stream.running)
+
+        listener.on_error.assert_called_once_with(420)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_many_streams_on_one_loop(self):
+        servers = [self.server((200, [status(i) + b'\r\n'])) for i in range(5)]
+        listeners = [AsyncRecordingListener() for _ in servers]
+        streams = [AsyncTwitterStream(None, listener, StaticTermChecker(["term%d" % i]), filter_url=server.url)
+                   for i, (server, listener) in enumerate(zip(servers, listeners))]
+
+        self.run_until(streams, lambda: all(listener.statuses for listener in listeners))
+
+        self.assertEqual([listener.statuses for listener in listeners], [[i] for i in range(5)])
+
+    def test_shutdown(self):
+        server = self.server((200, [status(1) + b'\r\n']))
+        listener = AsyncRecordingListener()
+        listener.close = mock.Mock(return_value=asyncio.sleep(0))
+
+        stream = AsyncTwitterStream(None, listener, StaticTermChecker(["cats"]), filter_url=server.url)
+        polling = self.loop.create_task(stream.start_polling(60))
+
+        while not listener.statuses:
+            self.loop.run_until_complete(asyncio.sleep(0.01))
+
+        self.loop.run_until_complete(stream.shutdown(timeout=2))
+        self.loop.run_until_complete(polling)
+
+        self.assertTrue(listener.terminate)
+        self.assertEqual(listener.close.call_count, 1)
+        self.assertTrue(server.closed.wait(2))
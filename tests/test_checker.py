@@ -3,26 +3,13 @@ import tempfile
 import os
 import logging
 
-from twitter_monitor.checker import TermChecker, FileTermChecker
+from twitter_monitor.checker import TermChecker, FileTermChecker, FileLocationChecker
+from tests.helpers import ListChecker
 
 
 logger = logging.getLogger("twitter_monitor")
 
 
-class ListChecker(TermChecker):
-    """
-    Basic term checker that checks a list of terms.
-    Add/remove terms to this list externally.
-    """
-
-    def __init__(self, list):
-        super(ListChecker, self).__init__()
-        self._list = list
-
-    def update_tracking_terms(self):
-        return set(self._list)
-
-
 class TestDefaultTermChecker(unittest.TestCase):
     """This mostly just exists to get 100% test coverage..."""
 
@@ -77,6 +64,25 @@ class TestTermChecker(unittest.TestCase):
         self.assertTrue(self.checker.check(), "check returns True after term removed")
         self.assertFalse(self.checker.check(), "check returns False again")
 
+    def test_check_replaced(self):
+        self.term_list.append("my term")
+        self.checker.check()
+
+        self.term_list.remove("my term")
+        self.term_list.append("other term")
+        self.assertTrue(self.checker.check(), "check returns True after term replaced")
+        self.assertEqual(self.checker.tracking_terms(), ["other term"])
+
+    def test_version(self):
+        version = self.checker.version
+
+        self.checker.check()
+        self.assertEqual(self.checker.version, version, "Unchanged terms keep the version")
+
+        self.term_list.append("my term")
+        self.checker.check()
+        self.assertEqual(self.checker.version, version + 1, "Changed terms bump the version")
+
     def test_reset(self):
         # Add a term and check
         self.term_list.append("my term")
@@ -115,3 +121,24 @@ class TestFileTermChecker(unittest.TestCase):
     def tearDown(self):
         self.file.close()
         os.unlink(self.file.name)
+
+
+class TestFileLocationChecker(unittest.TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.file = tempfile.NamedTemporaryFile(delete=False)
+        self.file.write(b"-122.75,36.8,-121.75,37.8\n")
+        self.file.write(b"  -74,40,-73,41  \n")
+        self.file.write(b"1,2,3\n")
+        self.file.write(b"5,5,4,4\n")
+        self.file.write(b"not,a,box,here\n")
+        self.file.close()
+
+        self.checker = FileLocationChecker(self.file.name)
+
+    def test_update_tracked_terms(self):
+        boxes = self.checker.update_tracking_terms()
+        self.assertEqual(boxes, set([(-122.75, 36.8, -121.75, 37.8), (-74.0, 40.0, -73.0, 41.0)]))
+
+    def tearDown(self):
+        os.unlink(self.file.name)
@@ -0,0 +1,221 @@
+from unittest import TestCase, skipIf, skipUnless
+import tempfile
+import threading
+import logging
+import shutil
+import gzip
+import json
+import os
+
+from twitter_monitor import columnar
+from twitter_monitor.columnar import (ColumnarListener, TcolWriter, read_row_groups, read_rows,
+                                      convert_file, convert, _RowGroup)
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def tweet(status_id, text="hello #world", user_id=7, terms=None):
+    status = {'id': status_id, 'in_reply_to_status_id': None, 'text': text, 'lang': 'en',
+              'created_at': 'Sat Sep 10 22:23:38 +0000 2011', 'timestamp_ms': '1315693418000',
+              'user': {'id': user_id, 'screen_name': 'alice'},
+              'entities': {'hashtags': [{'text': 'world'}]}}
+    if terms is not None:
+        status['matched_terms'] = terms
+    return status
+
+
+class ColumnarTestCase(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write_capture(self, name, lines, compress=False):
+        path = self.path(name)
+        data = ''.join(line + '\n' for line in lines).encode('utf8')
+        with (gzip.open(path, 'wb') if compress else open(path, 'wb')) as out:
+            out.write(data)
+        return path
+
+
+class TestTcol(ColumnarTestCase):
+    def write(self, *groups):
+        writer = TcolWriter(self.path('out.tcol'))
+        for statuses in groups:
+            group = _RowGroup()
+            for status in statuses:
+                group.add(status, status.get('matched_terms', ()))
+            writer.write(group)
+        writer.close()
+        return self.path('out.tcol')
+
+    def test_round_trip(self):
+        status = tweet(2 ** 62, text=u"café #world", terms=["world"])
+        status['user'] = None
+        del status['timestamp_ms']
+        path = self.write([tweet(1), status])
+
+        rows = list(read_rows(path))
+        self.assertEqual(rows[0], {
+            'id': 1, 'created_at': 'Sat Sep 10 22:23:38 +0000 2011', 'timestamp_ms': 1315693418000,
+            'user_id': 7, 'screen_name': 'alice', 'lang': 'en', 'text': 'hello #world',
+            'hashtags': ['world'], 'matched_terms': [],
+        })
+        self.assertEqual(rows[1]['id'], 2 ** 62)
+        self.assertIsNone(rows[1]['user_id'])
+        self.assertIsNone(rows[1]['timestamp_ms'])
+        self.assertEqual(rows[1]['text'], u"café #world")
+        self.assertEqual(rows[1]['matched_terms'], ["world"])
+
+    def test_selected_columns(self):
+        path = self.write([tweet(1), tweet(2)], [tweet(3)])
+
+        groups = list(read_row_groups(path, columns=['id', 'lang']))
+        self.assertEqual(groups, [{'id': [1, 2], 'lang': ['en', 'en']}, {'id': [3], 'lang': ['en']}])
+        self.assertRaises(ValueError, list, read_row_groups(path, columns=['nope']))
+
+    def test_cut_short(self):
+        path = self.write([tweet(1)], [tweet(2)])
+        with open(path, 'rb+') as out:
+            out.truncate(os.path.getsize(path) - 5)
+
+        self.assertEqual([row['id'] for row in read_rows(path)], [1])
+
+    def test_not_tcol(self):
+        path = self.write_capture('capture.json', [json.dumps(tweet(1))])
+        self.assertRaises(ValueError, list, read_rows(path))
+
+
+class TestColumnarListener(ColumnarTestCase):
+    def test_writes_row_groups(self):
+        listener = ColumnarListener(self.path('out.tcol'), format='tcol', row_group_size=2)
+        for status_id in range(5):
+            self.assertTrue(listener.on_data(json.dumps(tweet(status_id, terms=["world"]))))
+        listener.write_raw(json.dumps(tweet(5)))
+        listener.close(5)
+
+        groups = list(read_row_groups(self.path('out.tcol'), columns=['id', 'matched_terms']))
+        self.assertEqual([group['id'] for group in groups], [[0, 1], [2, 3], [4, 5]])
+        self.assertEqual(groups[0]['matched_terms'], [["world"], ["world"]])
+        self.assertEqual(listener.written, 6)
+
+    def test_keeps_writing_after_failure(self):
+        listener = ColumnarListener(self.path('out.tcol'), format='tcol', row_group_size=1)
+        write = listener.writer.write
+        calls = []
+
+        def fail_first(group):
+            calls.append(group)
+            if len(calls) == 1:
+                raise RuntimeError("bad group")
+            write(group)
+
+        listener.writer.write = fail_first
+        for status_id in range(2):
+            self.assertTrue(listener.on_status(tweet(status_id)))
+        listener.close(5)
+
+        self.assertFalse(listener.thread.is_alive())
+        self.assertEqual([row['id'] for row in read_rows(self.path('out.tcol'))], [1])
+
+    def test_close_times_out(self):
+        listener = ColumnarListener(self.path('out.tcol'), format='tcol', queue_size=1)
+        gate = threading.Event()
+        listener.writer.write = lambda group: gate.wait(5)
+
+        # One group being written and one queued, so nothing more fits
+        listener.queue.put(_RowGroup())
+        listener.queue.put(_RowGroup())
+        listener.on_status(tweet(1))
+        listener.close(0.05)
+        self.assertTrue(listener.thread.is_alive())
+
+        gate.set()
+        listener.queue.put(columnar._STOP)
+        listener.thread.join(5)
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, ColumnarListener, self.path('out'), format='csv')
+
+    @skipIf(columnar.pyarrow is not None, "pyarrow is installed")
+    def test_parquet_needs_pyarrow(self):
+        self.assertEqual(columnar.default_format(), 'tcol')
+        self.assertRaises(ImportError, ColumnarListener, self.path('out.parquet'), format='parquet')
+
+    @skipUnless(columnar.pyarrow is not None, "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        listener = ColumnarListener(self.path('out.parquet'), format='parquet', row_group_size=2)
+        for status_id in range(3):
+            listener.on_status(tweet(status_id))
+        listener.close(5)
+
+        parquet = pyarrow.parquet.ParquetFile(self.path('out.parquet'))
+        self.assertEqual(parquet.num_row_groups, 2)
+        self.assertEqual(parquet.read(columns=['id']).column('id').to_pylist(), [0, 1, 2])
+
+
+class TestConvert(ColumnarTestCase):
+    def test_convert_file(self):
+        path = self.write_capture('capture.json.gz', [
+            json.dumps(tweet(1)),
+            '',
+            json.dumps({'delete': {'status': {'id': 1, 'user_id': 7}}}),
+            'not json',
+            json.dumps(tweet(2, terms=["world"])),
+        ], compress=True)
+
+        written, skipped = convert_file(path, self.path('out.tcol'), format='tcol', row_group_size=1)
+        self.assertEqual((written, skipped), (2, 2))
+
+        rows = list(read_rows(self.path('out.tcol'), columns=['id', 'matched_terms']))
+        self.assertEqual(rows, [{'id': 1, 'matched_terms': []}, {'id': 2, 'matched_terms': ["world"]}])
+
+    def test_convert_null_extended_tweet(self):
+        status = tweet(1)
+        status['extended_tweet'] = None
+        path = self.write_capture('capture.json', [json.dumps(status)])
+
+        self.assertEqual(convert_file(path, self.path('out.tcol'), format='tcol'), (1, 0))
+        self.assertEqual(list(read_rows(self.path('out.tcol'), columns=['hashtags'])), [{'hashtags': ['world']}])
+
+    def test_convert_in_processes(self):
+        paths = [self.write_capture('capture-%d.json' % number,
+                                    [json.dumps(tweet(number * 10 + offset)) for offset in range(3)])
+                 for number in range(3)]
+        out = self.path('out')
+        os.mkdir(out)
+
+        results = convert(paths, out, format='tcol', processes=2)
+
+        self.assertEqual([(os.path.basename(out_path), written) for path, out_path, written, skipped in results],
+                         [('capture-0.tcol', 3), ('capture-1.tcol', 3), ('capture-2.tcol', 3)])
+        self.assertEqual([row['id'] for row in read_rows(os.path.join(out, 'capture-2.tcol'))], [20, 21, 22])
+
+    def test_convert_name_collision(self):
+        for directory in ('a', 'b'):
+            os.mkdir(self.path(directory))
+        paths = [self.write_capture(os.path.join('a', 'tweets.json'), [json.dumps(tweet(1))]),
+                 self.write_capture(os.path.join('b', 'tweets.json'), [json.dumps(tweet(2))])]
+
+        self.assertRaises(ValueError, convert, paths, self.dir, format='tcol')
+        self.assertFalse(os.path.exists(self.path('tweets.tcol')))
+
+    def test_convert_existing(self):
+        os.mkdir(self.path('out'))
+        path = self.write_capture('tweets.json', [json.dumps(tweet(1))])
+        convert([path], self.path('out'), format='tcol')
+
+        self.write_capture('tweets.json', [json.dumps(tweet(2))])
+        self.assertRaises(ValueError, convert, [path], self.path('out'), format='tcol')
+        out_path = os.path.join(self.path('out'), 'tweets.tcol')
+        self.assertEqual([row['id'] for row in read_rows(out_path)], [1])
+
+        convert([path], self.path('out'), format='tcol', overwrite=True)
+        self.assertEqual([row['id'] for row in read_rows(out_path)], [2])
@@ -0,0 +1,212 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import logging
+import json
+import os
+
+import mock
+
+from twitter_monitor.compliance import TombstoneStore, ComplianceListener, Compactor, \
+    compact_file, filter_lines
+from twitter_monitor.retweets import RetweetCollapser, expand_lines
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def make_status(status_id, user_id=1):
+    return {"id": status_id, "user": {"id": user_id}, "text": "hi",
+            "coordinates": {"type": "Point", "coordinates": [1.0, 2.0]},
+            "geo": {"type": "Point", "coordinates": [2.0, 1.0]},
+            "place": {"full_name": "Somewhere"}}
+
+
+class TestTombstoneStore(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_deletes(self):
+        store = TombstoneStore(self.dir, buffer_size=3)
+        for status_id in [50, 10, 30, 10, 70]:
+            store.add_delete(status_id)
+
+        for status_id in [10, 30, 50, 70]:
+            self.assertTrue(store.is_deleted(status_id), status_id)
+        self.assertFalse(store.is_deleted(20))
+
+        # Some were merged to disk along the way
+        self.assertTrue(store.deleted_runs)
+        store.close()
+
+        # And everything survives reopening
+        store = TombstoneStore(self.dir)
+        self.assertEqual(len(store), 4)
+        self.assertTrue(store.is_deleted(70))
+        store.close()
+
+    @mock.patch('twitter_monitor.compliance.TAIL_SIZE', 2)
+    def test_pending_runs(self):
+        store = TombstoneStore(self.dir)
+        for status_id in [50, 10, 30, 10, 70, 20, 90]:
+            store.add_delete(status_id)
+
+        # Sorted runs are merged as they pile up, and the rest is on the tail
+        self.assertEqual([list(run) for run in store._pending_runs], [[10, 10, 30, 50], [20, 70]])
+        self.assertEqual(list(store._pending_tail), [90])
+        for status_id in [10, 20, 30, 50, 70, 90]:
+            self.assertTrue(store.is_deleted(status_id), status_id)
+        self.assertFalse(store.is_deleted(40))
+
+        store.flush()
+        self.assertEqual([list(run) for run in store.deleted_runs], [[(10,), (20,), (30,), (50,), (70,), (90,)]])
+        self.assertEqual(store._pending_runs, [])
+        store.close()
+
+    def test_flush_writes_runs(self):
+        store = TombstoneStore(self.dir)
+        for status_id in range(1, 9):
+            store.add_delete(status_id)
+            store.add_delete(status_id - 1)
+            store.flush()
+
+        # Each flush adds a run, and only runs of about the same size are merged
+        sizes = [len(run) for run in store.deleted_runs]
+        self.assertEqual(sum(sizes), 9)
+        self.assertTrue(len(sizes) <= 4, sizes)
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         sorted([os.path.basename(run.path) for run in store.deleted_runs] + ['tombstones.manifest']))
+        store.close()
+
+        store = TombstoneStore(self.dir)
+        self.assertEqual(len(store), 9)
+        self.assertTrue(all(store.is_deleted(status_id) for status_id in range(9)))
+        store.close()
+
+    def test_watermarks(self):
+        store = TombstoneStore(self.dir)
+        store.add_scrub_geo(5, 100)
+        store.add_scrub_geo(5, 80)
+        store.flush()
+        store.add_scrub_geo(5, 90)
+        store.add_scrub_geo(6, 10)
+
+        self.assertEqual(store.geo_watermark(5), 100)
+        self.assertEqual(store.geo_watermark(6), 10)
+        self.assertEqual(store.geo_watermark(7), 0)
+
+        store.flush()
+        self.assertEqual([list(run) for run in store.watermark_runs], [[(5, 100), (6, 10)]])
+        self.assertEqual(store.geo_watermark(5), 100)
+        store.close()
+
+    def test_apply(self):
+        store = TombstoneStore(self.dir)
+        store.add_delete(1)
+        store.add_scrub_geo(9, 5)
+
+        self.assertEqual(store.apply(make_status(1)), None)
+
+        scrubbed = store.apply(make_status(4, user_id=9))
+        self.assertEqual(scrubbed["coordinates"], None)
+        self.assertEqual(scrubbed["place"], None)
+
+        kept = store.apply(make_status(6, user_id=9))
+        self.assertEqual(kept["place"], {"full_name": "Somewhere"})
+        store.close()
+
+
+class TestCompaction(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.dir = tempfile.mkdtemp()
+        self.store = TombstoneStore(os.path.join(self.dir, "tombstones"))
+        self.capture = os.path.join(self.dir, "capture.json")
+
+        with open(self.capture, 'w') as outfile:
+            for status_id in range(1, 6):
+                outfile.write(json.dumps(make_status(status_id, user_id=status_id % 2)) + "\n")
+            outfile.write('{"limit": {"track": 4}}\n')
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def read_capture(self):
+        with open(self.capture) as infile:
+            return [json.loads(line) for line in infile]
+
+    def test_compact_file(self):
+        self.store.add_delete(2)
+        self.store.add_scrub_geo(1, 3)
+
+        self.assertEqual(compact_file(self.capture, self.store), (1, 2))
+
+        entities = self.read_capture()
+        self.assertEqual([entity.get("id") for entity in entities], [1, 3, 4, 5, None])
+        self.assertEqual([entity.get("place") is None for entity in entities[:4]], [True, True, False, False])
+
+    def test_compact_collapsed_retweets(self):
+        original = make_status(10)
+        statuses = [original]
+        for status_id in [11, 12, 13]:
+            status = make_status(status_id, user_id=2)
+            status['retweeted_status'] = original
+            statuses.append(status)
+
+        collapser = RetweetCollapser()
+        with open(self.capture, 'w') as outfile:
+            for status in statuses:
+                for record in collapser.collapse(status):
+                    outfile.write(json.dumps(record) + "\n")
+
+        self.store.add_delete(12)
+        self.assertEqual(compact_file(self.capture, self.store), (1, 0))
+
+        with open(self.capture) as infile:
+            self.assertEqual([status['id'] for status in expand_lines(infile)], [10, 11, 13])
+
+        with open(self.capture) as infile:
+            ids = [entity.get("id") for entity in filter_lines(infile, self.store)]
+        self.assertEqual(ids, [10, 11, 13])
+
+    def test_compact_file_unchanged(self):
+        mtime = os.path.getmtime(self.capture)
+        self.assertEqual(compact_file(self.capture, self.store), (0, 0))
+        self.assertEqual(os.path.getmtime(self.capture), mtime)
+        self.assertFalse(os.path.exists(self.capture + '.compacting'))
+
+    def test_filter_lines(self):
+        self.store.add_delete(3)
+        with open(self.capture) as infile:
+            ids = [entity.get("id") for entity in filter_lines(infile, self.store)]
+        self.assertEqual(ids, [1, 2, 4, 5, None])
+
+    def test_compactor(self):
+        compactor = Compactor(self.store, os.path.join(self.dir, "*.json"), min_age=0)
+        self.store.add_delete(5)
+        compactor.run_once()
+
+        self.assertEqual([entity.get("id") for entity in self.read_capture()], [1, 2, 3, 4, None])
+        self.assertEqual(compactor.compacted[self.capture], self.store.version)
+
+    def test_compactor_skips_active(self):
+        compactor = Compactor(self.store, os.path.join(self.dir, "*.json"), min_age=0,
+                              active=lambda: [self.capture])
+        self.store.add_delete(5)
+        compactor.run_once()
+
+        self.assertEqual([entity.get("id") for entity in self.read_capture()], [1, 2, 3, 4, 5, None])
+        self.assertNotIn(self.capture, compactor.compacted)
+
+    def test_listener_records_notices(self):
+        listener = ComplianceListener(self.store)
+        listener.on_data('{"delete": {"status": {"id": 4, "user_id": 1}}}')
+        listener.on_data('{"scrub_geo": {"user_id": 7, "up_to_status_id": 40}}')
+        listener.close()
+
+        self.assertTrue(self.store.is_deleted(4))
+        self.assertEqual(self.store.geo_watermark(7), 40)
@@ -0,0 +1,187 @@
+from unittest import TestCase
+import tempfile
+import threading
+import logging
+import shutil
+import socket
+import json
+import os
+import mock
+
+from twitter_monitor import DynamicTwitterStream
+from twitter_monitor.control import SocketTermChecker
+from twitter_monitor.selection import PrioritizingTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def send(address, *commands):
+    """Send commands and return the replies"""
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address, timeout=5)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(address)
+
+    replies = []
+    stream = sock.makefile('rwb')
+    for command in commands:
+        stream.write((json.dumps(command) + '\n').encode('utf8'))
+        stream.flush()
+        replies.append(json.loads(stream.readline().decode('utf8')))
+    stream.close()
+    sock.close()
+    return replies
+
+
+class TestSocketTermChecker(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.checker = SocketTermChecker(('127.0.0.1', 0), terms=["one"])
+        self.checker.start()
+
+    def tearDown(self):
+        self.checker.close()
+
+    def test_commands(self):
+        replies = send(self.checker.address,
+                       {"op": "add", "terms": ["two", "three"]},
+                       {"op": "remove", "terms": ["one"]},
+                       {"op": "get"})
+
+        self.assertEqual(replies[0], {"ok": True, "live": False, "version": 1, "terms": 3})
+        self.assertEqual(replies[1]["terms"], 2)
+        self.assertEqual(replies[2], {"ok": True, "terms": ["three", "two"]})
+
+        self.assertTrue(self.checker.check())
+        self.assertEqual(sorted(self.checker.tracking_terms()), ["three", "two"])
+        self.assertFalse(self.checker.check())
+
+    def test_bulk_replace(self):
+        terms = ["term%d" % i for i in range(1000)]
+        reply, = send(self.checker.address, {"op": "replace", "terms": terms})
+
+        self.assertTrue(reply["ok"])
+        self.assertEqual(reply["terms"], 1000)
+        self.assertEqual(self.checker.update_tracking_terms(), set(terms))
+
+    def test_bad_commands(self):
+        replies = send(self.checker.address,
+                       {"op": "explode"},
+                       {"op": "add", "terms": "one"},
+                       {"terms": []})
+
+        for reply in replies:
+            self.assertFalse(reply["ok"])
+            self.assertIn("error", reply)
+
+    def test_ack_once_stream_restarted(self):
+        stream = mock.Mock()
+        self.checker.attach(stream)
+
+        # The stream restarts with the new terms as soon as it is woken
+        def restart():
+            self.checker.check()
+            self.checker.on_stream_live()
+        stream.wake.side_effect = restart
+
+        reply, = send(self.checker.address, {"op": "add", "terms": ["two"]})
+
+        self.assertTrue(stream.wake.called)
+        self.assertTrue(reply["live"])
+        self.assertEqual(sorted(self.checker.tracking_terms()), ["one", "two"])
+
+    def connected_stream(self, checker):
+        """A stream that is connected, and checks for changes as soon as it is woken"""
+        stream = DynamicTwitterStream(mock.Mock(), mock.Mock(), checker)
+        stream.start_stream = mock.Mock(side_effect=lambda: stream.listener.on_connect())
+        stream.stop_stream = mock.Mock()
+        stream.update_stream()
+        stream.wake = stream.update_stream
+        return stream
+
+    def test_ack_when_nothing_changed(self):
+        self.checker.attach(self.connected_stream(self.checker))
+
+        reply, = send(self.checker.address, {"op": "add", "terms": ["one"]})
+        self.assertTrue(reply["live"])
+
+    def test_ack_when_wrapped(self):
+        # Only the wrapping checker's check() is called
+        wrapper = PrioritizingTermChecker(self.checker, capacity=1)
+        stream = self.connected_stream(wrapper)
+        wrapper.attach(stream)
+
+        reply, = send(self.checker.address, {"op": "add", "terms": ["two"]})
+        self.assertTrue(reply["live"])
+        self.assertEqual(stream.start_stream.call_count, 1)
+
+    def test_ack_timeout(self):
+        self.checker.ack_timeout = 0.05
+        self.checker.attach(mock.Mock())
+
+        reply, = send(self.checker.address, {"op": "add", "terms": ["two"]})
+        self.assertTrue(reply["ok"])
+        self.assertFalse(reply["live"])
+
+    def test_earlier_change_live_keeps_waiting(self):
+        self.checker.apply('add', ["two"])
+        generation = self.checker.apply('add', ["three"])
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(self.checker.wait_until_live(generation, 5)))
+        waiter.start()
+
+        # Only the first change is live, so the waiter must not return yet
+        self.checker._mark_live(generation - 1)
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+
+        self.checker._mark_live(generation)
+        waiter.join(5)
+        self.assertEqual(results, [True])
+
+    def test_wakes_polling_loop(self):
+        stream = DynamicTwitterStream(mock.Mock(), mock.Mock(), self.checker)
+        stream.start_stream = mock.Mock(side_effect=lambda: stream.listener.on_connect())
+        stream.stop_stream = mock.Mock()
+        stream.listener.streaming_exception = None
+
+        # A long interval, so only waking can pick up the change in time
+        thread = threading.Thread(target=stream.start_polling, args=[60])
+        thread.start()
+        try:
+            reply, = send(self.checker.address, {"op": "add", "terms": ["two"]})
+            self.assertTrue(reply["live"])
+            self.assertEqual(sorted(self.checker.tracking_terms()), ["one", "two"])
+        finally:
+            stream.stop_polling()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+
+class TestUnixSocketTermChecker(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "terms.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unix_socket(self):
+        # A stale socket file is replaced
+        open(self.path, 'w').close()
+
+        checker = SocketTermChecker(self.path)
+        checker.start()
+        try:
+            reply, = send(self.path, {"op": "replace", "terms": ["a", "b"]})
+            self.assertEqual(reply["terms"], 2)
+            self.assertEqual(checker.update_tracking_terms(), set(["a", "b"]))
+        finally:
+            checker.close()
+
+        self.assertFalse(os.path.exists(self.path))
@@ -0,0 +1,106 @@
+from unittest import TestCase
+import logging
+
+from twitter_monitor.dedupe import simhash, hamming, SimHashIndex, NearDuplicateStage
+
+logger = logging.getLogger("twitter_monitor")
+
+SPAM = u"Win a free iPhone today, just click the link and enter your details to claim the prize now"
+
+
+def tweet(status_id, text):
+    return {'id': status_id, 'text': text}
+
+
+class TestSimHash(TestCase):
+    def test_stable(self):
+        self.assertEqual(simhash(SPAM), simhash(SPAM))
+        self.assertEqual(simhash(u""), 0)
+
+    def test_similar_texts_are_close(self):
+        variant = SPAM.replace(u"today", u"tonight")
+        other = u"The committee meeting has been moved to Thursday afternoon in room four"
+
+        self.assertLessEqual(hamming(simhash(SPAM), simhash(variant)), 12)
+        self.assertGreater(hamming(simhash(SPAM), simhash(other)), 12)
+
+    def test_ignores_links_and_case(self):
+        self.assertEqual(simhash(SPAM + u" http://t.co/abc"), simhash(SPAM.upper() + u" http://t.co/xyz"))
+
+
+class TestSimHashIndex(TestCase):
+    def test_query(self):
+        index = SimHashIndex(distance=3)
+        index.add(0b1111, 'a')
+
+        self.assertEqual(index.query(0b1111), (0, 'a'))
+        self.assertEqual(index.query(0b0001), (3, 'a'))
+        self.assertIsNone(index.query(0b0000))
+
+    def test_nearest_wins(self):
+        index = SimHashIndex(distance=3)
+        index.add(0b0111, 'a')
+        index.add(0b1111, 'b')
+
+        self.assertEqual(index.query(0b1111), (0, 'b'))
+
+    def test_bounded(self):
+        index = SimHashIndex(distance=3, capacity=2)
+        for band in range(3):
+            index.add(0xffff << (16 * band), band)
+
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.query(0xffff))
+        self.assertEqual(index.query(0xffff << 32), (0, 2))
+        stored = set(signature for table in index.tables for bucket in table.values() for signature in bucket)
+        self.assertEqual(stored, set(index.entries), "Evicted signatures are removed from their buckets")
+
+    def test_used_signatures_are_kept(self):
+        index = SimHashIndex(distance=3, capacity=2)
+        index.add(0xffff, 'a')
+        index.add(0xffff << 16, 'b')
+        index.query(0xfffe)
+        index.add(0xffff << 32, 'c')
+
+        self.assertEqual(index.query(0xffff), (0, 'a'))
+        self.assertIsNone(index.query(0xffff << 16))
+
+
+class TestNearDuplicateStage(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+    def test_clusters(self):
+        stage = NearDuplicateStage()
+
+        first = stage.process(tweet(1, SPAM + u" http://t.co/a"))
+        second = stage.process(tweet(2, SPAM + u" http://t.co/b"))
+        third = stage.process(tweet(3, u"Something else entirely, about the weather in Seattle today"))
+
+        self.assertEqual(first['cluster_id'], 1)
+        self.assertFalse(first['near_duplicate'])
+        self.assertEqual(second['cluster_id'], 1)
+        self.assertTrue(second['near_duplicate'])
+        self.assertEqual(third['cluster_id'], 3)
+        self.assertEqual((stage.seen, stage.duplicates), (3, 1))
+
+    def test_drop(self):
+        stage = NearDuplicateStage(drop=True)
+
+        self.assertIsNotNone(stage.process(tweet(1, SPAM)))
+        self.assertIsNone(stage.process(tweet(2, SPAM)))
+
+    def test_short_texts_are_kept(self):
+        stage = NearDuplicateStage(drop=True)
+
+        self.assertIsNotNone(stage.process(tweet(1, u"lol")))
+        self.assertIsNotNone(stage.process(tweet(2, u"lol")))
+        self.assertEqual(len(stage.index), 0)
+
+    def test_forgets_old_clusters(self):
+        stage = NearDuplicateStage(capacity=1)
+        stage.process(tweet(1, SPAM))
+        stage.process(tweet(2, u"Something else entirely, about the weather in Seattle today"))
+
+        self.assertFalse(stage.process(tweet(3, SPAM))['near_duplicate'])
+        self.assertEqual(len(stage.index), 1)
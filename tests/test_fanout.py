@@ -0,0 +1,216 @@
+from unittest import TestCase
+import threading
+import time
+import logging
+import json
+import mock
+
+from twitter_monitor.listener import JsonStreamListener
+from twitter_monitor.fanout import FanOutListener, SinkWorker, BLOCK, DROP_NEWEST, DROP_OLDEST
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class RecordingSink(JsonStreamListener):
+    def __init__(self, gate=None):
+        super(RecordingSink, self).__init__()
+        self.statuses = []
+        self.deletes = []
+        self.closed = False
+        self.gate = gate
+
+    def on_status(self, status):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.statuses.append(status['id'])
+        return True
+
+    def on_delete(self, status_id, user_id):
+        self.deletes.append(status_id)
+        return True
+
+    def close(self, timeout=None):
+        self.closed = True
+
+
+class TerminatingSink(RecordingSink):
+    """Like PrintingListener, returns False once told to terminate"""
+
+    def on_status(self, status):
+        super(TerminatingSink, self).on_status(status)
+        return not self.terminate
+
+
+class RawSink(RecordingSink):
+    def write_raw(self, raw):
+        self.statuses.append(raw)
+
+
+def tweet(status_id):
+    return {'id': status_id, 'in_reply_to_status_id': None, 'text': 'hello'}
+
+
+class TestSinkWorker(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.gate = threading.Event()
+        self.sink = RecordingSink(self.gate)
+
+    def tearDown(self):
+        self.gate.set()
+
+    def fill(self, worker):
+        # The first message is taken by the thread and waits at the gate
+        worker.put('on_status', tweet(0))
+        while worker.queue.qsize():
+            time.sleep(0.001)
+        for status_id in range(1, 5):
+            worker.put('on_status', tweet(status_id))
+
+    def test_drop_newest(self):
+        worker = SinkWorker(self.sink, queue_size=2, overflow=DROP_NEWEST)
+        self.fill(worker)
+        self.gate.set()
+        worker.close(5)
+
+        self.assertEqual(self.sink.statuses, [0, 1, 2])
+        self.assertEqual(worker.stats()['dropped'], 2)
+        self.assertTrue(self.sink.closed)
+
+    def test_drop_oldest(self):
+        worker = SinkWorker(self.sink, queue_size=2, overflow=DROP_OLDEST)
+        self.fill(worker)
+        self.gate.set()
+        worker.close(5)
+
+        self.assertEqual(self.sink.statuses, [0, 3, 4])
+        self.assertEqual(worker.stats()['dropped'], 2)
+
+    def test_block_with_timeout(self):
+        worker = SinkWorker(self.sink, queue_size=2, overflow=BLOCK, block_timeout=0.01)
+        self.fill(worker)
+        self.gate.set()
+        worker.close(5)
+
+        self.assertEqual(self.sink.statuses, [0, 1, 2])
+        self.assertEqual(worker.stats()['dropped'], 2)
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, SinkWorker, self.sink, overflow='explode')
+
+    def test_failures_are_counted(self):
+        self.sink.on_status = mock.Mock(side_effect=[IOError("disk full"), True])
+        self.gate.set()
+        worker = SinkWorker(self.sink)
+        worker.put('on_status', tweet(1))
+        worker.put('on_status', tweet(2))
+        worker.close(5)
+
+        stats = worker.stats()
+        self.assertEqual((stats['failed'], stats['delivered']), (1, 1))
+
+    def test_sink_that_stops(self):
+        self.sink.on_status = mock.Mock(return_value=False)
+        self.gate.set()
+        worker = SinkWorker(self.sink)
+        worker.put('on_status', tweet(1))
+        worker.put('on_status', tweet(2))
+        worker.close(5)
+
+        self.assertEqual(self.sink.on_status.call_count, 1)
+        self.assertTrue(worker.stats()['stopped'])
+        self.assertEqual(worker.stats()['dropped'], 1)
+
+    def test_lag(self):
+        clock = mock.Mock(side_effect=[10.0, 12.5])
+        self.gate.set()
+        worker = SinkWorker(self.sink, clock=clock)
+        worker.put('on_status', tweet(1))
+        worker.close(5)
+
+        self.assertEqual(worker.stats()['lag'], 2.5)
+        self.assertEqual(worker.stats()['max_lag'], 2.5)
+
+    def test_close_timeout(self):
+        worker = SinkWorker(self.sink)
+        worker.put('on_status', tweet(1))
+
+        self.assertFalse(worker.close(0.01))
+        self.assertFalse(self.sink.closed)
+
+
+class TestFanOutListener(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+    def test_every_sink_gets_every_message(self):
+        first = RecordingSink()
+        second = RecordingSink()
+        listener = FanOutListener([first, second])
+
+        self.assertTrue(listener.on_data(json.dumps(tweet(1))))
+        self.assertTrue(listener.on_data(json.dumps({'delete': {'status': {'id': 1, 'user_id': 2}}})))
+        listener.close(5)
+
+        for sink in (first, second):
+            self.assertEqual(sink.statuses, [1])
+            self.assertEqual(sink.deletes, [1])
+            self.assertTrue(sink.closed)
+
+    def test_slow_sink_does_not_hold_up_others(self):
+        gate = threading.Event()
+        slow = RecordingSink(gate)
+        fast = RecordingSink()
+        listener = FanOutListener()
+        listener.add_sink(slow, name='slow', queue_size=1)
+        listener.add_sink(fast, name='fast')
+
+        for status_id in range(10):
+            listener.on_status(tweet(status_id))
+        listener.workers[1].close(5)
+        self.assertEqual(fast.statuses, list(range(10)))
+
+        gate.set()
+        listener.close(5)
+        stats = listener.stats()
+        self.assertEqual(stats['fast']['delivered'], 10)
+        self.assertGreater(stats['slow']['dropped'], 0)
+        self.assertEqual(stats['slow']['delivered'] + stats['slow']['dropped'], 10)
+
+    def test_write_raw(self):
+        raw_sink = RawSink()
+        sink = RecordingSink()
+        listener = FanOutListener([raw_sink, sink])
+
+        raw = json.dumps(tweet(7))
+        listener.write_raw(raw)
+        listener.close(5)
+
+        self.assertEqual(raw_sink.statuses, [raw])
+        self.assertEqual(sink.statuses, [7])
+
+    def test_set_terminate(self):
+        sink = RecordingSink()
+        listener = FanOutListener([sink])
+        listener.set_terminate()
+
+        self.assertFalse(sink.terminate, "Not until the sink has drained")
+        self.assertFalse(listener.on_status(tweet(1)))
+        listener.close(5)
+        self.assertTrue(sink.terminate)
+
+    def test_drains_on_shutdown(self):
+        gate = threading.Event()
+        sink = TerminatingSink(gate)
+        listener = FanOutListener([sink])
+        for status_id in range(50):
+            listener.on_status(tweet(status_id))
+
+        listener.set_terminate()
+        gate.set()
+        listener.close(5)
+
+        self.assertEqual(sink.statuses, list(range(50)))
+        stats = listener.stats()[listener.workers[0].name]
+        self.assertEqual((stats['delivered'], stats['dropped']), (50, 0))
+        self.assertFalse(stats['stopped'])
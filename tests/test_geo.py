@@ -0,0 +1,115 @@
+from unittest import TestCase
+import logging
+import random
+
+from twitter_monitor.geo import BoundingBoxIndex, LocationAttributionStage, status_location
+from tests.helpers import ListChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+SAN_FRANCISCO = (-122.75, 36.8, -121.75, 37.8)
+NEW_YORK = (-74.0, 40.0, -73.0, 41.0)
+USA = (-125.0, 24.0, -66.0, 50.0)
+
+
+def point_status(lon, lat):
+    return {"id": 1, "coordinates": {"type": "Point", "coordinates": [lon, lat]}}
+
+
+def place_status(sw_lon, sw_lat, ne_lon, ne_lat):
+    return {"id": 1, "coordinates": None, "place": {"bounding_box": {
+        "type": "Polygon",
+        "coordinates": [[[sw_lon, sw_lat], [sw_lon, ne_lat], [ne_lon, ne_lat], [ne_lon, sw_lat]]]}}}
+
+
+class TestBoundingBoxIndex(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.index = BoundingBoxIndex([SAN_FRANCISCO, NEW_YORK], cell_size=0.5)
+
+    def test_match_point(self):
+        self.assertEqual(self.index.match_point(-122.4, 37.7), [SAN_FRANCISCO])
+        self.assertEqual(self.index.match_point(-73.9, 40.7), [NEW_YORK])
+        self.assertEqual(self.index.match_point(0, 0), [])
+
+    def test_edges_match(self):
+        self.assertEqual(self.index.match_point(-121.75, 37.8), [SAN_FRANCISCO])
+
+    def test_match_box(self):
+        self.assertEqual(self.index.match_box(-122.0, 37.5, -121.0, 38.5), [SAN_FRANCISCO])
+        self.assertEqual(self.index.match_box(-121.0, 37.5, -120.0, 38.5), [])
+
+    def test_large_boxes(self):
+        index = BoundingBoxIndex([SAN_FRANCISCO, USA], cell_size=0.1, max_cells=200)
+        self.assertEqual(index.large, [1])
+        self.assertEqual(index.match_point(-122.4, 37.7), [SAN_FRANCISCO, USA])
+        self.assertEqual(index.match_box(-100, 30, -99, 31), [USA])
+        self.assertEqual(index.match_box(-180, -90, 180, 90), [SAN_FRANCISCO, USA])
+
+    def test_agrees_with_brute_force(self):
+        rng = random.Random(7)
+        boxes = []
+        for i in range(500):
+            lon, lat = rng.uniform(-180, 170), rng.uniform(-90, 80)
+            boxes.append((lon, lat, lon + rng.uniform(0, 10), lat + rng.uniform(0, 10)))
+        index = BoundingBoxIndex(boxes)
+
+        for i in range(200):
+            lon, lat = rng.uniform(-180, 180), rng.uniform(-90, 90)
+            expected = [box for box in boxes if box[0] <= lon <= box[2] and box[1] <= lat <= box[3]]
+            self.assertEqual(sorted(index.match_point(lon, lat)), sorted(expected))
+
+    def test_match_status(self):
+        self.assertEqual(self.index.match(point_status(-122.4, 37.7)), [SAN_FRANCISCO])
+        self.assertEqual(self.index.match(place_status(-74.5, 40.5, -73.5, 41.5)), [NEW_YORK])
+        self.assertEqual(self.index.match({"id": 1}), [])
+
+    def test_status_location(self):
+        self.assertEqual(status_location(point_status(1, 2)), ('point', (1, 2)))
+        self.assertEqual(status_location(place_status(1, 2, 3, 4)), ('box', (1, 2, 3, 4)))
+        self.assertEqual(status_location({"coordinates": None, "place": None}), None)
+
+
+class TestLocationAttributionStage(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.boxes = [SAN_FRANCISCO]
+        self.checker = ListChecker(self.boxes)
+        self.checker.check()
+
+    def test_attributes_statuses(self):
+        stage = LocationAttributionStage(self.checker)
+        status = stage.process(point_status(-122.4, 37.7))
+        self.assertEqual(status["matched_locations"], [SAN_FRANCISCO])
+
+        # Follows changes to the tracked boxes
+        self.boxes.append(NEW_YORK)
+        self.checker.check()
+        status = stage.process(point_status(-73.9, 40.7))
+        self.assertEqual(status["matched_locations"], [NEW_YORK])
+
+    def test_drop_unmatched(self):
+        stage = LocationAttributionStage(self.checker, drop_unmatched=True)
+        self.assertEqual(stage.process(point_status(0, 0)), None)
+
+        status = point_status(0, 0)
+        status["matched_terms"] = ["hello"]
+        self.assertEqual(stage.process(status), status)
+
+    def test_keeps_followed_users(self):
+        following = ListChecker(["12", "34"])
+        following.check()
+        stage = LocationAttributionStage(self.checker, drop_unmatched=True, follow_checker=following)
+
+        status = point_status(0, 0)
+        status["user"] = {"id": 12}
+        self.assertEqual(stage.process(status), status)
+
+        status = point_status(0, 0)
+        status["user"] = {"id": 5}
+        status["in_reply_to_user_id"] = 34
+        self.assertEqual(stage.process(status), status)
+
+        status = point_status(0, 0)
+        status["user"] = {"id": 5}
+        self.assertEqual(stage.process(status), None)
@@ -28,6 +28,14 @@ class TestJsonStreamListener(TestCase):
         fake_status = dict(id=12345652)
         self.assertTrue(self.listener.on_status(fake_status))
 
+    def test_set_terminate(self):
+        self.assertTrue(self.listener.on_data('{"limit": {"track": 3}}'))
+
+        self.listener.set_terminate()
+
+        # Refuses new data once terminating
+        self.assertFalse(self.listener.on_data('{"limit": {"track": 3}}'))
+
 
 class TestStreamListenerHandling(TestCase):
     def setUp(self):
@@ -0,0 +1,54 @@
+from unittest import TestCase
+import logging
+
+from twitter_monitor.matching import TermMatcher, status_tokens
+from tests.helpers import ListChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class TestTermMatcher(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.status = {
+            "id": 1,
+            "text": "Watching the #WorldCup final with @friend",
+            "user": {"screen_name": "soccer_fan"},
+            "entities": {"urls": [{"expanded_url": "http://example.com/goal"}]},
+        }
+
+    def test_status_tokens(self):
+        tokens = status_tokens(self.status)
+        for token in ["watching", "#worldcup", "worldcup", "@friend", "friend", "soccer_fan", "goal"]:
+            self.assertTrue(token in tokens, "Found %s" % token)
+
+    def test_single_words(self):
+        matcher = TermMatcher(terms=["final", "worldcup", "#WorldCup", "tennis"])
+        self.assertEqual(matcher.match(self.status), ["#WorldCup", "final", "worldcup"])
+
+    def test_phrases_need_all_words(self):
+        matcher = TermMatcher(terms=["final watching", "final tennis"])
+        self.assertEqual(matcher.match(self.status), ["final watching"])
+
+    def test_hashtag_terms_need_hashtags(self):
+        matcher = TermMatcher(terms=["#final"])
+        self.assertEqual(matcher.match(self.status), [])
+
+    def test_retweeted_text(self):
+        retweet = {"id": 2, "text": "RT @soccer_fan: Watching the...",
+                   "retweeted_status": self.status}
+        matcher = TermMatcher(terms=["final"])
+        self.assertEqual(matcher.match(retweet), ["final"])
+
+    def test_follows_checker(self):
+        terms = ["tennis"]
+        checker = ListChecker(terms)
+        checker.check()
+
+        matcher = TermMatcher(checker)
+        self.assertEqual(matcher.match(self.status), [])
+
+        terms.append("final")
+        checker.check()
+        self.assertEqual(matcher.match(self.status), ["final"])
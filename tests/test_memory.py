@@ -0,0 +1,101 @@
+from unittest import TestCase
+import tracemalloc
+import time
+import logging
+import mock
+
+from twitter_monitor.memory import rss_bytes, object_counts, MemoryMonitor
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class Leaky(object):
+    pass
+
+
+def allocate():
+    return [bytearray(1000) for _ in range(1000)]
+
+
+ALLOCATING_LINE = allocate.__code__.co_firstlineno + 1
+
+
+class TestMemoryFunctions(TestCase):
+    def test_rss(self):
+        self.assertGreater(rss_bytes(), 0)
+
+    def test_object_counts(self):
+        leaks = [Leaky() for _ in range(5000)]
+        self.assertIn('Leaky', dict(object_counts(limit=50)))
+        self.assertEqual(dict(object_counts(limit=1000))['Leaky'], len(leaks))
+
+
+class TestMemoryMonitor(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.monitor = MemoryMonitor(interval=3600, top=5)
+
+    def tearDown(self):
+        self.monitor.stop()
+
+    def test_reports_growth(self):
+        self.monitor.start()
+        self.assertTrue(tracemalloc.is_tracing())
+
+        leaks = [bytearray(1000) for _ in range(1000)]
+        metrics = self.monitor.check()
+
+        self.assertTrue(any(stat.traceback[0].filename == __file__ and stat.size_diff >= 1000000
+                            for stat in self.monitor.growth))
+        self.assertEqual(metrics['checks'], 1)
+        self.assertGreater(metrics['rss'], 0)
+        self.assertGreaterEqual(metrics['traced'], 1000000)
+        self.assertIn('objects', metrics)
+        del leaks
+
+    def test_logs_allocation_and_metrics(self):
+        monitor = MemoryMonitor(interval=3600, top=5, frames=5)
+        monitor.start()
+        try:
+            leaks = allocate()
+            with mock.patch('twitter_monitor.memory.logger') as memory_logger:
+                monitor.check()
+        finally:
+            monitor.stop()
+
+        # The allocating line, not the oldest frame, comes first
+        stat = max(monitor.growth, key=lambda stat: stat.size_diff)
+        self.assertEqual(stat.traceback[-1].lineno, ALLOCATING_LINE)
+
+        logged = [call[0][0] % call[0][1:] for call in memory_logger.info.call_args_list]
+        self.assertTrue(any(':%d: +' % ALLOCATING_LINE in line for line in logged))
+        self.assertTrue(any(line.startswith('Memory: RSS') for line in logged))
+        self.assertTrue(any(line.startswith('Most common objects:') for line in logged))
+        del leaks
+
+    def test_stops_tracing_it_started(self):
+        self.monitor.start()
+        self.monitor.stop()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_leaves_existing_tracing_alone(self):
+        tracemalloc.start()
+        try:
+            self.monitor.start()
+            self.monitor.stop()
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+    def test_object_counts_can_be_turned_off(self):
+        monitor = MemoryMonitor(count_objects=False)
+        monitor.update_metrics()
+        self.assertNotIn('objects', monitor.metrics())
+
+    def test_checks_periodically(self):
+        monitor = MemoryMonitor(interval=0.01)
+        with mock.patch.object(monitor, 'check') as check:
+            monitor.start()
+            while not check.called:
+                time.sleep(0.001)
+            monitor.stop()
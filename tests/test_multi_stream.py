@@ -0,0 +1,168 @@
+from unittest import TestCase
+import logging
+import json
+import mock
+
+from twitter_monitor.multi_stream import MultiStreamManager
+from twitter_monitor.control import SocketTermChecker
+from tests.helpers import RecordingListener, StaticTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def status(status_id):
+    return json.dumps({'id': status_id, 'text': 'hi', 'in_reply_to_status_id': None})
+
+
+class TestMultiStreamManager(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.stream_patcher = mock.patch('tweepy.Stream')
+        self.MockTweepyStream = self.stream_patcher.start()
+        self.MockTweepyStream.side_effect = lambda *args, **kwargs: mock.Mock(running=True)
+
+        self.auths = [mock.Mock(), mock.Mock(), mock.Mock()]
+        self.listener = RecordingListener()
+        self.checker = StaticTermChecker(["term%d" % i for i in range(5)])
+
+        self.manager = MultiStreamManager(self.auths, self.listener, self.checker, capacity=2)
+
+    def tearDown(self):
+        self.stream_patcher.stop()
+
+    def test_requires_auth(self):
+        self.assertRaises(ValueError, MultiStreamManager, [], self.listener, self.checker)
+
+    def test_assigns_terms(self):
+        self.manager.update()
+
+        sizes = [len(self.manager.shard_terms(shard)) for shard in range(3)]
+        self.assertEqual(sorted(sizes), [1, 2, 2])
+
+        # Each connection streams with its own auth and terms
+        self.assertEqual(self.MockTweepyStream.call_count, 3)
+        for connection in self.manager.connections:
+            stream = connection.stream
+            self.assertTrue(stream.auth in self.auths)
+            track = stream.stream.filter.call_args[1]['track']
+            self.assertEqual(set(track), self.manager.shard_terms(connection.shard))
+
+    def test_sticky_assignment(self):
+        self.manager.update()
+        before = dict(self.manager.assignments)
+
+        self.checker.terms.discard("term0")
+        self.manager.update()
+
+        for term, shard in self.manager.assignments.items():
+            self.assertEqual(before[term], shard)
+
+        # Only the connection that lost a term restarted
+        self.assertEqual(self.MockTweepyStream.call_count, 4)
+
+    def test_over_capacity(self):
+        self.checker.terms.update(["extra%d" % i for i in range(3)])
+        self.manager.update()
+
+        self.assertEqual(len(self.manager.assignments), 6)
+        self.assertEqual(len(self.manager.unassigned), 2)
+
+    def test_failover_when_rate_limited(self):
+        self.checker.terms = set(["a", "b", "c"])
+        self.manager.update()
+
+        connection = self.manager.connections[0]
+        moved = self.manager.shard_terms(0)
+        self.assertTrue(moved)
+
+        # Twitter rate limits the connection, which stops streaming
+        connection.listener.on_error(420)
+        connection.stream.stream.running = False
+
+        with mock.patch('twitter_monitor.multi_stream.time', return_value=1000.0):
+            self.manager.update()
+
+        self.assertEqual(self.manager.shard_terms(0), set())
+        self.assertEqual(set(self.manager.assignments), set(["a", "b", "c"]))
+        self.assertEqual(connection.limited_until, 1060.0)
+        self.assertEqual(connection.backoff, 120)
+        self.assertIsNone(connection.stream.stream, "Nothing left to stream")
+
+        # After the backoff, it can take new terms again
+        with mock.patch('twitter_monitor.multi_stream.time', return_value=1061.0):
+            self.manager.update()
+        self.assertTrue(connection.available(1061.0))
+
+    def test_backoff_starts_over_once_stable(self):
+        connection = self.manager.connections[0]
+        connection.listener.on_error(420)
+        self.manager.check_connections(now=1000.0)
+        self.manager.check_connections(now=1060.0)
+        self.assertEqual(connection.backoff, 120)
+
+        connection.stream.stream = mock.Mock(running=True)
+        self.manager.check_connections(now=1119.0)
+        self.assertEqual(connection.backoff, 120, "Not streaming for long enough yet")
+
+        self.manager.check_connections(now=1120.0)
+        self.assertEqual(connection.backoff, 60)
+
+    def test_shared_listener_dedupes(self):
+        first, second = [connection.listener for connection in self.manager.connections[:2]]
+
+        first.on_data(status(1))
+        second.on_data(status(1))
+        second.on_data(status(2))
+        first.on_data(json.dumps({'limit': {'track': 5}}))
+
+        self.assertEqual(self.listener.statuses, [1, 2])
+        self.assertEqual(self.listener.limits, [5])
+        self.assertEqual(second.duplicates, 1)
+
+        stats = self.manager.stats()
+        self.assertEqual([s['received'] for s in stats], [1, 2, 0])
+        self.assertEqual(stats[0]['limited'], 5)
+
+    def test_errors_are_per_connection(self):
+        first, second = [connection.listener for connection in self.manager.connections[:2]]
+        first.on_error(500)
+
+        self.assertEqual(first.error, 500)
+        self.assertFalse(second.error)
+        self.assertFalse(self.listener.error)
+
+    def test_shutdown(self):
+        self.listener.close = mock.Mock()
+        self.manager.update()
+        streams = [connection.stream.stream for connection in self.manager.connections]
+
+        self.manager.shutdown(timeout=5)
+
+        for stream in streams:
+            stream.disconnect.assert_called_once_with()
+        self.assertTrue(self.listener.terminate)
+        self.assertTrue(all(c.listener.terminate for c in self.manager.connections))
+        self.assertEqual(self.listener.close.call_count, 1)
+
+    def test_ack_once_restarted_connections_connect(self):
+        checker = SocketTermChecker(('127.0.0.1', 0), terms=["term0", "term1"], ack_timeout=0.1)
+        self.addCleanup(checker.close)
+        manager = MultiStreamManager(self.auths[:2], self.listener, checker, capacity=2)
+        manager.wake = manager.update
+        checker.attach(manager)
+
+        manager.update()
+        for connection in manager.connections:
+            connection.listener.on_connect()
+        self.assertEqual(checker.handle_command({"op": "add", "terms": ["term0"]})["live"], True)
+
+        # The connection given the new term has not connected yet
+        reply = checker.handle_command({"op": "add", "terms": ["term2"]})
+        self.assertFalse(reply["live"])
+        restarted = [c for c in manager.connections if not c.stream.connected]
+        self.assertEqual(len(restarted), 1)
+
+        # Once it has, the change is live
+        restarted[0].listener.on_connect()
+        self.assertTrue(checker.wait_until_live(reply["version"], 0))
@@ -0,0 +1,159 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import logging
+import json
+import os
+import mock
+
+from twitter_monitor.ndjson_index import NdjsonIndex
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def tweet_line(tweet_id):
+    return json.dumps({"id": tweet_id, "text": "tweet %d" % tweet_id, "user": {"id": 1}}) + "\n"
+
+
+class TestNdjsonIndex(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.dir, "tweets.idx")
+        self.capture = os.path.join(self.dir, "capture1.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, path, ids, mode='a', extra=''):
+        with open(path, mode) as outfile:
+            for tweet_id in ids:
+                outfile.write(tweet_line(tweet_id))
+            outfile.write(extra)
+
+    def test_lookup(self):
+        self.write(self.capture, [30, 10, 20])
+
+        index = NdjsonIndex(self.index_path)
+        self.assertEqual(index.update([self.capture]), 3)
+
+        path, offset, length = index.lookup(10)
+        self.assertEqual(path, os.path.abspath(self.capture))
+        self.assertEqual(offset, len(tweet_line(30)))
+        self.assertEqual(json.loads(index.read(20).decode('utf-8'))["id"], 20)
+        self.assertEqual(index.lookup(15), None)
+        self.assertEqual(index.read(15), None)
+        index.close()
+
+    def test_skips_non_statuses(self):
+        self.write(self.capture, [1], extra='{"delete": {"status": {"id": 5}}}\nnot json\n')
+
+        index = NdjsonIndex(self.index_path)
+        self.assertEqual(index.update([self.capture]), 1)
+        index.close()
+
+    def test_range(self):
+        other = os.path.join(self.dir, "capture2.json")
+        self.write(self.capture, [1, 5, 9])
+        self.write(other, [2, 6])
+
+        index = NdjsonIndex(self.index_path)
+        index.update([self.capture, other])
+
+        found = [(tweet_id, os.path.basename(path)) for tweet_id, path, offset, length in index.range(2, 7)]
+        self.assertEqual(found, [(2, "capture2.json"), (5, "capture1.json"), (6, "capture2.json")])
+        index.close()
+
+    def test_incremental_update(self):
+        # The last line is still being written
+        self.write(self.capture, [1, 2], extra='{"id": 3, "te')
+
+        index = NdjsonIndex(self.index_path)
+        self.assertEqual(index.update([self.capture]), 2)
+        index.close()
+
+        with open(self.capture, 'a') as outfile:
+            outfile.write('xt": "tweet 3"}\n')
+        self.write(self.capture, [4])
+
+        # A new index object picks up where the last left off
+        index = NdjsonIndex(self.index_path)
+        self.assertEqual(index.update([self.capture]), 2)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(json.loads(index.read(3).decode('utf-8'))["id"], 3)
+        self.assertEqual(index.update([self.capture]), 0)
+        index.close()
+
+    def test_reindexes_shrunken_files(self):
+        self.write(self.capture, [1, 2, 3])
+        index = NdjsonIndex(self.index_path)
+        index.update([self.capture])
+
+        self.write(self.capture, [7], mode='w')
+        index.update([self.capture])
+
+        self.assertEqual([tweet_id for tweet_id, path, offset, length in index.range(0, 100)], [7])
+        index.close()
+
+    def test_spills_sorted_runs(self):
+        self.write(self.capture, [9, 3, 7, 1, 8, 2, 6])
+
+        index = NdjsonIndex(self.index_path)
+        index.RUN_SIZE = 2
+        self.assertEqual(index.update([self.capture]), 7)
+
+        self.assertEqual([tweet_id for tweet_id, path, offset, length in index.range(0, 100)],
+                         [1, 2, 3, 6, 7, 8, 9])
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ["capture1.json", "tweets.idx.1", "tweets.idx.manifest"])
+        index.close()
+
+    def test_updates_merge_few_runs(self):
+        index = NdjsonIndex(self.index_path)
+        for tweet_id in range(1, 9):
+            self.write(self.capture, [tweet_id])
+            self.assertEqual(index.update([self.capture]), 1)
+
+        # Runs are only merged with those no bigger, like a binary counter
+        self.assertEqual([len(run) for run in index.runs], [8])
+        self.write(self.capture, [9, 10, 11])
+        index.update([self.capture])
+        self.assertEqual([len(run) for run in index.runs], [8, 3])
+        index.close()
+
+        index = NdjsonIndex(self.index_path)
+        self.assertEqual(len(index), 11)
+        self.assertEqual([tweet_id for tweet_id, path, offset, length in index.range(0, 100)], list(range(1, 12)))
+        # Merged runs have been removed
+        self.assertEqual(set(os.listdir(self.dir)) - set(["capture1.json", "tweets.idx.manifest"]),
+                         set(os.path.basename(run.path) for run in index.runs))
+        index.close()
+
+    def test_crash_before_manifest(self):
+        self.write(self.capture, [1, 2])
+        index = NdjsonIndex(self.index_path)
+        index.update([self.capture])
+        index.close()
+
+        self.write(self.capture, [3])
+        index = NdjsonIndex(self.index_path)
+        with mock.patch.object(index, '_save_manifest', side_effect=IOError("crash")):
+            self.assertRaises(IOError, index.update, [self.capture])
+
+        # The old manifest and runs still agree, and the update can be redone
+        index = NdjsonIndex(self.index_path)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.update([self.capture]), 1)
+        self.assertEqual(json.loads(index.read(3).decode('utf-8'))["id"], 3)
+        index.close()
+
+    def test_rejects_mismatched_run(self):
+        self.write(self.capture, [1, 2])
+        index = NdjsonIndex(self.index_path)
+        index.update([self.capture])
+        index.close()
+
+        with open(self.index_path + ".1", 'ab') as outfile:
+            outfile.write(b'\0' * 4)
+        self.assertRaises(ValueError, NdjsonIndex, self.index_path)
@@ -0,0 +1,138 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import logging
+import json
+import os
+import mock
+
+from twitter_monitor.output import DurableFileWriter, atomic_write
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def tweet_line(tweet_id):
+    return json.dumps({"id": tweet_id, "text": "hello"}) + "\n"
+
+
+class TestDurableFileWriter(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "tweets.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_checkpoint(self):
+        with open(self.filename + DurableFileWriter.CHECKPOINT_SUFFIX) as infile:
+            return json.load(infile)
+
+    def test_commits_in_groups(self):
+        writer = DurableFileWriter(self.filename, commit_every=3, commit_interval=1000)
+
+        with mock.patch('os.fsync') as fsync:
+            writer.write(tweet_line(1))
+            writer.write(tweet_line(2))
+            self.assertEqual(fsync.call_count, 0, "No sync before the group is full")
+
+            writer.write(tweet_line(3))
+            self.assertTrue(fsync.called, "Synced once the group is full")
+
+        checkpoint = self.read_checkpoint()
+        self.assertEqual(checkpoint['offset'], os.path.getsize(self.filename))
+        self.assertEqual(checkpoint['id'], 3)
+
+    def test_commits_after_interval(self):
+        writer = DurableFileWriter(self.filename, commit_every=1000, commit_interval=0)
+
+        writer.write(tweet_line(7))
+        self.assertEqual(self.read_checkpoint()['id'], 7)
+
+    def test_flush_commits(self):
+        writer = DurableFileWriter(self.filename, commit_every=1000, commit_interval=1000)
+
+        writer.write(tweet_line(1))
+        writer.write(tweet_line(2))
+        writer.flush()
+
+        self.assertEqual(writer.pending, 0)
+        self.assertEqual(self.read_checkpoint()['id'], 2)
+
+    def test_flush_without_writes(self):
+        writer = DurableFileWriter(self.filename, commit_every=1000, commit_interval=1000)
+        writer.write(tweet_line(1))
+        writer.flush()
+
+        with mock.patch('os.fsync') as fsync:
+            writer.flush()
+        self.assertFalse(fsync.called)
+
+    def test_truncates_torn_line(self):
+        writer = DurableFileWriter(self.filename, commit_every=1, commit_interval=1000)
+        writer.write(tweet_line(1))
+        writer.write(tweet_line(2))
+        writer.file.close()
+
+        # Simulate a crash part way through a line
+        with open(self.filename, 'ab') as outfile:
+            outfile.write(b'{"id": 3, "te')
+
+        writer = DurableFileWriter(self.filename, commit_every=1, commit_interval=1000)
+        writer.write(tweet_line(4))
+        writer.close()
+
+        with open(self.filename) as infile:
+            ids = [json.loads(line)['id'] for line in infile]
+        self.assertEqual(ids, [1, 2, 4])
+
+    def test_keeps_complete_uncommitted_lines(self):
+        writer = DurableFileWriter(self.filename, commit_every=1000, commit_interval=1000)
+        writer.write(tweet_line(1))
+        writer.flush()
+        writer.write(tweet_line(2))
+        writer.file.close()
+
+        writer = DurableFileWriter(self.filename)
+        self.assertEqual(writer.committed_id, 1)
+        self.assertEqual(writer.offset, len(tweet_line(1)) * 2)
+
+    def test_torn_line_without_newline(self):
+        with open(self.filename, 'wb') as outfile:
+            outfile.write(b'{"id": 1')
+
+        writer = DurableFileWriter(self.filename)
+        self.assertEqual(writer.offset, 0)
+        self.assertEqual(os.path.getsize(self.filename), 0)
+
+
+class TestAtomicWrite(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replaces_file(self):
+        atomic_write(self.path, u"old")
+        with mock.patch('os.fsync') as fsync:
+            atomic_write(self.path, [b"new ", u"data"])
+            self.assertEqual(fsync.call_count, 1)
+
+        with open(self.path, 'rb') as infile:
+            self.assertEqual(infile.read(), b"new data")
+        self.assertEqual(os.listdir(self.dir), ["state.json"])
+
+    def test_failure_leaves_file(self):
+        atomic_write(self.path, b"old")
+
+        def chunks():
+            yield b"new"
+            raise IOError("disk full")
+        self.assertRaises(IOError, atomic_write, self.path, chunks())
+
+        with open(self.path, 'rb') as infile:
+            self.assertEqual(infile.read(), b"old")
+        self.assertEqual(os.listdir(self.dir), ["state.json"])
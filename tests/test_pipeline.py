@@ -0,0 +1,98 @@
+from unittest import TestCase
+import logging
+import json
+import mock
+
+from twitter_monitor.pipeline import Stage, AttributionStage, PipelineListener
+from tests.helpers import StaticTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class DropOdd(Stage):
+    def process(self, status):
+        if status['id'] % 2:
+            return None
+        return status
+
+
+class HoldPairs(Stage):
+    """Holds statuses back and passes them on in pairs"""
+
+    def __init__(self):
+        self.held = []
+
+    def process(self, status):
+        self.held.append(status)
+        if len(self.held) < 2:
+            return None
+        held, self.held = self.held, []
+        return held
+
+    def flush(self):
+        held, self.held = self.held, []
+        return held
+
+
+class TestPipelineListener(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.sink = mock.Mock()
+        self.sink.on_status.return_value = True
+
+    def status(self, status_id, text="hello there"):
+        return json.dumps({"id": status_id, "in_reply_to_status_id": None, "text": text})
+
+    def test_stages_run_in_order(self):
+        listener = PipelineListener([DropOdd()], sink=self.sink)
+
+        self.assertTrue(listener.on_data(self.status(1)))
+        self.assertTrue(listener.on_data(self.status(2)))
+
+        self.assertEqual(self.sink.on_status.call_count, 1)
+        self.assertEqual(self.sink.on_status.call_args[0][0]['id'], 2)
+
+    def test_stages_can_pass_on_several_statuses(self):
+        listener = PipelineListener([HoldPairs(), DropOdd()], sink=self.sink)
+
+        for status_id in range(5):
+            listener.on_data(self.status(status_id))
+        self.assertEqual([call[0][0]['id'] for call in self.sink.on_status.call_args_list], [0, 2])
+
+        listener.close()
+        self.assertEqual([call[0][0]['id'] for call in self.sink.on_status.call_args_list], [0, 2, 4])
+
+    def test_attribution(self):
+        checker = StaticTermChecker(["hello", "world"])
+        checker.check()
+        listener = PipelineListener([AttributionStage(checker)], sink=self.sink)
+
+        listener.on_data(self.status(2, text="Hello World"))
+        self.assertEqual(self.sink.on_status.call_args[0][0]['matched_terms'], ["hello", "world"])
+
+    def test_sink_can_stop_stream(self):
+        self.sink.on_status.return_value = False
+        listener = PipelineListener([], sink=self.sink)
+        self.assertFalse(listener.on_data(self.status(2)))
+
+    def test_forwards_other_messages(self):
+        stage = mock.Mock()
+        listener = PipelineListener([stage], sink=self.sink)
+
+        listener.on_data('{"limit": {"track": 5}}')
+        listener.on_data('{"delete": {"status": {"id": 3, "user_id": 4}}}')
+
+        stage.on_limit.assert_called_once_with(5)
+        self.sink.on_limit.assert_called_once_with(5)
+        self.sink.on_delete.assert_called_once_with(3, 4)
+
+    def test_shutdown(self):
+        stage = mock.Mock()
+        listener = PipelineListener([stage], sink=self.sink)
+
+        listener.set_terminate()
+        listener.close(timeout=3)
+
+        self.sink.set_terminate.assert_called_once_with()
+        stage.close.assert_called_once_with(3)
+        self.sink.close.assert_called_once_with(3)
@@ -0,0 +1,170 @@
+from unittest import TestCase
+import tempfile
+import threading
+import logging
+import shutil
+import signal
+import pstats
+import json
+import time
+import os
+import mock
+
+from twitter_monitor import DynamicTwitterStream, JsonStreamListener, TermChecker
+from twitter_monitor.profiling import HookTimer, SamplingProfiler, Profiler, set_profile_listener
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class SequenceClock(object):
+    def __init__(self, *times):
+        self.times = list(times)
+
+    def __call__(self):
+        return self.times.pop(0)
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+class TestHookTimer(TestCase):
+    def test_wrap(self):
+        timer = HookTimer(clock=SequenceClock(0.0, 0.5, 1.0, 3.0))
+        function = timer.wrap('on_status', lambda value: value * 2)
+
+        self.assertEqual(function(2), 4)
+        self.assertEqual(function(3), 6)
+        self.assertEqual(timer.stats['on_status'], [2, 2.5, 2.0])
+
+    def test_failures_are_timed(self):
+        timer = HookTimer(clock=SequenceClock(0.0, 1.0))
+        function = timer.wrap('on_status', mock.Mock(side_effect=ValueError))
+
+        self.assertRaises(ValueError, function)
+        self.assertEqual(timer.stats['on_status'][0], 1)
+
+    def test_report_is_sorted(self):
+        timer = HookTimer()
+        timer.record('on_delete', 0.1)
+        timer.record('on_status', 2.0)
+
+        lines = timer.report().splitlines()
+        self.assertTrue(lines[1].startswith('on_status'))
+        self.assertTrue(lines[2].startswith('on_delete'))
+
+
+class TestSamplingProfiler(TestCase):
+    def test_samples_other_threads(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_loop, args=(stop,), name='busy')
+        thread.start()
+        try:
+            sampler = SamplingProfiler()
+            for _ in range(5):
+                sampler.sample()
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertEqual(sampler.samples, 5)
+        self.assertIn('busy_loop', sampler.report())
+        self.assertTrue(any(line.startswith('busy;') for line in sampler.folded().splitlines()))
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.dir = tempfile.mkdtemp()
+
+        self.listener = JsonStreamListener()
+        self.checker = mock.Mock(spec=TermChecker)
+        self.checker.check.return_value = False
+        self.stream = DynamicTwitterStream(mock.Mock(), self.listener, self.checker)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, Profiler, self.dir, mode='guess')
+
+    def test_times_hooks(self):
+        profiler = Profiler(self.dir)
+        profiler.attach(self.stream)
+
+        self.stream.update_stream()
+        self.listener.on_data(json.dumps({'id': 1, 'in_reply_to_status_id': None}))
+        self.listener.on_data(json.dumps({'delete': {'status': {'id': 1, 'user_id': 2}}}))
+
+        stats = profiler.timer.stats
+        for name in ('update_stream', 'check:TermChecker', 'on_data', 'on_status', 'on_delete'):
+            self.assertIn(name, stats)
+        self.assertEqual(stats['on_data'][0], 2)
+
+        path = profiler.dump_timings()
+        with open(path) as report:
+            self.assertIn('on_status', report.read())
+
+    def test_cprofile(self):
+        profiler = Profiler(self.dir, mode='cprofile')
+        profiler.attach(self.stream)
+
+        self.assertEqual(profiler.toggle(), [])
+        self.listener.on_data(json.dumps({'id': 1, 'in_reply_to_status_id': None}))
+        paths = profiler.toggle()
+
+        prof = [path for path in paths if path.endswith('.prof')][0]
+        functions = [function[2] for function in pstats.Stats(prof).stats]
+        self.assertIn('on_status', functions)
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+
+    def test_sampling(self):
+        profiler = Profiler(self.dir, interval=0.001)
+        profiler.start()
+        time.sleep(0.05)
+        paths = profiler.stop()
+
+        self.assertEqual(sorted(os.path.splitext(path)[1] for path in paths), ['.folded', '.txt', '.txt'])
+        self.assertFalse(profiler.running)
+        self.assertEqual(profiler.stop(), [])
+
+    def test_signal(self):
+        profiler = mock.Mock()
+        previous = signal.getsignal(signal.SIGUSR2)
+        try:
+            set_profile_listener(profiler)
+            os.kill(os.getpid(), signal.SIGUSR2)
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+
+        profiler.listen.assert_called_once_with()
+        profiler.request_toggle.assert_called_once_with()
+        self.assertFalse(profiler.toggle.called)
+
+    def test_toggles_on_own_thread(self):
+        profiler = Profiler(self.dir, interval=0.001)
+        toggled = threading.Event()
+        toggle = profiler.toggle
+
+        def record():
+            toggle()
+            toggled.set()
+        profiler.toggle = record
+
+        profiler.listen()
+        profiler.request_toggle()
+        self.assertTrue(toggled.wait(5))
+        self.assertTrue(profiler.running)
+
+        paths = profiler.close()
+        self.assertFalse(profiler.running)
+        self.assertEqual(len([path for path in paths if path.endswith('-hooks.txt')]), 1)
+
+    def test_close_dumps_timings_once(self):
+        profiler = Profiler(self.dir)
+        paths = profiler.close()
+
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(os.listdir(self.dir), [os.path.basename(paths[0])])
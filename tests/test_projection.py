@@ -0,0 +1,72 @@
+from unittest import TestCase
+import logging
+import json
+import mock
+
+from twitter_monitor import JsonStreamListener
+from twitter_monitor.projection import Projection
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class TestProjection(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.status = {
+            "id": 42,
+            "in_reply_to_status_id": None,
+            "created_at": "Sat Sep 10 22:23:38 +0000 2011",
+            "text": "hello #one #two",
+            "lang": "en",
+            "user": {"id": 7, "screen_name": "someone", "description": "lots of text"},
+            "entities": {"hashtags": [{"text": "one", "indices": [6, 10]},
+                                      {"text": "two", "indices": [11, 15]}]},
+        }
+
+    def test_default_fields(self):
+        record = Projection()(self.status)
+
+        self.assertEqual(record.id, 42)
+        self.assertEqual(record.user_id, 7)
+        self.assertEqual(record.screen_name, "someone")
+        self.assertEqual(record.hashtags, ("one", "two"))
+        self.assertFalse(hasattr(record, '__dict__'), "Records use slots")
+
+    def test_dict_access(self):
+        record = Projection(fields=['id', 'lang'])(self.status)
+
+        self.assertEqual(record['id'], 42)
+        self.assertEqual(record.get('lang'), 'en')
+        self.assertEqual(record.get('text', 'missing'), 'missing')
+        self.assertRaises(KeyError, lambda: record['text'])
+        self.assertEqual(record.as_dict(), {'id': 42, 'lang': 'en'})
+
+    def test_missing_values(self):
+        record = Projection(fields=[('place', 'place.full_name'), ('urls', 'entities.urls[].url')])(self.status)
+        self.assertEqual(record.place, None)
+        self.assertEqual(record.urls, None)
+
+    def test_keep_raw(self):
+        raw = json.dumps(self.status)
+        record = Projection(fields=['id'], keep_raw=True)(self.status, raw=raw)
+
+        self.assertEqual(record.raw, raw)
+        self.assertEqual(record.decode()["user"]["description"], "lots of text")
+
+    def test_decode_needs_raw(self):
+        record = Projection(fields=['id'])(self.status)
+        self.assertRaises(ValueError, record.decode)
+
+    def test_listener_projects_statuses(self):
+        projection = Projection(fields=['id', 'text'], keep_raw=True)
+        listener = JsonStreamListener(projection=projection)
+        listener.on_status = mock.Mock(return_value=True)
+
+        raw = json.dumps(self.status)
+        self.assertTrue(listener.on_data(raw + "\r\n"))
+
+        record = listener.on_status.call_args[0][0]
+        self.assertTrue(isinstance(record, projection.record_class))
+        self.assertEqual(record.text, "hello #one #two")
+        self.assertEqual(record.raw, raw)
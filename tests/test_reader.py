@@ -0,0 +1,212 @@
+from unittest import TestCase
+import threading
+import logging
+import socket
+import gzip
+import json
+import io
+import mock
+
+import requests
+
+from twitter_monitor import DynamicTwitterStream
+from twitter_monitor.reader import LineReader, GzipDecoder, FastStream
+from tests.helpers import RecordingListener
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def gzipped(data):
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as compressor:
+        compressor.write(data)
+    return out.getvalue()
+
+
+def serve_chunked(chunks, headers=b''):
+    """Serve one chunked HTTP response on a local port, returning its URL"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def handle():
+        connection, _ = server.accept()
+        stream = connection.makefile('rwb')
+        while stream.readline() not in (b'\r\n', b''):
+            pass
+
+        stream.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n'
+                     b'Transfer-Encoding: chunked\r\n' + headers + b'\r\n')
+        for chunk in chunks:
+            stream.write(('%x\r\n' % len(chunk)).encode('latin-1') + chunk + b'\r\n')
+            stream.flush()
+        stream.write(b'0\r\n\r\n')
+        stream.close()
+        connection.close()
+        server.close()
+
+    thread = threading.Thread(target=handle)
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:%d/' % server.getsockname()[1]
+
+
+class TestLineReader(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.reader = LineReader()
+
+    def test_whole_messages(self):
+        self.assertEqual(self.reader.feed(b'{"a": 1}\r\n{"b": 2}\r\n'), ['{"a": 1}', '{"b": 2}'])
+        self.assertEqual(len(self.reader.buffer), 0)
+
+    def test_split_messages(self):
+        data = b'{"a": 1}\r\n{"text": "caf\xc3\xa9"}\r\n{"c": 3}\r\n'
+
+        # Every possible split point, including inside \r\n and the utf8 character
+        for split in range(len(data)):
+            reader = LineReader()
+            messages = reader.feed(data[:split]) + reader.feed(data[split:])
+            self.assertEqual(messages, ['{"a": 1}', u'{"text": "caf\xe9"}', '{"c": 3}'])
+
+    def test_byte_at_a_time(self):
+        data = b'{"a": 1}\r\n\r\n{"b": 2}\r\n'
+        messages = []
+        for position in range(len(data)):
+            messages.extend(self.reader.feed(data[position:position + 1]))
+
+        self.assertEqual(messages, ['{"a": 1}', '{"b": 2}'])
+        self.assertEqual(self.reader.keep_alives, 1)
+
+    def test_keep_alives_and_lengths(self):
+        messages = list(self.reader.lines([b'\r\n\r\n', b'12\r\n{"a": 1}\r\n', b'\r\n']))
+
+        self.assertEqual(messages, [None, None, '{"a": 1}', None])
+        self.assertEqual(self.reader.keep_alives, 3)
+        self.assertEqual(self.reader.messages, 1)
+
+    def test_partial_message_waits(self):
+        self.assertEqual(self.reader.feed(b'{"a": '), [])
+        self.assertEqual(self.reader.feed(b'1}'), [])
+        self.assertEqual(self.reader.feed(b'\r\n'), ['{"a": 1}'])
+
+
+class TestFastStream(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+    def test_read_loop(self):
+        tweets = [json.dumps({'id': i, 'text': 'x' * 500, 'in_reply_to_status_id': None}).encode('utf8')
+                  for i in range(50)]
+        data = b'\r\n'.join(tweets) + b'\r\n\r\n'
+        chunks = [data[i:i + 777] for i in range(0, len(data), 777)]
+
+        listener = RecordingListener()
+        stream = FastStream(None, listener)
+        stream.running = True
+
+        response = requests.get(serve_chunked(chunks), stream=True)
+        stream._read_loop(response)
+
+        self.assertEqual(listener.statuses, list(range(50)))
+        self.assertEqual(listener.keep_alives, 1)
+
+    def test_stops_when_listener_says(self):
+        data = b''.join(json.dumps({'id': i, 'in_reply_to_status_id': None}).encode('utf8') + b'\r\n'
+                        for i in range(5))
+
+        listener = RecordingListener()
+        listener.on_status = mock.Mock(return_value=False)
+        stream = FastStream(None, listener)
+        stream.running = True
+
+        stream._read_loop(requests.get(serve_chunked([data]), stream=True))
+
+        self.assertEqual(listener.on_status.call_count, 1)
+        self.assertFalse(stream.running)
+
+    def test_not_length_delimited(self):
+        stream = FastStream(None, RecordingListener())
+        with mock.patch('tweepy.Stream._start') as start:
+            stream.filter(track=['cats'])
+
+        self.assertEqual(stream.session.params, {})
+        self.assertEqual(stream.chunk_size, 65536)
+        start.assert_called_once_with(False)
+
+    def test_sample_keeps_other_params(self):
+        stream = FastStream(None, RecordingListener())
+        with mock.patch('tweepy.Stream._start'):
+            stream.sample(languages=['en', 'fr'], stall_warnings=True)
+
+        self.assertEqual(stream.session.params, {'language': 'en,fr', 'stall_warnings': 'true'})
+
+
+class TestGzip(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.tweets = [json.dumps({'id': i, 'text': 'the same old words ' * 20,
+                                   'in_reply_to_status_id': None}).encode('utf8')
+                       for i in range(100)]
+        self.data = b'\r\n'.join(self.tweets) + b'\r\n'
+
+    def test_decoder_byte_at_a_time(self):
+        compressed = gzipped(self.data)
+        decoder = GzipDecoder()
+
+        data = b''.join(decoder.chunks(compressed[i:i + 1] for i in range(len(compressed))))
+        self.assertEqual(data, self.data)
+        self.assertEqual(decoder.compressed_bytes, len(compressed))
+        self.assertEqual(decoder.decompressed_bytes, len(self.data))
+
+    def test_decoder_several_members(self):
+        decoder = GzipDecoder()
+        data = decoder.decompress(gzipped(b'one\r\n') + gzipped(b'two\r\n'))
+        self.assertEqual(data, b'one\r\ntwo\r\n')
+
+    def test_gzip_stream(self):
+        compressed = gzipped(self.data)
+        chunks = [compressed[i:i + 100] for i in range(0, len(compressed), 100)]
+
+        listener = RecordingListener()
+        stream = FastStream(None, listener, gzip=True)
+        stream.running = True
+        self.assertEqual(stream.session.headers['Accept-Encoding'], 'deflate, gzip')
+
+        url = serve_chunked(chunks, headers=b'Content-Encoding: gzip\r\n')
+        stream._read_loop(requests.get(url, stream=True, headers={'Accept-Encoding': 'gzip'}))
+
+        self.assertEqual(listener.statuses, list(range(100)))
+        self.assertEqual(stream.compressed_bytes, len(compressed))
+        self.assertEqual(stream.decompressed_bytes, len(self.data))
+        self.assertTrue(stream.compression_ratio() > 5)
+
+    def test_dynamic_stream_gzip_option(self):
+        with mock.patch('twitter_monitor.stream.FastStream') as MockFastStream:
+            stream = DynamicTwitterStream(mock.Mock(), mock.Mock(), mock.Mock(), gzip=True)
+            stream.term_checker.tracking_terms.return_value = ["hello"]
+            stream.start_stream()
+
+        self.assertEqual(MockFastStream.call_args[1]['gzip'], True)
+
+    def test_dynamic_stream_counts_bytes_across_restarts(self):
+        stream = DynamicTwitterStream(mock.Mock(), mock.Mock(), mock.Mock(), gzip=True)
+        stream.STOP_TIMEOUT = 0
+
+        for compressed, decompressed in [(100, 900), (50, 600)]:
+            stream.stop_stream()
+            stream.stream = FastStream(None, stream.listener, gzip=True)
+            stream.stream._compressed_bytes = compressed
+            stream.stream._decompressed_bytes = decompressed
+
+        self.assertEqual(stream.compressed_bytes, 150)
+        self.assertEqual(stream.decompressed_bytes, 1500)
+        self.assertEqual(stream.compression_ratio(), 10.0)
+
+        # Still counted once the last one has stopped
+        stream.stop_stream()
+        self.assertEqual(stream.compressed_bytes, 150)
+
+    def test_dynamic_stream_gzip_needs_fast_stream(self):
+        self.assertRaises(ValueError, DynamicTwitterStream, mock.Mock(), mock.Mock(), mock.Mock(),
+                          gzip=True, stream_class=mock.Mock)
@@ -0,0 +1,169 @@
+from unittest import TestCase
+import tempfile
+import logging
+import shutil
+import socket
+import json
+import os
+
+from twitter_monitor.recent import RecentTweetStore, RecentTweetServer, record_size, RECORD_OVERHEAD
+from tests.helpers import StaticTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def tweet(status_id, text):
+    return {'id': status_id, 'id_str': str(status_id), 'text': text, 'lang': 'en',
+            'user': {'id_str': '7', 'screen_name': 'alice', 'followers_count': 5}}
+
+
+def get(address, path):
+    """Make a GET request and return the status code and decoded body"""
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address, timeout=5)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(address)
+
+    sock.sendall(('GET %s HTTP/1.0\r\n\r\n' % path).encode('ascii'))
+    response = b''
+    while True:
+        data = sock.recv(4096)
+        if not data:
+            break
+        response += data
+    sock.close()
+
+    head, body = response.split(b'\r\n\r\n', 1)
+    return int(head.split()[1]), json.loads(body.decode('utf8'))
+
+
+class TestRecentTweetStore(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.checker = StaticTermChecker(["cats", "dogs"])
+        self.checker.check()
+
+    def test_recent(self):
+        store = RecentTweetStore(self.checker, per_term=2)
+        for status_id in range(3):
+            store.process(tweet(status_id, "I like cats"))
+        store.process(tweet(3, "cats and dogs"))
+
+        self.assertEqual([record['id_str'] for record in store.recent("cats")], ['3', '2'])
+        self.assertEqual([record['id_str'] for record in store.recent("cats", limit=1)], ['3'])
+        self.assertEqual(store.recent("dogs")[0]['matched_terms'], ["cats", "dogs"])
+        self.assertEqual(store.recent("birds"), [])
+        self.assertEqual(store.counts(), {"cats": 2, "dogs": 1})
+        self.assertEqual(len(store), 3)
+
+    def test_record_is_compact(self):
+        store = RecentTweetStore(self.checker)
+        store.process(tweet(1, "cats"))
+
+        self.assertEqual(store.recent("cats")[0], {
+            'id_str': '1', 'created_at': None, 'timestamp_ms': None,
+            'user_id_str': '7', 'screen_name': 'alice', 'lang': 'en',
+            'text': 'cats', 'matched_terms': ["cats"],
+        })
+
+    def test_uses_attributed_terms(self):
+        store = RecentTweetStore()
+        status = tweet(1, "nothing to see")
+        status['matched_terms'] = ["birds"]
+        store.process(status)
+
+        self.assertEqual(len(store.recent("birds")), 1)
+
+    def test_evicts_least_recently_used_term(self):
+        store = RecentTweetStore(max_records=3)
+        for status_id, term in enumerate(["cats", "dogs", "birds"]):
+            store.add([term], {'id_str': str(status_id)})
+        store.recent("cats")
+        store.add(["birds"], {'id_str': '3'})
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.evicted, 1)
+        self.assertEqual(store.recent("dogs"), [])
+        self.assertEqual([record['id_str'] for record in store.recent("cats")], ['0'])
+        self.assertEqual([record['id_str'] for record in store.recent("birds")], ['3', '2'])
+
+    def test_memory_cap(self):
+        record = {'id_str': '1', 'text': 'x' * 250}
+        size = record_size(record)
+        self.assertEqual(size, RECORD_OVERHEAD + 251)
+
+        store = RecentTweetStore(max_bytes=size * 3)
+        for term in ["cats", "dogs", "birds", "fish"]:
+            store.add([term], dict(record))
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.bytes, size * 3)
+        self.assertEqual(store.evicted, 1)
+        self.assertEqual(store.recent("cats"), [])
+
+    def test_per_term_limit(self):
+        store = RecentTweetStore(per_term=2)
+        for status_id in range(3):
+            store.add(["cats"], {'id_str': str(status_id)})
+
+        self.assertEqual([record['id_str'] for record in store.recent("cats")], ['2', '1'])
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.bytes, 2 * record_size({'id_str': '0'}))
+
+    def test_removed_terms_are_dropped(self):
+        store = RecentTweetStore(self.checker)
+        store.process(tweet(1, "cats and dogs"))
+
+        self.checker.terms = ["cats"]
+        self.checker.check()
+        store.process(tweet(2, "dogs"))
+
+        self.assertEqual(store.counts(), {"cats": 1})
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.bytes, record_size(store.recent("cats")[0]))
+
+
+class TestRecentTweetServer(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.store = RecentTweetStore()
+        status = tweet(1, "cats")
+        status['matched_terms'] = ["cats"]
+        self.store.process(status)
+
+    def test_http(self):
+        server = RecentTweetServer(self.store, ('127.0.0.1', 0))
+        server.start()
+        try:
+            code, body = get(server.address, '/terms')
+            self.assertEqual(code, 200)
+            self.assertEqual(body, {'terms': {'cats': 1}, 'records': 1, 'bytes': self.store.bytes, 'evicted': 0})
+
+            code, body = get(server.address, '/recent?term=cats&limit=5')
+            self.assertEqual(code, 200)
+            self.assertEqual(body['term'], 'cats')
+            self.assertEqual([record['id_str'] for record in body['tweets']], ['1'])
+
+            self.assertEqual(get(server.address, '/recent')[0], 400)
+            self.assertEqual(get(server.address, '/recent?term=cats&limit=x')[0], 400)
+            self.assertEqual(get(server.address, '/nothing')[0], 404)
+        finally:
+            server.close()
+
+    def test_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'recent.sock')
+            server = RecentTweetServer(self.store, path)
+            server.start()
+            try:
+                code, body = get(path, '/recent?term=cats')
+                self.assertEqual(code, 200)
+                self.assertEqual(len(body['tweets']), 1)
+            finally:
+                server.close()
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(directory)
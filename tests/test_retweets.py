@@ -0,0 +1,113 @@
+from unittest import TestCase
+import logging
+import json
+
+from twitter_monitor.retweets import RetweetCollapser, RetweetExpander, expand_lines
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def tweet(status_id, text="hello world", user="alice"):
+    return {'id': status_id, 'id_str': str(status_id), 'text': text,
+            'created_at': 'Sat Sep 10 22:23:38 +0000 2011', 'timestamp_ms': '1315693418000',
+            'in_reply_to_status_id': None,
+            'user': {'id': len(user), 'id_str': str(len(user)), 'screen_name': user, 'followers_count': 5}}
+
+
+def retweet(status_id, original, user="bob"):
+    status = tweet(status_id, "RT @%s: %s" % (original['user']['screen_name'], original['text']), user)
+    status['retweeted_status'] = original
+    return status
+
+
+class TestRetweetCollapser(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.collapser = RetweetCollapser(cache_size=2)
+
+    def test_plain_tweets(self):
+        status = tweet(1)
+        self.assertEqual(self.collapser.collapse(status), [status])
+
+    def test_original_stored_once(self):
+        original = tweet(1)
+        first = self.collapser.collapse(retweet(2, original))
+        second = self.collapser.collapse(retweet(3, original, user="carol"))
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(first[0]['id'], 1)
+        self.assertTrue(first[0]['retweet_original'])
+        self.assertNotIn('retweet_original', original, "The status is not changed")
+
+        self.assertEqual(second, [{
+            'id': 3, 'id_str': '3',
+            'user': {'id': 5, 'id_str': '5', 'screen_name': 'carol'},
+            'retweet_ref': {
+                'created_at': 'Sat Sep 10 22:23:38 +0000 2011', 'timestamp_ms': '1315693418000',
+                'retweeted_status_id': 1,
+            },
+        }])
+        self.assertEqual(self.collapser.retweets, 2)
+        self.assertEqual(self.collapser.originals, 1)
+
+    def test_original_already_written(self):
+        original = tweet(1)
+        self.collapser.collapse(original)
+        records = self.collapser.collapse(retweet(2, original))
+        self.assertEqual(len(records), 1)
+
+    def test_evicted_original_stored_again(self):
+        original = tweet(1)
+        self.collapser.collapse(retweet(2, original))
+        self.collapser.collapse(tweet(10))
+        self.collapser.collapse(tweet(11))
+
+        records = self.collapser.collapse(retweet(3, original))
+        self.assertEqual([record.get('id') for record in records], [1, 3])
+        self.assertIn('retweet_ref', records[1])
+
+
+class TestRetweetExpander(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+    def store(self, statuses, cache_size=100):
+        collapser = RetweetCollapser(cache_size)
+        return [json.dumps(record) for status in statuses for record in collapser.collapse(status)]
+
+    def test_round_trip(self):
+        original = tweet(1, user="alice")
+        statuses = [tweet(5), retweet(2, original), retweet(3, original, user="carol")]
+        lines = self.store(statuses)
+
+        expanded = list(expand_lines(lines))
+
+        self.assertEqual([status['id'] for status in expanded], [5, 2, 3])
+        rebuilt = expanded[2]
+        self.assertEqual(rebuilt['retweeted_status'], original)
+        self.assertEqual(rebuilt['user']['screen_name'], 'carol')
+        self.assertEqual(rebuilt['text'], 'RT @alice: hello world')
+        self.assertEqual(rebuilt['created_at'], statuses[2]['created_at'])
+
+    def test_include_originals(self):
+        lines = self.store([retweet(2, tweet(1))])
+        expanded = list(expand_lines(lines, include_originals=True))
+
+        self.assertEqual([status['id'] for status in expanded], [1, 2])
+        self.assertNotIn('retweet_original', expanded[0])
+
+    def test_missing_original(self):
+        lines = self.store([retweet(2, tweet(1))])
+
+        expander = RetweetExpander()
+        self.assertIsNone(expander.expand_line(lines[1]))
+        self.assertEqual(expander.missing, 1)
+
+    def test_saves_space(self):
+        original = tweet(1, text="x" * 140)
+        original['entities'] = {'urls': [{'expanded_url': 'http://example.com/%d' % i} for i in range(10)]}
+        statuses = [retweet(i, original, user="user%d" % i) for i in range(2, 102)]
+
+        plain = sum(len(json.dumps(status)) for status in statuses)
+        collapsed = sum(len(line) for line in self.store(statuses))
+        self.assertTrue(collapsed * 3 < plain, "%d vs %d bytes" % (collapsed, plain))
@@ -0,0 +1,110 @@
+from unittest import TestCase
+import logging
+import mock
+
+from twitter_monitor.pipeline import PipelineListener
+from twitter_monitor.sampling import RateCapStage, ReservoirStage
+from tests.helpers import Clock, StaticTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def tweet(status_id, *terms):
+    return {'id': status_id, 'text': 'hello', 'matched_terms': list(terms)}
+
+
+class TestRateCapStage(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.clock = Clock(100.0)
+        self.stage = RateCapStage(rate=2, clock=self.clock)
+
+    def test_caps_each_term(self):
+        kept = [self.stage.process(tweet(i, "viral")) is not None for i in range(5)]
+        self.assertEqual(kept, [True, True, False, False, False])
+
+        self.assertIsNotNone(self.stage.process(tweet(5, "quiet")))
+        self.assertEqual(self.stage.counts(), {"viral": (5, 2, 3), "quiet": (1, 1, 0)})
+        self.assertEqual(self.stage.dropped("viral"), 3)
+        self.assertEqual(self.stage.dropped("other"), 0)
+
+    def test_tokens_refill(self):
+        for i in range(3):
+            self.stage.process(tweet(i, "viral"))
+
+        self.clock.now += 0.5
+        self.assertIsNotNone(self.stage.process(tweet(3, "viral")))
+        self.assertIsNone(self.stage.process(tweet(4, "viral")))
+
+    def test_quiet_term_gets_through(self):
+        for i in range(2):
+            self.stage.process(tweet(i, "viral"))
+
+        self.assertIsNotNone(self.stage.process(tweet(2, "quiet", "viral")))
+        self.assertEqual(self.stage.counts()["viral"], (3, 3, 0))
+
+    def test_unattributed_statuses_pass(self):
+        stage = RateCapStage(rate=0.1, term_checker=StaticTermChecker([]), clock=self.clock)
+        status = {'id': 1, 'text': 'nothing tracked'}
+        self.assertIs(stage.process(status), status)
+
+    def test_removed_terms_are_forgotten(self):
+        checker = StaticTermChecker(["cats"])
+        checker.check()
+        stage = RateCapStage(rate=1, term_checker=checker, clock=self.clock)
+        stage.process(tweet(1, "cats"))
+
+        checker.terms = ["dogs"]
+        checker.check()
+        stage.process(tweet(2, "dogs"))
+        self.assertEqual(sorted(stage.buckets), ["dogs"])
+
+
+class TestReservoirStage(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.clock = Clock(0.0)
+        self.stage = ReservoirStage(size=2, window=60, clock=self.clock, seed=1)
+
+    def test_samples_each_window(self):
+        for i in range(10):
+            self.assertEqual(self.stage.process(tweet(i, "viral")), [])
+        self.stage.process(tweet(10, "quiet"))
+
+        self.clock.now = 61
+        sample = self.stage.process(tweet(11, "viral"))
+
+        viral = [status for status in sample if status['matched_terms'] == ["viral"]]
+        quiet = [status for status in sample if status['matched_terms'] == ["quiet"]]
+        self.assertEqual(len(viral), 2)
+        self.assertEqual([status['sample_weight'] for status in viral], [5.0, 5.0])
+        self.assertEqual([status['id'] for status in quiet], [10])
+        self.assertEqual(quiet[0]['sample_weight'], 1.0)
+
+        self.assertEqual(self.stage.window_counts, {"viral": (10, 2, 8), "quiet": (1, 1, 0)})
+        self.assertEqual(self.stage.counts(), {"viral": (10, 2, 8), "quiet": (1, 1, 0)})
+
+    def test_quietest_term_gets_shared_status(self):
+        for i in range(3):
+            self.stage.process(tweet(i, "viral"))
+        self.stage.process(tweet(3, "quiet", "viral"))
+
+        self.assertEqual(self.stage.reservoirs["quiet"].seen, 1)
+        self.assertEqual(self.stage.reservoirs["viral"].seen, 3)
+
+    def test_unattributed_statuses_pass(self):
+        status = {'id': 1, 'text': 'hello', 'matched_terms': []}
+        self.assertEqual(self.stage.process(status), [status])
+
+    def test_flushed_through_pipeline_on_close(self):
+        sink = mock.Mock()
+        sink.on_status.return_value = True
+        listener = PipelineListener([self.stage], sink=sink)
+
+        for i in range(5):
+            listener.on_status(tweet(i, "viral"))
+        self.assertFalse(sink.on_status.called)
+
+        listener.close()
+        self.assertEqual(sink.on_status.call_count, 2)
+        self.assertEqual(self.stage.counts(), {"viral": (5, 2, 3)})
@@ -0,0 +1,152 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import logging
+import json
+import os
+
+from twitter_monitor.segment_log import SegmentLogWriter, SegmentLogReader, LogListener, \
+    INDEX_ENTRY, list_segments
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def record(tweet_id):
+    return json.dumps({"id": tweet_id, "text": "tweet %d" % tweet_id})
+
+
+class TestSegmentLog(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, count, segment_size=1024 * 1024, start=0):
+        writer = SegmentLogWriter(self.dir, segment_size=segment_size)
+        for i in range(start, start + count):
+            writer.append(record(i), tweet_id=i, timestamp=1000 + i * 10)
+        writer.close()
+        return writer
+
+    def test_append_and_read(self):
+        self.write(5)
+
+        reader = SegmentLogReader(self.dir)
+        self.assertEqual(reader.end, 5)
+
+        tweet_id, timestamp, data = reader.read(3)
+        self.assertEqual(tweet_id, 3)
+        self.assertEqual(timestamp, 1030)
+        self.assertTrue(isinstance(data, memoryview))
+        self.assertEqual(data.tobytes().decode('utf-8'), record(3))
+
+        self.assertEqual(reader.read(5), None)
+
+    def test_segments_roll(self):
+        self.write(50, segment_size=200)
+        self.assertTrue(len(list_segments(self.dir)) > 1)
+
+        reader = SegmentLogReader(self.dir)
+        ids = [tweet_id for seq, tweet_id, timestamp, data in reader.records()]
+        self.assertEqual(ids, list(range(50)))
+
+        seqs = [seq for seq, tweet_id, timestamp, data in reader.records(start=17)]
+        self.assertEqual(seqs, list(range(17, 50)))
+
+    def test_seek_time(self):
+        self.write(50, segment_size=200)
+
+        reader = SegmentLogReader(self.dir)
+        self.assertEqual(reader.seek_time(0), 0)
+        self.assertEqual(reader.seek_time(1205), 21)
+        self.assertEqual(reader.seek_time(1210), 21)
+        self.assertEqual(reader.seek_time(99999), 50)
+
+    def test_reopen_continues_sequence(self):
+        self.write(3)
+        self.write(3, start=3)
+
+        reader = SegmentLogReader(self.dir)
+        self.assertEqual([tweet_id for seq, tweet_id, ts, data in reader.records()], list(range(6)))
+
+    def test_recovers_partial_writes(self):
+        self.write(3)
+        log_path = os.path.join(self.dir, '%020d.log' % 0)
+        index_path = os.path.join(self.dir, '%020d.idx' % 0)
+
+        # A torn record and a torn index entry
+        with open(log_path, 'ab') as log:
+            log.write(b'{"id": 3, "te')
+        with open(index_path, 'ab') as index:
+            index.write(INDEX_ENTRY.pack(os.path.getsize(log_path), 100, 3, 0)[:10])
+
+        writer = SegmentLogWriter(self.dir)
+        self.assertEqual(writer.append(record(4), tweet_id=4), 3)
+        writer.close()
+
+        reader = SegmentLogReader(self.dir)
+        self.assertEqual([tweet_id for seq, tweet_id, ts, data in reader.records()], [0, 1, 2, 4])
+        self.assertEqual(reader.read(3)[2].tobytes().decode('utf-8'), record(4))
+
+    def test_refresh_sees_new_records(self):
+        writer = SegmentLogWriter(self.dir)
+        writer.append(record(0), tweet_id=0)
+        writer.flush()
+
+        reader = SegmentLogReader(self.dir)
+        self.assertEqual(reader.end, 1)
+
+        writer.append(record(1), tweet_id=1)
+        writer.flush()
+        reader.refresh()
+        self.assertEqual(reader.end, 2)
+        writer.close()
+
+    def test_refresh_after_several_rolls(self):
+        writer = SegmentLogWriter(self.dir, segment_size=200)
+        writer.append(record(0), tweet_id=0)
+        writer.flush()
+        reader = SegmentLogReader(self.dir)
+
+        for i in range(1, 30):
+            writer.append(record(i), tweet_id=i)
+        writer.flush()
+        self.assertTrue(len(list_segments(self.dir)) > 3)
+
+        reader.refresh()
+        self.assertEqual([tweet_id for seq, tweet_id, ts, data in reader.records()], list(range(30)))
+        writer.close()
+
+    def test_consumer_offsets(self):
+        self.write(3)
+        reader = SegmentLogReader(self.dir)
+
+        self.assertEqual(reader.committed("indexer"), 0)
+        reader.commit("indexer", 2)
+        self.assertEqual(SegmentLogReader(self.dir).committed("indexer"), 2)
+
+
+class TestLogListener(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_logs_raw_statuses(self):
+        listener = LogListener(self.dir)
+        raw = '{"id": 12, "in_reply_to_status_id": null, "text": "hi"}'
+        self.assertTrue(listener.on_data(raw + '\r\n'))
+        listener.on_data('{"limit": {"track": 5}}')
+        listener.close()
+
+        reader = SegmentLogReader(self.dir)
+        self.assertEqual(reader.end, 1)
+        tweet_id, timestamp, data = reader.read(0)
+        self.assertEqual(tweet_id, 12)
+        self.assertEqual(data.tobytes().decode('utf-8'), raw)
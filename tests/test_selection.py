@@ -0,0 +1,69 @@
+from unittest import TestCase
+import logging
+import mock
+
+from twitter_monitor.selection import PrioritizingTermChecker
+from tests.helpers import ListChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class TestPrioritizingTermChecker(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.terms = ["a", "b", "c", "d"]
+        self.source = ListChecker(self.terms)
+
+        self.volumes = mock.Mock()
+        self.volumes.lost_count.return_value = 0
+        self.volumes.received_count.return_value = 100
+        self.rates = {}
+        self.volumes.rate.side_effect = lambda term, window: self.rates.get(term, 0.0)
+
+    def test_under_capacity(self):
+        checker = PrioritizingTermChecker(self.source, capacity=10)
+        checker.check()
+        self.assertEqual(sorted(checker.tracking_terms()), self.terms)
+
+    def test_by_priority(self):
+        checker = PrioritizingTermChecker(self.source, capacity=2, priorities={"c": 5, "d": 3})
+        checker.check()
+        self.assertEqual(sorted(checker.tracking_terms()), ["c", "d"])
+
+    def test_ties_are_stable(self):
+        checker = PrioritizingTermChecker(self.source, capacity=2)
+        checker.check()
+        self.assertEqual(sorted(checker.tracking_terms()), ["a", "b"])
+
+    def test_hysteresis(self):
+        priorities = {"a": 2, "b": 2, "c": 1, "d": 1}
+        checker = PrioritizingTermChecker(self.source, capacity=2, priorities=priorities, hysteresis=0.5)
+        checker.check()
+
+        # A small change is not enough to swap terms
+        priorities["c"] = 2.5
+        self.assertFalse(checker.check())
+
+        # A big one is
+        priorities["c"] = 4
+        self.assertTrue(checker.check())
+        self.assertEqual(sorted(checker.tracking_terms()), ["a", "c"])
+
+    def test_penalizes_volume_when_losing_tweets(self):
+        checker = PrioritizingTermChecker(self.source, capacity=2, volumes=self.volumes, hysteresis=0)
+        checker.check()
+        self.assertEqual(sorted(checker.tracking_terms()), ["a", "b"])
+
+        # "a" is busy, but nothing is being lost
+        self.rates["a"] = 50.0
+        checker.check()
+        self.assertEqual(sorted(checker.tracking_terms()), ["a", "b"])
+
+        # Now limit notices report losses
+        self.volumes.lost_count.return_value = 100
+        self.assertTrue(checker.check())
+        self.assertEqual(sorted(checker.tracking_terms()), ["b", "c"])
+
+        # "a" is remembered as busy even though it is no longer tracked
+        self.assertFalse(checker.check())
@@ -0,0 +1,48 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import struct
+import os
+
+from twitter_monitor.sorted_file import SortedRecordFile, write_records, merge_records
+
+RECORD = struct.Struct('<QI')
+
+
+class TestSortedRecordFile(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "records")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_missing_file_is_empty(self):
+        records = SortedRecordFile(self.path, RECORD)
+        self.assertEqual(len(records), 0)
+        self.assertEqual(records.bisect_left(5), 0)
+        self.assertFalse(5 in records)
+
+    def test_search(self):
+        write_records(self.path, RECORD, [(key, key * 2) for key in range(0, 100, 5)])
+        records = SortedRecordFile(self.path, RECORD)
+
+        self.assertEqual(len(records), 20)
+        self.assertEqual(records[3], (15, 30))
+        self.assertEqual(records.bisect_left(15), 3)
+        self.assertEqual(records.bisect_left(16), 4)
+        self.assertTrue(15 in records)
+        self.assertFalse(16 in records)
+        self.assertEqual([key for key, value in records.range(12, 31)], [15, 20, 25, 30])
+        records.close()
+
+    def test_merge(self):
+        write_records(self.path, RECORD, [(1, 0), (5, 0), (9, 0)])
+        records = SortedRecordFile(self.path, RECORD)
+
+        write_records(self.path, RECORD, merge_records(records, [(2, 1), (7, 1)]))
+        records.close()
+
+        merged = SortedRecordFile(self.path, RECORD)
+        self.assertEqual([key for key, value in merged], [1, 2, 5, 7, 9])
+        merged.close()
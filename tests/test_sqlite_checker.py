@@ -0,0 +1,87 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import logging
+import sqlite3
+import os
+
+from twitter_monitor.sqlite_checker import SQLiteTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+class TestSQLiteTermChecker(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "terms.db")
+        self.checker = SQLiteTermChecker(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def execute(self, sql, *args):
+        """Change the terms the way another program would"""
+        connection = sqlite3.connect(self.filename)
+        with connection:
+            connection.execute(sql, args)
+        connection.close()
+
+    def test_starts_empty(self):
+        self.assertFalse(self.checker.check())
+        self.assertEqual(self.checker.tracking_terms(), [])
+
+    def test_add_and_remove(self):
+        self.checker.add_terms(["one", "two"])
+        self.assertTrue(self.checker.check())
+        self.assertEqual(sorted(self.checker.tracking_terms()), ["one", "two"])
+        self.assertFalse(self.checker.check())
+
+        self.checker.remove_terms(["one"])
+        self.assertTrue(self.checker.check())
+        self.assertEqual(self.checker.tracking_terms(), ["two"])
+
+    def test_external_changes(self):
+        self.checker.check()
+        self.execute("INSERT INTO terms (term) VALUES (?)", "three")
+        self.execute("UPDATE terms SET term = ? WHERE term = ?", "four", "three")
+
+        self.assertTrue(self.checker.check())
+        self.assertEqual(self.checker.tracking_terms(), ["four"])
+
+    def test_changes_that_cancel_out(self):
+        self.checker.add_terms(["one"])
+        self.checker.check()
+        version = self.checker.version
+
+        self.checker.remove_terms(["one"])
+        self.checker.add_terms(["one"])
+        self.assertFalse(self.checker.check())
+        self.assertEqual(self.checker.version, version)
+
+    def test_reset(self):
+        self.checker.add_terms(["one"])
+        self.checker.check()
+
+        self.checker.reset()
+        self.assertEqual(self.checker.tracking_terms(), [])
+        self.assertTrue(self.checker.check(), "Terms are reported again after a reset")
+        self.assertEqual(self.checker.tracking_terms(), ["one"])
+
+    def test_reloads_after_pruning(self):
+        self.checker.add_terms(["one"])
+        self.checker.check()
+
+        self.checker.add_terms(["two", "three", "four"])
+        self.checker.remove_terms(["one"])
+        self.checker.prune_changes(keep=1)
+
+        self.assertTrue(self.checker.check())
+        self.assertEqual(sorted(self.checker.tracking_terms()), ["four", "three", "two"])
+
+    def test_new_checker_loads_everything(self):
+        self.checker.add_terms(["one", "two"])
+
+        checker = SQLiteTermChecker(self.filename)
+        self.assertEqual(checker.update_tracking_terms(), set(["one", "two"]))
@@ -0,0 +1,127 @@
+from unittest import TestCase
+import tempfile
+import shutil
+import logging
+import sqlite3
+import json
+import os
+
+from twitter_monitor.sqlite_sink import SQLiteListener
+from twitter_monitor.matching import TermMatcher
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def make_status(status_id, user_id=10, text="hello world"):
+    return {
+        "id": status_id,
+        "in_reply_to_status_id": None,
+        "created_at": "Sat Sep 10 22:23:38 +0000 2011",
+        "text": text,
+        "lang": "en",
+        "user": {"id": user_id, "screen_name": "user%d" % user_id},
+        "coordinates": {"type": "Point", "coordinates": [-122.3, 47.6]},
+        "place": {"full_name": "Seattle, WA"},
+    }
+
+
+class TestSQLiteListener(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "tweets.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def query(self, sql, *args):
+        connection = sqlite3.connect(self.filename)
+        try:
+            return connection.execute(sql, args).fetchall()
+        finally:
+            connection.close()
+
+    def test_inserts_statuses(self):
+        listener = SQLiteListener(self.filename)
+        listener.matcher = TermMatcher(terms=["hello"])
+
+        for i in range(10):
+            self.assertTrue(listener.on_data(json.dumps(make_status(i))))
+        listener.close()
+
+        self.assertEqual(listener.written, 10)
+        self.assertFalse(listener.error, "The stream error is left to the base listener")
+        self.assertIsNone(listener.writer_error)
+        rows = self.query("SELECT id, user_id, screen_name, text, lang, matched_terms FROM tweets ORDER BY id")
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[3], (3, 10, "user10", "hello world", "en", "hello"))
+
+    def test_uses_wal(self):
+        listener = SQLiteListener(self.filename)
+        listener.close()
+
+        self.assertEqual(self.query("PRAGMA journal_mode")[0][0], "wal")
+
+    def test_field_projection(self):
+        listener = SQLiteListener(self.filename, fields=['text', 'raw'])
+        listener.on_status(make_status(5))
+        listener.close()
+
+        rows = self.query("SELECT id, text, raw FROM tweets")
+        self.assertEqual(rows[0][0], 5)
+        self.assertEqual(json.loads(rows[0][2])["user"]["id"], 10)
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, SQLiteListener, self.filename, fields=['id', 'nonsense'])
+
+    def test_connect_failure_raises(self):
+        missing = os.path.join(self.dir, "missing", "tweets.db")
+        self.assertRaises(sqlite3.Error, SQLiteListener, missing)
+
+    def test_keeps_writing_after_failure(self):
+        listener = SQLiteListener(self.filename, batch_size=1)
+        write_batch = listener.write_batch
+        calls = []
+
+        def fail_first(connection, batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise ValueError("bad row")
+            return write_batch(connection, batch)
+
+        listener.write_batch = fail_first
+        self.assertTrue(listener.on_status(make_status(1)))
+        self.assertTrue(listener.on_status(make_status(2)))
+        listener.close()
+
+        self.assertEqual(listener.failed, 1)
+        self.assertEqual(self.query("SELECT id FROM tweets"), [(2,)])
+
+    def test_on_status_false_once_writer_stopped(self):
+        listener = SQLiteListener(self.filename)
+        listener.close()
+        self.assertFalse(listener.on_status(make_status(1)))
+
+    def test_delete(self):
+        listener = SQLiteListener(self.filename)
+        listener.on_status(make_status(1))
+        listener.on_status(make_status(2))
+        listener.on_delete(1, 10)
+        listener.close()
+
+        self.assertEqual(self.query("SELECT id FROM tweets"), [(2,)])
+
+    def test_scrub_geo(self):
+        listener = SQLiteListener(self.filename, fields=['user_id', 'coordinates', 'place', 'raw'])
+        listener.on_status(make_status(1, user_id=10))
+        listener.on_status(make_status(2, user_id=10))
+        listener.on_status(make_status(3, user_id=11))
+        listener.on_scrub_geo(10, 1)
+        listener.close()
+
+        rows = self.query("SELECT id, coordinates, place, raw FROM tweets ORDER BY id")
+        self.assertEqual(rows[0][1:3], (None, None))
+        self.assertEqual(json.loads(rows[0][3])["coordinates"], None)
+        self.assertEqual(rows[1][2], "Seattle, WA")
+        self.assertEqual(rows[2][2], "Seattle, WA")
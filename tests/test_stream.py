@@ -110,6 +110,60 @@ class TestDynamicTwitterStream(TestCase):
         self.tweepy_stream_instance.filter.assert_called_once_with(track=self.term_list, is_async=True, languages=None)
 
 
+    def test_start_stream_with_stream_class(self):
+        stream_class = mock.Mock()
+        self.stream = DynamicTwitterStream(auth=self.auth,
+                                           listener=self.listener,
+                                           term_checker=self.checker,
+                                           stream_class=stream_class)
+        self.term_list.append("hello")
+        self.stream.start_stream()
+
+        self.assertFalse(self.MockTweepyStream.called)
+        stream_class.assert_called_once_with(self.auth, self.listener,
+                                             stall_warnings=True,
+                                             timeout=90,
+                                             retry_count=5)
+        stream_class.return_value.filter.assert_called_once_with(track=["hello"], is_async=True, languages=None)
+
+    def test_start_stream_with_follow_and_locations(self):
+        follow_checker = mock.Mock()
+        follow_checker.tracking_terms.return_value = [12345]
+        location_checker = mock.Mock()
+        location_checker.tracking_terms.return_value = [(-122.75, 36.8, -121.75, 37.8)]
+
+        self.stream = DynamicTwitterStream(auth=self.auth,
+                                           listener=self.listener,
+                                           term_checker=self.checker,
+                                           follow_checker=follow_checker,
+                                           location_checker=location_checker)
+
+        # No terms, but users and locations are enough to start
+        self.stream.start_stream()
+
+        self.tweepy_stream_instance.filter.assert_called_once_with(follow=["12345"],
+                                                                   locations=[-122.75, 36.8, -121.75, 37.8],
+                                                                   is_async=True, languages=None)
+
+    def test_update_stream_locations_changed(self):
+        location_checker = mock.Mock()
+        self.stream = DynamicTwitterStream(auth=self.auth,
+                                           listener=self.listener,
+                                           term_checker=self.checker,
+                                           location_checker=location_checker)
+
+        self.checker.check.return_value = False
+        location_checker.check.return_value = True
+
+        self.stream.start_stream = mock.Mock()
+        self.stream.stop_stream = mock.Mock()
+
+        self.stream.update_stream()
+
+        # Should have restarted for the new locations
+        self.stream.stop_stream.assert_called_once_with()
+        self.stream.start_stream.assert_called_once_with()
+
     def test_stop_stream_not_started(self):
 
         self.stream.stop_stream()
@@ -129,6 +183,35 @@ class TestDynamicTwitterStream(TestCase):
         # Should try to disconnect tweepy stream
         self.tweepy_stream_instance.disconnect.assert_called_once_with()
 
+    def test_stop_stream_waits_for_thread(self):
+
+        # Start the stream with a term
+        self.term_list.append("hello")
+        self.stream.start_stream()
+
+        self.stream.stop_stream()
+
+        # Should wait for the streaming thread to finish
+        self.tweepy_stream_instance._thread.join.assert_called_once_with(DynamicTwitterStream.STOP_TIMEOUT)
+
+    def test_shutdown(self):
+
+        # Start the stream with a term
+        self.term_list.append("hello")
+        self.stream.start_stream()
+
+        self.stream.shutdown(timeout=5)
+
+        # Should stop accepting tweets and stop streaming
+        self.listener.set_terminate.assert_called_once_with()
+        self.tweepy_stream_instance.disconnect.assert_called_once_with()
+        self.assertFalse(self.stream.polling)
+
+        # Should let the listener drain within the deadline
+        self.assertEqual(self.listener.close.call_count, 1)
+        args, kwargs = self.listener.close.call_args
+        self.assertTrue(0 <= kwargs['timeout'] <= 5)
+
     def test_update_stream_terms_unchanged(self):
 
         self.checker.check.return_value = False
@@ -147,6 +230,29 @@ class TestDynamicTwitterStream(TestCase):
         # Should NOT have started a new stream
         self.assertEqual(self.stream.start_stream.call_count, 0)
 
+        # Nor said it is live, with no stream connected
+        self.assertEqual(self.checker.on_stream_live.call_count, 0)
+
+    def test_update_stream_unchanged_is_live(self):
+        self.checker.check.return_value = False
+        self.listener.on_connect()
+        self.checker.on_stream_live.reset_mock()
+
+        self.stream.update_stream()
+        self.checker.on_stream_live.assert_called_once_with()
+
+    def test_connect_while_checking_not_live(self):
+        # A stream connecting during a check that replaces it isn't live
+        def check():
+            self.listener.on_connect()
+            return True
+        self.checker.check.side_effect = check
+        self.stream.start_stream = mock.Mock()
+        self.stream.stop_stream = mock.Mock()
+
+        self.stream.update_stream()
+        self.assertEqual(self.checker.on_stream_live.call_count, 0)
+
     def test_update_stream_terms_changed(self):
 
         self.checker.check.return_value = True
@@ -165,6 +271,11 @@ class TestDynamicTwitterStream(TestCase):
         # Should have started a new stream
         self.stream.start_stream.assert_called_once_with()
 
+        # But it isn't live until it connects
+        self.assertEqual(self.checker.on_stream_live.call_count, 0)
+        self.listener.on_connect()
+        self.checker.on_stream_live.assert_called_once_with()
+
     def test_update_stream_after_error(self):
 
         # Start the stream with a term
@@ -266,5 +377,29 @@ class TestDynamicTwitterStream(TestCase):
         self.assertTrue(self.stream.update_stream.call_count >= 1, "Checked for stream/term updates")
         self.assertTrue(self.stream.handle_exceptions.call_count >= 1, "Checked for stream exceptions")
 
+    def test_wake(self):
+        self.stream.update_stream = mock.Mock()
+        self.stream.handle_exceptions = mock.Mock()
+
+        # Poll only every minute
+        thread = threading.Thread(target=self.stream.start_polling, args=[60])
+        thread.start()
 
+        waits = 0
+        while self.stream.update_stream.call_count < 1 and waits < 20:
+            time.sleep(0.05)
+            waits += 1
+
+        self.stream.wake()
+
+        waits = 0
+        while self.stream.update_stream.call_count < 2 and waits < 20:
+            time.sleep(0.05)
+            waits += 1
+
+        self.stream.stop_polling()
+        thread.join(timeout=2)
 
+        self.assertEqual(self.stream.update_stream.call_count, 2, "Checked again when woken")
+        self.assertFalse(thread.is_alive(), "Stopping does not wait out the interval")
+        self.checker.attach.assert_called_once_with(self.stream)
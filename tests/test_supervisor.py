@@ -0,0 +1,233 @@
+from unittest import TestCase
+import tempfile
+import logging
+import shutil
+import time
+import json
+import os
+import mock
+
+from twitter_monitor.supervisor import Supervisor, WorkerListener, run_worker
+from tests.helpers import RecordingListener, StaticTermChecker
+
+logger = logging.getLogger("twitter_monitor")
+
+
+def fake_worker(shard, credentials, terms, output, options):
+    """Sends one tweet per term it is given, with ids shared between workers"""
+    crash_file = options.get('crash_file')
+    while True:
+        message = terms.get()
+        if message is None:
+            return
+
+        if crash_file and shard == 0 and not os.path.exists(crash_file):
+            open(crash_file, 'w').close()
+            os._exit(3)
+
+        for term in message:
+            output.put((shard, 'status', term, json.dumps({'id': term, 'shard': shard})))
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+class TestSupervisor(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+        self.dir = tempfile.mkdtemp()
+        self.listener = RecordingListener()
+        self.checker = StaticTermChecker(["a", "b", "c", "d"])
+        self.supervisor = None
+
+    def tearDown(self):
+        if self.supervisor is not None:
+            self.supervisor.shutdown(timeout=5)
+        shutil.rmtree(self.dir)
+
+    def make(self, credentials=2, **options):
+        supervisor = Supervisor([{}] * credentials, self.listener, self.checker,
+                                capacity=2, restart_delay=0, **options)
+        supervisor.target = staticmethod(fake_worker)
+        self.supervisor = supervisor
+        return supervisor
+
+    def test_requires_credentials(self):
+        self.assertRaises(ValueError, Supervisor, [], self.listener, self.checker)
+
+    def test_shards_terms_to_workers(self):
+        supervisor = self.make()
+        supervisor.start()
+        supervisor.update()
+
+        self.assertTrue(wait_for(lambda: len(self.listener.lines) == 4))
+        shards = dict((json.loads(line)['id'], json.loads(line)['shard']) for line in self.listener.lines)
+        self.assertEqual(shards, supervisor.assignments)
+
+        stats = supervisor.stats()
+        self.assertEqual([s['terms'] for s in stats], [2, 2])
+        self.assertEqual([s['received'] for s in stats], [2, 2])
+        self.assertTrue(all(s['alive'] for s in stats))
+
+    def test_only_changed_shards_are_sent(self):
+        supervisor = self.make()
+        supervisor.start()
+        supervisor.update()
+        self.assertTrue(wait_for(lambda: len(self.listener.lines) == 4))
+
+        moved = [term for term, shard in supervisor.assignments.items() if shard == 1]
+        self.checker.terms.discard(moved[0])
+        supervisor.update()
+
+        # Worker 1 resends its remaining term, which is a duplicate
+        self.assertTrue(wait_for(lambda: supervisor.stats()[1]['duplicates'] == 1))
+        self.assertEqual(len(self.listener.lines), 4)
+        self.assertEqual(supervisor.stats()[0]['received'], 2)
+
+    def test_restarts_crashed_workers(self):
+        supervisor = self.make(crash_file=os.path.join(self.dir, 'crashed'))
+        supervisor.start()
+        supervisor.update()
+
+        first = supervisor.workers[0].process
+        self.assertTrue(wait_for(lambda: not first.is_alive()))
+        self.assertEqual(first.exitcode, 3)
+
+        supervisor.update()
+        stats = supervisor.stats()
+        self.assertEqual(stats[0]['restarts'], 1)
+        self.assertTrue(stats[0]['alive'])
+
+        # The new worker gets its terms again
+        self.assertTrue(wait_for(lambda: supervisor.stats()[0]['received'] == 2))
+
+    def test_fails_over_rate_limited_workers(self):
+        supervisor = self.make()
+        supervisor.start()
+        supervisor.update()
+        moved = set(term for term, shard in supervisor.assignments.items() if shard == 0)
+
+        supervisor.output.put((0, 'error', 420))
+        self.assertTrue(wait_for(lambda: supervisor.stats()[0]['rate_limited']))
+
+        with mock.patch('twitter_monitor.supervisor.time', return_value=1000.0):
+            supervisor.update()
+
+        self.assertEqual(set(supervisor.assignments.values()), set([1]))
+        self.assertEqual(supervisor.unassigned, moved, "Worker 1 is already full")
+        self.assertEqual(supervisor.workers[0].limited_until, 1060.0)
+
+    def test_crash_backoff(self):
+        supervisor = Supervisor([{}], self.listener, self.checker, restart_delay=5,
+                                max_restart_delay=30, stable_after=60)
+        supervisor._start_worker = mock.Mock()
+        worker = supervisor.workers[0]
+        worker.process = mock.Mock(exitcode=1)
+        worker.process.is_alive.return_value = False
+        worker.started_at = 1000.0
+
+        # Waits from when it was seen to exit, not from the last restart
+        supervisor.check_workers(now=1010.0)
+        self.assertEqual(worker.next_start, 1015.0)
+        supervisor.check_workers(now=1014.0)
+        self.assertEqual(worker.restarts, 0)
+        supervisor.check_workers(now=1015.0)
+        self.assertEqual(worker.restarts, 1)
+
+        # Dying again soon after starting doubles the delay, up to the maximum
+        delays = []
+        for restart in range(4):
+            supervisor.check_workers(now=worker.started_at + 1)
+            delays.append(worker.restart_delay)
+            supervisor.check_workers(now=worker.next_start)
+        self.assertEqual(delays, [10, 20, 30, 30])
+
+        # Running for a while starts over
+        supervisor.check_workers(now=worker.started_at + 60)
+        self.assertEqual(worker.restart_delay, 5)
+
+    def test_rate_limit_backoff_starts_over(self):
+        supervisor = Supervisor([{}], self.listener, self.checker, rate_limit_backoff=60, stable_after=100)
+        worker = supervisor.workers[0]
+        worker.process = mock.Mock()
+
+        worker.rate_limited = True
+        supervisor.check_workers(now=1000.0)
+        supervisor.check_workers(now=1060.0)
+        self.assertEqual(worker.backoff, 120)
+
+        supervisor.check_workers(now=1159.0)
+        self.assertEqual(worker.backoff, 120)
+        supervisor.check_workers(now=1160.0)
+        self.assertIsNone(worker.backoff)
+
+    def test_shutdown(self):
+        supervisor = self.make()
+        supervisor.start()
+        supervisor.update()
+        self.assertTrue(wait_for(lambda: len(self.listener.lines) == 4))
+
+        supervisor.shutdown(timeout=5)
+        self.supervisor = None
+
+        self.assertTrue(self.listener.closed)
+        for worker in supervisor.workers:
+            self.assertFalse(worker.process.is_alive())
+
+
+class TestWorker(TestCase):
+    def setUp(self):
+        logger.manager.disable = logging.CRITICAL
+
+    def test_listener_sends_raw_statuses(self):
+        output = mock.Mock()
+        listener = WorkerListener(3, output)
+
+        raw = json.dumps({'id': 7, 'in_reply_to_status_id': None}) + '\r\n'
+        listener.on_data(raw)
+        listener.on_data(json.dumps({'limit': {'track': 12}}))
+        self.assertFalse(listener.on_error(420))
+
+        output.put.assert_has_calls([mock.call((3, 'status', 7, raw.strip())),
+                                     mock.call((3, 'limit', 12)),
+                                     mock.call((3, 'error', 420))])
+
+    @mock.patch('tweepy.Stream')
+    def test_run_worker(self, MockTweepyStream):
+        try:
+            from queue import Queue
+        except ImportError:
+            from Queue import Queue
+
+        terms = Queue()
+        terms.put(["x", "y"])
+
+        def stop_when_streaming(*args, **kwargs):
+            terms.put(None)
+        MockTweepyStream.return_value.filter.side_effect = stop_when_streaming
+
+        credentials = dict(api_key='k', api_secret='s', access_token='t', access_token_secret='ts')
+        with mock.patch('twitter_monitor.stream.DynamicTwitterStream.STOP_TIMEOUT', 0):
+            run_worker(0, credentials, terms, mock.Mock(), {'poll_interval': 0.05})
+
+        filter_call = MockTweepyStream.return_value.filter.call_args
+        self.assertEqual(sorted(filter_call[1]['track']), ["x", "y"])
+        MockTweepyStream.return_value.disconnect.assert_called_with()
+
+    @mock.patch('tweepy.Stream')
+    def test_run_worker_stopped_early(self, MockTweepyStream):
+        try:
+            from queue import Queue
+        except ImportError:
+            from Queue import Queue
+
+        terms = Queue()
+        terms.put(None)
+
+        credentials = dict(api_key='k', api_secret='s', access_token='t', access_token_secret='ts')
+        run_worker(0, credentials, terms, mock.Mock(), {'poll_interval': 0.05})
+        self.assertFalse(MockTweepyStream.called)
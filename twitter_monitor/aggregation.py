@@ -0,0 +1,214 @@
+"""
+Live per-term tweet volumes over sliding time windows.
+"""
+
+import time
+import array
+import heapq
+import logging
+import threading
+
+from .pipeline import Stage
+from .matching import TermMatcher
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['TermVolumeAggregator']
+
+
+class _Window(object):
+    """
+    A ring of per-bucket counts for one term, with a running
+    total for each window. It is caught up lazily, whenever it
+    is touched, so idle terms cost nothing until then. Catching
+    up takes time in proportion to the buckets passed since,
+    but never more than the ring holds.
+    """
+
+    __slots__ = ('counts', 'totals', 'tick')
+
+    def __init__(self, buckets, windows, tick):
+        self.counts = array.array('l', [0]) * buckets
+        self.totals = [0] * len(windows)
+        self.tick = tick
+
+    def advance(self, tick, windows):
+        elapsed = tick - self.tick
+        if elapsed <= 0:
+            return
+
+        counts = self.counts
+        buckets = len(counts)
+        if elapsed >= buckets:
+            # Everything has expired
+            for position in range(buckets):
+                counts[position] = 0
+            for position in range(len(self.totals)):
+                self.totals[position] = 0
+        else:
+            totals = self.totals
+            for step in range(self.tick + 1, tick + 1):
+                # Drop the bucket that just left each window
+                for position, length in enumerate(windows):
+                    totals[position] -= counts[(step - length) % buckets]
+                counts[step % buckets] = 0
+
+        self.tick = tick
+
+    def add(self, count):
+        self.counts[self.tick % len(self.counts)] += count
+        totals = self.totals
+        for position in range(len(totals)):
+            totals[position] += count
+
+
+class TermVolumeAggregator(Stage):
+    """
+    Counts tweets per tracked term over sliding windows,
+    by default the last 1 minute, 5 minutes and 1 hour.
+
+    Counts are kept in rings of buckets resolution seconds wide.
+    Recording a tweet and asking for a term's count or rate first
+    clear the buckets that have passed since the term was last
+    touched, so they take constant time for busy terms, and at most
+    the longest window (in buckets) for terms that have been idle.
+
+    Terms come from the term checker (or sync_terms()), and
+    each status is counted for the terms it matched: its
+    'matched_terms' if an AttributionStage came first, or else
+    this stage works them out itself.
+    """
+
+    def __init__(self, term_checker=None, windows=(60, 300, 3600), resolution=1, clock=time.time):
+        self.term_checker = term_checker
+        self.window_seconds = tuple(windows)
+        self.resolution = resolution
+        self.clock = clock
+
+        # Window lengths in buckets
+        self.windows = tuple(max(1, int(round(float(seconds) / resolution))) for seconds in windows)
+        self.buckets = max(self.windows)
+
+        self.matcher = TermMatcher(term_checker)
+        self.terms = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+        # Everything received, and everything Twitter reported as
+        # withheld by limit notices, which count up from each connection
+        tick = self._tick()
+        self.received = _Window(self.buckets, self.windows, tick)
+        self.lost = _Window(self.buckets, self.windows, tick)
+        self._last_limit = 0
+
+    def _tick(self, now=None):
+        if now is None:
+            now = self.clock()
+        return int(now // self.resolution)
+
+    def _window_index(self, window):
+        try:
+            return self.window_seconds.index(window)
+        except ValueError:
+            raise ValueError("Not an aggregated window: %s" % window)
+
+    def sync_terms(self, terms):
+        """Start counting new terms and forget removed ones"""
+        tick = self._tick()
+        with self._lock:
+            terms = set(terms)
+            for term in list(self.terms):
+                if term not in terms:
+                    del self.terms[term]
+            for term in terms:
+                if term not in self.terms:
+                    self.terms[term] = _Window(self.buckets, self.windows, tick)
+
+    def _check_terms(self):
+        checker = self.term_checker
+        if checker is not None and checker.version != self._version:
+            self._version = checker.version
+            self.sync_terms(checker.tracking_terms())
+
+    def observe(self, terms, now=None, count=1):
+        """Count a tweet for the given terms"""
+        tick = self._tick(now)
+        with self._lock:
+            for term in terms:
+                window = self.terms.get(term)
+                if window is not None:
+                    window.advance(tick, self.windows)
+                    window.add(count)
+
+    def process(self, status):
+        self._check_terms()
+
+        terms = status.get('matched_terms')
+        if terms is None:
+            terms = self.matcher.match(status)
+        self.observe(terms)
+
+        tick = self._tick()
+        with self._lock:
+            self.received.advance(tick, self.windows)
+            self.received.add(1)
+        return status
+
+    def on_limit(self, track):
+        tick = self._tick()
+        with self._lock:
+            if track >= self._last_limit:
+                lost = track - self._last_limit
+            else:
+                # A new connection started counting again
+                lost = track
+            self._last_limit = track
+
+            self.lost.advance(tick, self.windows)
+            self.lost.add(lost)
+
+    def _total(self, counts, window, now):
+        position = self._window_index(window)
+        tick = self._tick(now)
+        with self._lock:
+            counts.advance(tick, self.windows)
+            return counts.totals[position]
+
+    def received_count(self, window=60, now=None):
+        """Statuses received in the last window seconds"""
+        return self._total(self.received, window, now)
+
+    def lost_count(self, window=60, now=None):
+        """Statuses withheld by limit notices in the last window seconds"""
+        return self._total(self.lost, window, now)
+
+    def count(self, term, window=60, now=None):
+        """Tweets for term in the last window seconds"""
+        position = self._window_index(window)
+        tick = self._tick(now)
+        with self._lock:
+            counts = self.terms.get(term)
+            if counts is None:
+                return 0
+            counts.advance(tick, self.windows)
+            return counts.totals[position]
+
+    def rate(self, term, window=60, now=None):
+        """Tweets per second for term over the last window seconds"""
+        return float(self.count(term, window, now)) / window
+
+    def counts(self, window=60, now=None):
+        """A dict of the count for every term in the last window seconds"""
+        position = self._window_index(window)
+        tick = self._tick(now)
+        with self._lock:
+            result = {}
+            for term, counts in self.terms.items():
+                counts.advance(tick, self.windows)
+                result[term] = counts.totals[position]
+            return result
+
+    def top(self, k=10, window=60, now=None):
+        """The k busiest terms over the last window seconds, as (term, count) pairs"""
+        counts = self.counts(window, now)
+        return heapq.nlargest(k, counts.items(), key=lambda item: item[1])
@@ -0,0 +1,472 @@
+"""
+An asyncio version of DynamicTwitterStream, for Python 3.6+.
+
+Each stream is a task on the event loop rather than a thread,
+so many connections can share one loop.
+"""
+
+import asyncio
+import inspect
+import logging
+import ssl
+
+from urllib.parse import urlencode, urlsplit
+
+from .checker import TermChecker
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['AsyncTwitterStream', 'AsyncTermChecker', 'open_stream']
+
+FILTER_URL = 'https://stream.twitter.com/1.1/statuses/filter.json'
+SAMPLE_URL = 'https://stream.twitter.com/1.1/statuses/sample.json'
+
+USER_AGENT = 'twitter-monitor'
+
+
+async def maybe_await(value):
+    """Waits for value if it is awaitable, so hooks can be plain or async"""
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncTermChecker(TermChecker):
+    """
+    A TermChecker whose update_tracking_terms() is a coroutine,
+    for terms kept somewhere that needs async access.
+
+    This is intended to be extended.
+    """
+
+    async def update_tracking_terms(self):
+        return set(['#afakehashtag'])
+
+    async def check(self):
+        """
+        Checks if the list of tracked terms has changed.
+        Returns True if changed, otherwise False.
+        """
+        new_tracking_terms = await self.update_tracking_terms()
+
+        terms_changed = new_tracking_terms != self._tracking_terms_set
+        self._tracking_terms_set = new_tracking_terms
+        if terms_changed:
+            self.version += 1
+        return terms_changed
+
+
+class StreamResponse(object):
+    """The status, headers and body of a streaming HTTP response"""
+
+    def __init__(self, status, headers, reader, writer, timeout):
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+
+    async def _read(self, read, *args):
+        return await asyncio.wait_for(read(*args), self.timeout)
+
+    async def chunks(self):
+        """The body, as it arrives"""
+        reader = self.reader
+
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await self._read(reader.readline)
+                if not size_line:
+                    return
+                size = int(size_line.split(b';')[0].strip(), 16)
+                if size == 0:
+                    return
+
+                # The chunk is followed by \r\n
+                chunk = await self._read(reader.readexactly, size + 2)
+                yield chunk[:-2]
+
+        else:
+            remaining = self.headers.get('content-length')
+            remaining = int(remaining) if remaining is not None else None
+            while remaining is None or remaining > 0:
+                chunk = await self._read(reader.read, 65536 if remaining is None else min(65536, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def lines(self):
+        """The body split into lines, without their line endings"""
+        pending = []
+        async for chunk in self.chunks():
+            start = 0
+            while True:
+                end = chunk.find(b'\n', start)
+                if end < 0:
+                    if start < len(chunk):
+                        pending.append(chunk[start:])
+                    break
+
+                pending.append(chunk[start:end])
+                line = b''.join(pending)
+                pending = []
+                start = end + 1
+
+                yield line.rstrip(b'\r')
+
+        if pending:
+            yield b''.join(pending)
+
+    async def read(self):
+        """The whole body"""
+        return b''.join([chunk async for chunk in self.chunks()])
+
+    def close(self):
+        self.writer.close()
+
+
+def _sign(auth, method, url, body, headers):
+    """OAuth sign a request using a tweepy auth handler"""
+    if auth is None:
+        return url, headers, body
+    oauth = auth.apply_auth()
+    return oauth.client.sign(url, http_method=method, body=body, headers=headers)
+
+
+async def open_stream(method, url, params=None, auth=None, timeout=90, headers=None):
+    """
+    Makes an HTTP/1.1 request, signed with auth (a tweepy auth handler)
+    if one is given, and returns a StreamResponse once the headers are in.
+    """
+    request_headers = {'User-Agent': USER_AGENT}
+    request_headers.update(headers or {})
+
+    body = None
+    if params:
+        if method == 'POST':
+            body = urlencode(params)
+            request_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        else:
+            url = '%s?%s' % (url, urlencode(params))
+
+    url, request_headers, body = _sign(auth, method, url, body, request_headers)
+
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=ssl.create_default_context() if secure else None),
+        timeout)
+
+    body = body.encode('utf8') if body else b''
+    request_headers['Host'] = parts.netloc
+    request_headers['Content-Length'] = str(len(body))
+    request_headers['Connection'] = 'close'
+
+    request = ['%s %s HTTP/1.1' % (method, path)]
+    request.extend('%s: %s' % item for item in request_headers.items())
+    writer.write(('\r\n'.join(request) + '\r\n\r\n').encode('latin-1') + body)
+
+    try:
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        if not status_line:
+            raise ConnectionError("Connection closed before a response")
+        status = int(status_line.split()[1])
+
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            line = line.decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+    except BaseException:
+        writer.close()
+        raise
+
+    return StreamResponse(status, response_headers, reader, writer, timeout)
+
+
+class AsyncTwitterStream(object):
+    """
+    Like DynamicTwitterStream, but runs on an asyncio event loop.
+
+    Checkers are TermCheckers as usual, or AsyncTermCheckers.
+    The listener is a JsonStreamListener as usual, but any of its
+    hooks (on_status and the rest, and close) may be coroutines.
+    They are awaited before the next message is read.
+
+    Run start_polling() as a task, and call stop_polling() (from any
+    thread) or await shutdown() to stop. Several streams can run
+    on the same loop, each with its own connection.
+    """
+
+    # Number of seconds to wait for the stream to stop
+    STOP_TIMEOUT = 1
+
+    def __init__(self, auth, listener, term_checker, **options):
+        self.auth = auth
+        self.listener = listener
+        self.term_checker = term_checker
+
+        self.polling = False
+        self.task = None
+        self.connected = False
+        self._checking = False
+        self._loop = None
+        self._wakeup = None
+
+        self.retry_count = options.get('retry_count', 5)
+        self.retry_time = options.get('retry_time', 5.0)
+        self.retry_420_time = options.get('retry_420_time', 60.0)
+        self.snooze_time = options.get('snooze_time', 0.25)
+        self.timeout = options.get('timeout', 90)
+        self.unfiltered = options.get('unfiltered', False)
+        self.languages = options.get('languages', None)
+        self.follow_checker = options.get('follow_checker', None)
+        self.location_checker = options.get('location_checker', None)
+        self.filter_url = options.get('filter_url', FILTER_URL)
+        self.sample_url = options.get('sample_url', SAMPLE_URL)
+
+    def checkers(self):
+        """All of the checkers in use"""
+        return [checker for checker in (self.term_checker, self.follow_checker, self.location_checker)
+                if checker is not None]
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    async def start_polling(self, interval):
+        """
+        Start polling for term updates and streaming.
+        Returns once stop_polling() is called and the stream has stopped.
+        """
+        interval = float(interval)
+
+        self._loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        self.polling = True
+
+        for checker in self.checkers():
+            checker.reset()
+            checker.attach(self)
+
+        logger.info("Starting polling for changes to the track list")
+        try:
+            while self.polling:
+                loop_start = self._loop.time()
+                self._wakeup.clear()
+
+                await self.update_stream()
+                self.handle_exceptions()
+
+                elapsed = self._loop.time() - loop_start
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(0.1, interval - elapsed))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.stop_stream()
+
+        logger.warning("Term poll ceased!")
+
+    def wake(self):
+        """Check for changes now instead of waiting out the interval"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stop_polling(self):
+        """Halts the polling loop, which then stops the stream"""
+        logger.info("Stopping polling loop")
+        self.polling = False
+        self.wake()
+
+    async def update_stream(self):
+        """
+        Restarts the stream with the current list of tracking terms.
+        """
+        # A connection made while checking is reported below instead,
+        # since its terms may be about to be replaced
+        self._checking = True
+        try:
+            need_to_restart = False
+
+            if self.task is not None and self.task.done():
+                logger.warning("Stream exists but isn't running")
+                self.listener.error = False
+                self.listener.streaming_exception = None
+                need_to_restart = True
+
+            if await maybe_await(self.term_checker.check()):
+                logger.info("Terms have changed")
+                need_to_restart = True
+
+            if self.follow_checker is not None and await maybe_await(self.follow_checker.check()):
+                logger.info("Followed users have changed")
+                need_to_restart = True
+
+            if self.location_checker is not None and await maybe_await(self.location_checker.check()):
+                logger.info("Locations have changed")
+                need_to_restart = True
+
+            if self.task is None and self.unfiltered:
+                need_to_restart = True
+
+            if need_to_restart:
+                logger.info("Restarting stream...")
+                await self.stop_stream()
+        finally:
+            self._checking = False
+
+        if not need_to_restart:
+            # The running stream already has the checked terms
+            if self.connected:
+                self.notify_live()
+            return
+
+        # Start a new stream, and the checkers hear when it connects
+        self.start_stream()
+
+    def notify_live(self):
+        """Tell the checkers the stream is connected with the terms from their last check"""
+        for checker in self.checkers():
+            checker.on_stream_live()
+
+    def start_stream(self):
+        """Starts a stream task with the current tracking terms"""
+        tracking_terms = self.term_checker.tracking_terms()
+
+        follow = []
+        if self.follow_checker is not None:
+            follow = [str(user_id) for user_id in self.follow_checker.tracking_terms()]
+
+        locations = []
+        if self.location_checker is not None:
+            for box in self.location_checker.tracking_terms():
+                locations.extend(box)
+
+        params = {'stall_warnings': 'true'}
+        if self.languages:
+            params['language'] = ','.join(self.languages)
+
+        if len(tracking_terms) > 0:
+            params['track'] = ','.join(tracking_terms)
+        if len(follow) > 0:
+            params['follow'] = ','.join(follow)
+        if len(locations) > 0:
+            params['locations'] = ','.join('%.4f' % value for value in locations)
+
+        if 'track' in params or 'follow' in params or 'locations' in params:
+            logger.info("Starting new twitter stream with %s terms, %s users and %s locations",
+                        len(tracking_terms), len(follow), len(locations) // 4)
+            self.task = asyncio.ensure_future(self._run('POST', self.filter_url, params))
+        elif self.unfiltered:
+            logger.info("Starting new unfiltered stream")
+            self.task = asyncio.ensure_future(self._run('GET', self.sample_url, params))
+
+    async def stop_stream(self):
+        """Cancels the current stream, waiting for it to finish"""
+        if self.task is not None:
+            logger.warning("Stopping twitter stream...")
+            task = self.task
+            self.task = None
+            self.connected = False
+
+            task.cancel()
+            try:
+                await asyncio.wait_for(task, self.STOP_TIMEOUT)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+
+    async def _run(self, method, url, params):
+        """Connects, and reconnects, delivering messages to the listener"""
+        listener = self.listener
+        errors = 0
+        retry_time = self.retry_time
+
+        try:
+            while errors <= self.retry_count:
+                try:
+                    response = await open_stream(method, url, params, self.auth, timeout=self.timeout)
+                except (OSError, asyncio.TimeoutError) as e:
+                    logger.warning("Could not connect: %s", e)
+                    errors += 1
+                    await asyncio.sleep(retry_time)
+                    continue
+
+                try:
+                    if response.status != 200:
+                        if await maybe_await(listener.on_error(response.status)) is False:
+                            return
+                        errors += 1
+                        if response.status == 420:
+                            retry_time = max(retry_time, self.retry_420_time)
+                        await asyncio.sleep(retry_time)
+                        retry_time *= 2
+                        continue
+
+                    errors = 0
+                    retry_time = self.retry_time
+                    await maybe_await(listener.on_connect())
+                    self.connected = True
+                    if not self._checking:
+                        self.notify_live()
+
+                    async for line in response.lines():
+                        if not line:
+                            # Keep-alive newlines are expected
+                            listener.keep_alive()
+                            continue
+
+                        if await maybe_await(listener.on_data(line.decode('utf8'))) is False:
+                            return
+
+                    logger.warning("Stream closed by the server, reconnecting")
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    logger.warning("Stream interrupted: %s", e)
+                    if await maybe_await(listener.on_timeout()) is False:
+                        return
+                finally:
+                    response.close()
+
+                errors += 1
+                await asyncio.sleep(self.snooze_time)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            listener.on_exception(e)
+
+    def handle_exceptions(self):
+        # check to see if an exception was raised in the streaming task
+        if self.listener.streaming_exception is not None:
+            exc = self.listener.streaming_exception
+            self.listener.streaming_exception = None
+
+            logger.warning("Streaming exception: %s", exc)
+            raise exc
+
+    async def shutdown(self, timeout=None):
+        """
+        Stop accepting tweets, halt polling and streaming,
+        and then give the listener until the deadline to drain.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = asyncio.get_event_loop().time() + float(timeout)
+
+        logger.info("Shutting down stream")
+        self.listener.set_terminate()
+        self.stop_polling()
+        await self.stop_stream()
+
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - asyncio.get_event_loop().time())
+
+        await maybe_await(self.listener.close(timeout=remaining))
@@ -7,6 +7,7 @@ a stream to stdout.
 import os
 import signal
 import logging
+import threading
 import time
 import json
 
@@ -14,16 +15,34 @@ import tweepy
 from .listener import JsonStreamListener
 from .checker import FileTermChecker
 from .stream import DynamicTwitterStream
+from .output import DurableFileWriter, atomic_write
+from .supervisor import Supervisor
+from .retweets import RetweetCollapser
+from .profiling import Profiler, set_profile_listener
+from .memory import MemoryMonitor
 
 logger = logging.getLogger(__name__)
 
 __all__ = ['start']
 
+# Set once a shutdown signal has been received
+_shutdown_requested = threading.Event()
+
+# The final stats record is written next to the output file, with this added
+STATS_SUFFIX = '.stats.json'
+
 
 class PrintingListener(JsonStreamListener):
-    """A listener that writes to a file or stdout"""
+    """
+    A listener that writes to a file or stdout.
 
-    def __init__(self, api=None, out=None):
+    If a collapser (a retweets.RetweetCollapser) is given,
+    retweets are written as references to their originals.
+
+    With a stats_path, close() writes a final stats record there as JSON.
+    """
+
+    def __init__(self, api=None, out=None, collapser=None, stats_path=None):
         super(PrintingListener, self).__init__(api)
         if out is None:
             import sys
@@ -31,24 +50,67 @@ class PrintingListener(JsonStreamListener):
             out = sys.stdout
 
         self.out = out
-        self.terminate = False
+        self.collapser = collapser
+        self.stats_path = stats_path
         self.received = 0
-        self.since = time.time()
+        self.total = 0
+        self.started = self.since = time.time()
 
     def on_status(self, status):
         """Print out some tweets"""
-        self.out.write(json.dumps(status))
-        self.out.write(os.linesep)
+        if self.collapser is not None:
+            for record in self.collapser.collapse(status):
+                self.out.write(json.dumps(record) + os.linesep)
+        else:
+            self.out.write(json.dumps(status) + os.linesep)
 
         self.received += 1
+        self.total += 1
         return not self.terminate
 
-    def set_terminate(self):
-        """Notify the tweepy stream that it should quit"""
-        self.terminate = True
+    def write_raw(self, raw):
+        """Print out a tweet that is already JSON, as sent by supervised workers"""
+        if self.collapser is not None:
+            for record in self.collapser.collapse(json.loads(raw)):
+                self.out.write(json.dumps(record) + os.linesep)
+        else:
+            self.out.write(raw + os.linesep)
+
+        self.received += 1
+        self.total += 1
+
+    def close(self, timeout=None):
+        """Flush and sync the output, then log and write final statistics"""
+        self.out.flush()
+        try:
+            os.fsync(self.out.fileno())
+        except (AttributeError, IOError, OSError, ValueError):
+            # Not a real file (or a terminal), nothing to sync
+            pass
+
+        self.print_status()
+        logger.info("Wrote %d tweets in total", self.total)
+        if self.stats_path is not None:
+            self.write_stats(self.stats_path)
+
+    def write_stats(self, path):
+        """Atomically write a stats record for the whole run"""
+        finished = time.time()
+        stats = {
+            'tweets': self.total,
+            'started_at': self.started,
+            'finished_at': finished,
+            'tps': self.total / (finished - self.started) if finished > self.started else 0.0,
+            'terminated': self.terminate,
+        }
+
+        atomic_write(path, json.dumps(stats) + os.linesep)
+
+    def print_status(self, stream=None):
+        """Print out the current tweet rate and reset the counter, and the stream's compression"""
+        # Durable outputs commit here if no tweets have arrived for a while
+        self.out.flush()
 
-    def print_status(self):
-        """Print out the current tweet rate and reset the counter"""
         tweets = self.received
         now = time.time()
         diff = now - self.since
@@ -57,6 +119,10 @@ class PrintingListener(JsonStreamListener):
         if diff > 0:
             logger.info("Receiving tweets at %s tps", tweets / diff)
 
+        if getattr(stream, 'compressed_bytes', 0):
+            logger.info("Received %d compressed bytes as %d bytes (%.1fx)",
+                        stream.compressed_bytes, stream.decompressed_bytes, stream.compression_ratio())
+
 
 class BasicFileTermChecker(FileTermChecker):
     """Modified to print out status periodically"""
@@ -65,10 +131,13 @@ class BasicFileTermChecker(FileTermChecker):
         logger.info("Monitoring track file %s", filename)
         super(BasicFileTermChecker, self).__init__(filename)
         self.listener = listener
+        self.stream = None
 
+    def attach(self, stream):
+        self.stream = stream
 
     def update_tracking_terms(self):
-        self.listener.print_status()
+        self.listener.print_status(self.stream)
         return super(BasicFileTermChecker, self).update_tracking_terms()
 
 
@@ -101,22 +170,34 @@ def set_debug_listener(stream):
     else:
         logger.warn("Cannot set SIGUSR1 signal for debug mode.")
 
-def terminate(listener):
+def terminate(stream):
     """
-    Exit cleanly.
+    Begin a graceful shutdown: stop accepting tweets and halt
+    polling so that the stream loop exits and the listener can drain.
+    A second signal exits immediately.
+
+    This runs in a signal handler, so it only sets flags and wakes
+    the polling loop. The main thread stops the stream in shutdown().
     """
+    if _shutdown_requested.is_set():
+        logger.warning("Second signal received, exiting immediately")
+        raise SystemExit(1)
+
     logger.info("Stopping because of signal")
+    _shutdown_requested.set()
 
     # Let the tweet listener know it should be quitting asap
-    listener.set_terminate()
-
-    raise SystemExit()
+    stream.listener.set_terminate()
+    stream.polling = False
+    stream.wake()
 
 def set_terminate_listeners(stream):
-    """Die on SIGTERM or SIGINT"""
+    """Shut down gracefully on SIGTERM or SIGINT"""
+
+    _shutdown_requested.clear()
 
     def stop(signum, frame):
-        terminate(stream.listener)
+        terminate(stream)
 
     # Installs signal handlers for handling SIGINT and SIGTERM
     # gracefully.
@@ -134,18 +215,42 @@ def get_tweepy_auth(twitter_api_key,
     return auth
 
 
-def construct_listener(outfile=None):
-    """Create the listener that prints tweets"""
-    if outfile is not None:
+def construct_listener(outfile=None, durable=False, commit_every=1000, commit_interval=1.0,
+                       collapse_retweets=False, retweet_cache_size=100000):
+    """
+    Create the listener that prints tweets.
+
+    In durable mode an existing outfile is recovered and appended to,
+    and writes are synced to disk every commit_every tweets or
+    commit_interval seconds.
+
+    With collapse_retweets, retweets are written as references to
+    originals, remembering the last retweet_cache_size tweets written.
+
+    With an outfile, the final stats record goes next to it, in
+    outfile + STATS_SUFFIX.
+    """
+    stats_path = outfile + STATS_SUFFIX if outfile is not None else None
+    if durable:
+        if outfile is None:
+            raise ValueError("Durable output requires an output file")
+
+        outfile = DurableFileWriter(outfile,
+                                    commit_every=commit_every,
+                                    commit_interval=commit_interval)
+
+    elif outfile is not None:
         if os.path.exists(outfile):
             raise IOError("File %s already exists" % outfile)
         
         outfile = open(outfile, 'wb')
 
-    return PrintingListener(out=outfile)
+    if collapse_retweets:
+        return PrintingListener(out=outfile, collapser=RetweetCollapser(retweet_cache_size), stats_path=stats_path)
+    return PrintingListener(out=outfile, stats_path=stats_path)
 
 def should_continue():
-    return True
+    return not _shutdown_requested.is_set()
 
 def begin_stream_loop(stream, poll_interval):
     """Start and maintain the streaming connection..."""
@@ -167,20 +272,89 @@ def start(track_file,
           unfiltered=False,
           languages=None,
           debug=False,
-          outfile=None):
-    """Start the stream."""
-    listener = construct_listener(outfile)
+          outfile=None,
+          shutdown_timeout=10,
+          durable=False,
+          commit_every=1000,
+          commit_interval=1.0,
+          workers=1,
+          credentials=None,
+          collapse_retweets=False,
+          profile_dir=None,
+          profile_mode='sample',
+          memory_interval=None,
+          memory_frames=1,
+          gzip=False):
+    """
+    Start the stream.
+
+    With a profile_dir, hook timings are kept, and SIGUSR2 switches
+    profiling (see twitter_monitor.profiling) on and off, writing
+    the results to profile_dir. The timings are written there on exit too.
+
+    With a memory_interval, memory growth since the start is logged
+    every memory_interval seconds (see twitter_monitor.memory),
+    keeping memory_frames frames of each allocation's traceback.
+
+    With gzip, streams are requested compressed and read
+    with twitter_monitor.reader.FastStream.
+
+    With more than one worker, each runs in its own process with its
+    own share of the terms, using the given credentials first and then
+    those in the credentials list (dicts with api_key, api_secret,
+    access_token and access_token_secret).
+    """
+    if workers > 1:
+        credentials = [dict(api_key=twitter_api_key,
+                            api_secret=twitter_api_secret,
+                            access_token=twitter_access_token,
+                            access_token_secret=twitter_access_token_secret)] + list(credentials or [])
+        if len(credentials) < workers:
+            raise ValueError("%d workers need %d sets of credentials, but there are %d" %
+                             (workers, workers, len(credentials)))
+        if unfiltered:
+            raise ValueError("Unfiltered streaming cannot be split across workers")
+
+    listener = construct_listener(outfile,
+                                  durable=durable,
+                                  commit_every=commit_every,
+                                  commit_interval=commit_interval,
+                                  collapse_retweets=collapse_retweets)
     checker = BasicFileTermChecker(track_file, listener)
 
-    auth = get_tweepy_auth(twitter_api_key,
-                           twitter_api_secret,
-                           twitter_access_token,
-                           twitter_access_token_secret)
+    if workers > 1:
+        stream = Supervisor(credentials[:workers], listener, checker, languages=languages, gzip=gzip)
+    else:
+        auth = get_tweepy_auth(twitter_api_key,
+                               twitter_api_secret,
+                               twitter_access_token,
+                               twitter_access_token_secret)
 
-    stream = DynamicTwitterStream(auth, listener, checker, unfiltered=unfiltered, languages=languages)
+        stream = DynamicTwitterStream(auth, listener, checker, unfiltered=unfiltered, languages=languages,
+                                      gzip=gzip)
 
     set_terminate_listeners(stream)
     if debug:
         set_debug_listener(stream)
 
+    profiler = None
+    if profile_dir is not None:
+        profiler = Profiler(profile_dir, mode=profile_mode)
+        profiler.attach(stream)
+        set_profile_listener(profiler)
+
+    memory_monitor = None
+    if memory_interval is not None:
+        memory_monitor = MemoryMonitor(interval=memory_interval, frames=memory_frames)
+        memory_monitor.start()
+
     begin_stream_loop(stream, poll_interval)
+
+    # Drain and flush everything before exiting
+    stream.shutdown(timeout=shutdown_timeout)
+
+    if profiler is not None:
+        profiler.close()
+
+    if memory_monitor is not None:
+        memory_monitor.stop()
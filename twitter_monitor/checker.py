@@ -14,6 +14,9 @@ class TermChecker(object):
     def __init__(self):
         self._tracking_terms_set = set()
 
+        # Incremented whenever the set of tracked terms changes
+        self.version = 0
+
 
     def update_tracking_terms(self):
         """
@@ -29,6 +32,7 @@ class TermChecker(object):
         Clear the list of tracked terms.
         """
         self._tracking_terms_set = set()
+        self.version += 1
 
     def check(self):
         """
@@ -50,8 +54,15 @@ class TermChecker(object):
             logging.debug("Some tracking terms added")
             terms_changed = True
 
+        # some of each?
+        elif self._tracking_terms_set != new_tracking_terms:
+            logging.debug("Some tracking terms replaced")
+            terms_changed = True
+
         # Go ahead and store for later
         self._tracking_terms_set = new_tracking_terms
+        if terms_changed:
+            self.version += 1
 
         # If the terms changed, we need to restart the stream
         return terms_changed
@@ -62,6 +73,22 @@ class TermChecker(object):
         """
         return list(self._tracking_terms_set)
 
+    def attach(self, stream):
+        """
+        Called when a DynamicTwitterStream starts polling this checker.
+        Checkers that learn of changes themselves can keep the stream
+        and call its wake() method.
+        """
+        pass
+
+    def on_stream_live(self):
+        """
+        Called once the stream is running with the terms
+        from the last check: when a restarted stream has
+        connected, or when a check found nothing to change.
+        """
+        pass
+
 
 class FileTermChecker(TermChecker):
     """
@@ -90,3 +117,24 @@ class FileTermChecker(TermChecker):
                     new_terms.add(line)
 
             return set(new_terms)
+
+
+class FileLocationChecker(FileTermChecker):
+    """
+    Checks for tracked locations in a file, one bounding box per line
+    given as sw_lon,sw_lat,ne_lon,ne_lat. Invalid lines are skipped.
+    """
+
+    def update_tracking_terms(self):
+        boxes = set()
+        for line in super(FileLocationChecker, self).update_tracking_terms():
+            try:
+                box = tuple(float(value) for value in line.split(','))
+            except ValueError:
+                box = ()
+
+            if len(box) == 4 and box[0] <= box[2] and box[1] <= box[3]:
+                boxes.add(box)
+            else:
+                logger.warning("Skipping invalid bounding box %s", line)
+        return boxes
@@ -0,0 +1,445 @@
+"""
+Columnar output for analysis: a few projected fields of each
+status, written in row groups.
+
+Parquet is written if pyarrow is installed. Otherwise a simple
+self-contained format (.tcol) is used, which read_row_groups()
+and read_rows() read back. Existing NDJSON captures can be
+converted in parallel with convert(), or from the command line.
+
+Usage: python -m twitter_monitor.columnar OUTDIR FILE [FILE ...]
+"""
+
+import os
+import io
+import sys
+import gzip
+import json
+import zlib
+import array
+import struct
+import time
+import logging
+import threading
+import multiprocessing
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .listener import JsonStreamListener
+from .matching import TermMatcher, status_text
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['ColumnarListener', 'TcolWriter', 'read_row_groups', 'read_rows', 'convert_file', 'convert']
+
+
+def _user(status, key):
+    user = status.get('user')
+    if user:
+        return user.get(key)
+
+
+def _timestamp_ms(status):
+    timestamp = status.get('timestamp_ms')
+    if timestamp is not None:
+        return int(timestamp)
+
+
+def _hashtags(status):
+    entities = (status.get('extended_tweet') or {}).get('entities') or status.get('entities') or {}
+    return [hashtag['text'] for hashtag in entities.get('hashtags', ())]
+
+
+# The columns, with their kinds and how to get their values.
+# matched_terms is filled in separately.
+COLUMNS = (
+    ('id', 'int', lambda status: status['id']),
+    ('created_at', 'str', lambda status: status.get('created_at')),
+    ('timestamp_ms', 'int', _timestamp_ms),
+    ('user_id', 'int', lambda status: _user(status, 'id')),
+    ('screen_name', 'str', lambda status: _user(status, 'screen_name')),
+    ('lang', 'str', lambda status: status.get('lang')),
+    ('text', 'str', status_text),
+    ('hashtags', 'list', _hashtags),
+    ('matched_terms', 'list', None),
+)
+
+COLUMN_NAMES = tuple(name for name, kind, getter in COLUMNS)
+
+TCOL_MAGIC = b'TCOLUMN1'
+_ROW_GROUP = b'RG'
+_COUNT = struct.Struct('<I')
+
+# Marks the end of the writer queue
+_STOP = object()
+
+
+def default_format():
+    """Parquet if pyarrow is installed, else tcol"""
+    return 'parquet' if pyarrow is not None else 'tcol'
+
+
+class _RowGroup(object):
+    """Column lists being filled in, one row at a time"""
+
+    def __init__(self):
+        self.columns = dict((name, []) for name in COLUMN_NAMES)
+        self.rows = 0
+
+    def add(self, status, matched_terms):
+        columns = self.columns
+        for name, kind, getter in COLUMNS:
+            if getter is not None:
+                columns[name].append(getter(status))
+        columns['matched_terms'].append(list(matched_terms))
+        self.rows += 1
+
+
+def _encode_column(kind, values):
+    if kind == 'int':
+        # A presence byte for each row, then the values as int64s
+        present = bytearray(value is not None for value in values)
+        numbers = array.array('q', [value if value is not None else 0 for value in values])
+        if sys.byteorder != 'little':
+            numbers.byteswap()
+        data = bytes(present) + (numbers.tobytes() if hasattr(numbers, 'tobytes') else numbers.tostring())
+    else:
+        data = json.dumps(values).encode('utf8')
+    return zlib.compress(data)
+
+
+def _decode_column(kind, data, rows):
+    data = zlib.decompress(data)
+    if kind == 'int':
+        present = bytearray(data[:rows])
+        numbers = array.array('q')
+        if hasattr(numbers, 'frombytes'):
+            numbers.frombytes(data[rows:])
+        else:
+            numbers.fromstring(data[rows:])
+        if sys.byteorder != 'little':
+            numbers.byteswap()
+        return [value if flag else None for flag, value in zip(present, numbers)]
+    return json.loads(data.decode('utf8'))
+
+
+class TcolWriter(object):
+    """
+    Writes row groups in the tcol format: a magic number and a
+    JSON schema, then for each row group its row count, the size
+    of each column and the columns, each compressed separately.
+    Integer columns are int64s with a presence byte per row,
+    and the others are JSON arrays.
+
+    Each row group is complete once written, so a file cut short
+    loses at most the row group being written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.out = open(path, 'wb')
+        schema = json.dumps({'columns': [[name, kind] for name, kind, getter in COLUMNS]}).encode('utf8')
+        self.out.write(TCOL_MAGIC + _COUNT.pack(len(schema)) + schema)
+
+    def write(self, group):
+        blobs = [_encode_column(kind, group.columns[name]) for name, kind, getter in COLUMNS]
+        header = [_ROW_GROUP, _COUNT.pack(group.rows)] + [_COUNT.pack(len(blob)) for blob in blobs]
+        self.out.write(b''.join(header + blobs))
+        self.out.flush()
+
+    def close(self):
+        self.out.close()
+
+
+class ParquetWriter(object):
+    """Writes row groups to a Parquet file with pyarrow"""
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise ImportError("Writing Parquet needs pyarrow")
+
+        types = {'int': pyarrow.int64(), 'str': pyarrow.string(), 'list': pyarrow.list_(pyarrow.string())}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind, getter in COLUMNS])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, group):
+        table = pyarrow.Table.from_pydict(group.columns, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    'tcol': TcolWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def open_writer(path, format=None):
+    format = format or default_format()
+    if format not in WRITERS:
+        raise ValueError("Unknown columnar format: %s" % format)
+    return WRITERS[format](path)
+
+
+def read_row_groups(path, columns=None):
+    """
+    Yields the row groups of a tcol file as dicts of column lists,
+    with only the named columns if columns is given. The columns
+    that are not wanted are skipped over without being read.
+    """
+    with open(path, 'rb') as infile:
+        if infile.read(len(TCOL_MAGIC)) != TCOL_MAGIC:
+            raise ValueError("%s is not a tcol file" % path)
+
+        length, = _COUNT.unpack(infile.read(_COUNT.size))
+        schema = json.loads(infile.read(length).decode('utf8'))['columns']
+        if columns is None:
+            columns = [name for name, kind in schema]
+
+        unknown = set(columns) - set(name for name, kind in schema)
+        if unknown:
+            raise ValueError("Unknown columns: %s" % ', '.join(sorted(unknown)))
+
+        header_size = len(_ROW_GROUP) + _COUNT.size * (1 + len(schema))
+        while True:
+            header = infile.read(header_size)
+            if not header:
+                return
+            if len(header) < header_size or not header.startswith(_ROW_GROUP):
+                logger.warning("Incomplete row group at the end of %s", path)
+                return
+
+            counts = struct.unpack('<%dI' % (1 + len(schema)), header[len(_ROW_GROUP):])
+            rows, sizes = counts[0], counts[1:]
+
+            group = {}
+            for (name, kind), size in zip(schema, sizes):
+                if name in columns:
+                    data = infile.read(size)
+                    if len(data) < size:
+                        logger.warning("Incomplete row group at the end of %s", path)
+                        return
+                    group[name] = _decode_column(kind, data, rows)
+                else:
+                    infile.seek(size, io.SEEK_CUR)
+
+            yield group
+
+
+def read_rows(path, columns=None):
+    """Yields the rows of a tcol file as dicts"""
+    for group in read_row_groups(path, columns):
+        names = list(group)
+        for values in zip(*[group[name] for name in names]):
+            yield dict(zip(names, values))
+
+
+class ColumnarListener(JsonStreamListener):
+    """
+    Writes the columns above for each status to a columnar file,
+    in row groups of up to row_group_size statuses, which are
+    built up in memory and written by a separate thread.
+
+    format is 'parquet' (which needs pyarrow) or 'tcol', and
+    by default Parquet if pyarrow is installed. matched_terms comes
+    from each status's 'matched_terms' if a pipeline attributed it,
+    or else from a term_checker, if given.
+    """
+
+    def __init__(self, path, api=None, format=None, row_group_size=100000, term_checker=None, queue_size=4):
+        super(ColumnarListener, self).__init__(api)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.matcher = TermMatcher(term_checker) if term_checker is not None else None
+
+        self.writer = open_writer(path, format)
+        self.group = _RowGroup()
+        self.written = 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._write_loop, name='columnar-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def on_status(self, status):
+        terms = status.get('matched_terms')
+        if terms is None:
+            terms = self.matcher.match(status) if self.matcher is not None else ()
+
+        self.group.add(status, terms)
+        if self.group.rows >= self.row_group_size:
+            self.queue.put(self.group)
+            self.group = _RowGroup()
+        return not self.terminate
+
+    def write_raw(self, raw):
+        self.on_status(json.loads(raw))
+
+    def _write_loop(self):
+        while True:
+            group = self.queue.get()
+            if group is _STOP:
+                break
+
+            try:
+                self.writer.write(group)
+                self.written += group.rows
+            except Exception:
+                # Keep the writer going, or on_status would block on the full queue
+                logger.error("Failed to write %d rows to %s", group.rows, self.path, exc_info=True)
+
+        self.writer.close()
+
+    def close(self, timeout=None):
+        """Write out the last row group and close the file, within timeout seconds"""
+        deadline = None if timeout is None else time.time() + timeout
+        items = [self.group, _STOP] if self.group.rows else [_STOP]
+        self.group = _RowGroup()
+
+        try:
+            for item in items:
+                if not self.thread.is_alive():
+                    break
+                self.queue.put(item, timeout=None if deadline is None else max(0, deadline - time.time()))
+        except queue.Full:
+            pass
+
+        self.thread.join(None if deadline is None else max(0, deadline - time.time()))
+        if self.thread.is_alive():
+            logger.warning("Columnar writer still has %d row groups queued", self.queue.qsize())
+
+
+def _open_capture(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def convert_file(path, out_path, format=None, row_group_size=100000):
+    """
+    Convert one NDJSON capture (optionally gzipped) to a columnar file.
+    Lines that are not statuses are skipped.
+    Returns the numbers of statuses written and lines skipped.
+    """
+    writer = open_writer(out_path, format)
+    group = _RowGroup()
+    written = 0
+    skipped = 0
+    try:
+        with _open_capture(path) as infile:
+            for line in infile:
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    status = json.loads(line.decode('utf8'))
+                except ValueError:
+                    skipped += 1
+                    continue
+
+                if not isinstance(status, dict) or 'in_reply_to_status_id' not in status:
+                    skipped += 1
+                    continue
+
+                group.add(status, status.get('matched_terms') or ())
+                if group.rows >= row_group_size:
+                    writer.write(group)
+                    written += group.rows
+                    group = _RowGroup()
+
+        if group.rows:
+            writer.write(group)
+            written += group.rows
+    finally:
+        writer.close()
+
+    return written, skipped
+
+
+def _convert_one(job):
+    path, out_path, format, row_group_size = job
+    written, skipped = convert_file(path, out_path, format, row_group_size)
+    return path, out_path, written, skipped
+
+
+def convert(paths, out_directory, format=None, row_group_size=100000, processes=None, overwrite=False):
+    """
+    Convert NDJSON captures into columnar files in out_directory,
+    one file each, using a pool of processes (one per CPU by default).
+    Returns a list of (path, out_path, written, skipped) for each file.
+
+    Each output is named after its capture, without the directory or
+    the .gz, .json, .ndjson and .txt suffixes. A ValueError is raised,
+    before anything is converted, if two captures would get the same name,
+    or if an output already exists and overwrite is not True.
+    """
+    format = format or default_format()
+    extension = '.parquet' if format == 'parquet' else '.tcol'
+
+    jobs = []
+    sources = {}
+    for path in paths:
+        name = os.path.basename(path)
+        for suffix in ('.gz', '.json', '.ndjson', '.txt'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        out_path = os.path.join(out_directory, name + extension)
+
+        if out_path in sources:
+            raise ValueError("%s and %s would both be converted to %s" % (sources[out_path], path, out_path))
+        if not overwrite and os.path.exists(out_path):
+            raise ValueError("%s already exists" % out_path)
+        sources[out_path] = path
+        jobs.append((path, out_path, format, row_group_size))
+
+    if processes == 1 or len(jobs) <= 1:
+        return [_convert_one(job) for job in jobs]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_convert_one, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert NDJSON capture files to a columnar format.')
+    parser.add_argument('out_directory', help='directory for the converted files')
+    parser.add_argument('files', nargs='+', help='capture files to convert')
+    parser.add_argument('--format', choices=sorted(WRITERS), default=None,
+                        help='parquet (needs pyarrow) or tcol, by default parquet if available')
+    parser.add_argument('--row-group-size', type=int, default=100000, help='statuses per row group')
+    parser.add_argument('--processes', type=int, default=None, help='number of processes, by default one per CPU')
+    parser.add_argument('--overwrite', action='store_true', help='replace converted files that already exist')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.out_directory):
+        os.makedirs(args.out_directory)
+
+    try:
+        results = convert(args.files, args.out_directory, args.format, args.row_group_size, args.processes,
+                          overwrite=args.overwrite)
+    except ValueError as e:
+        parser.error(str(e))
+
+    for path, out_path, written, skipped in results:
+        logger.info("Converted %s to %s: %d statuses, %d lines skipped", path, out_path, written, skipped)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
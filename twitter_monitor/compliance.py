@@ -0,0 +1,426 @@
+"""
+Tracking and applying delete and scrub_geo compliance notices.
+
+Deleted status ids and scrub_geo watermarks (user id, up to status id)
+are kept in a TombstoneStore: a few sorted runs on disk, searched through
+memory maps, plus a small in-memory buffer of recent notices that is
+written out as a new run when it fills. Memory use stays bounded however
+many ids are stored.
+
+Stored output can then be brought into compliance in batches by
+compacting rotated files in the background, and anything read back
+can be filtered on the way.
+"""
+
+import os
+import json
+import glob
+import time
+import array
+import bisect
+import struct
+import logging
+import threading
+
+from .listener import JsonStreamListener
+from .output import replace_file, atomic_write
+from .sorted_file import SortedRecordFile, write_records, merge_records
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['TombstoneStore', 'ComplianceListener', 'Compactor', 'compact_file', 'filter_lines']
+
+DELETED_ENTRY = struct.Struct('<Q')
+
+# user id, up to status id
+WATERMARK_ENTRY = struct.Struct('<QQ')
+
+# Runs are named these plus a number
+DELETED_FILE = 'deleted.ids'
+WATERMARK_FILE = 'scrub_geo.marks'
+MANIFEST_FILE = 'tombstones.manifest'
+
+GEO_KEYS = ('coordinates', 'geo', 'place')
+
+# How many new deleted ids are searched unsorted
+TAIL_SIZE = 4096
+
+
+def _unique_keys(records):
+    """Drop records whose key repeats the previous one"""
+    last = None
+    for record in records:
+        if record[0] != last:
+            last = record[0]
+            yield record
+
+
+def _max_watermarks(records):
+    """Combine sorted watermark records for the same user"""
+    current = None
+    for user_id, up_to in records:
+        if current is not None and current[0] == user_id:
+            current = (user_id, max(current[1], up_to))
+        else:
+            if current is not None:
+                yield current
+            current = (user_id, up_to)
+    if current is not None:
+        yield current
+
+
+class TombstoneStore(object):
+    """
+    Stores deleted status ids and scrub_geo watermarks in directory.
+
+    Up to buffer_size new notices are held in memory before being
+    written to disk. Call flush() to write them sooner.
+
+    As in NdjsonIndex, each flush writes a new sorted run, merged only
+    with runs no bigger than it, so a flush costs about as much as what
+    it adds rather than everything stored. A manifest listing the runs
+    is replaced atomically once they are written.
+    """
+
+    def __init__(self, directory, buffer_size=1000000):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.deleted_runs = []
+        self.watermark_runs = []
+        self._next_run = 1
+        self._load_manifest()
+
+        # New ids go on the unsorted tail, which is sorted into a run
+        # when it fills. Runs are merged as they pile up, so there are
+        # only ever a few to search.
+        self._pending_tail = array.array('Q')
+        self._pending_runs = []
+        self._pending_watermarks = {}
+
+        # Incremented whenever new notices arrive
+        self.version = 0
+        self._lock = threading.RLock()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+
+        with open(self.manifest_path) as infile:
+            manifest = json.load(infile)
+        self._next_run = manifest['next_run']
+        self.deleted_runs = [self._open_run(item, DELETED_ENTRY) for item in manifest['deleted']]
+        self.watermark_runs = [self._open_run(item, WATERMARK_ENTRY) for item in manifest['watermarks']]
+
+    def _open_run(self, item, record_struct):
+        path = os.path.join(self.directory, item['name'])
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        if size != item['entries'] * record_struct.size:
+            raise ValueError("%s does not match %s" % (path, self.manifest_path))
+        return SortedRecordFile(path, record_struct)
+
+    def _save_manifest(self):
+        def describe(runs):
+            return [{'name': os.path.basename(run.path), 'entries': len(run)} for run in runs]
+
+        atomic_write(self.manifest_path, json.dumps({'deleted': describe(self.deleted_runs),
+                                                     'watermarks': describe(self.watermark_runs),
+                                                     'next_run': self._next_run}))
+
+    def _add_run(self, runs, name, record_struct, records, combine):
+        """
+        Write records as a new run, merging it with any runs no
+        bigger than it. Returns the run files no longer needed.
+        """
+        obsolete = []
+        run = self._write_run(name, record_struct, records)
+        while runs and len(runs[-1]) <= len(run):
+            previous = runs.pop()
+            obsolete += [previous, run]
+            run = self._write_run(name, record_struct, combine(merge_records(previous, run)))
+
+        if len(run):
+            runs.append(run)
+        else:
+            obsolete.append(run)
+        return obsolete
+
+    def _write_run(self, name, record_struct, records):
+        # Never one the manifest lists, so that stays valid until replaced
+        path = os.path.join(self.directory, '%s.%d' % (name, self._next_run))
+        self._next_run += 1
+        write_records(path, record_struct, records)
+        return SortedRecordFile(path, record_struct)
+
+    def add_delete(self, status_id):
+        with self._lock:
+            self._pending_tail.append(status_id)
+            if len(self._pending_tail) >= TAIL_SIZE:
+                self._seal_tail()
+            self.version += 1
+            self._check_buffer()
+
+    def add_scrub_geo(self, user_id, up_to_status_id):
+        with self._lock:
+            if up_to_status_id > self._pending_watermarks.get(user_id, 0):
+                self._pending_watermarks[user_id] = up_to_status_id
+            self.version += 1
+            self._check_buffer()
+
+    def _pending_count(self):
+        return len(self._pending_tail) + sum(len(run) for run in self._pending_runs)
+
+    def _check_buffer(self):
+        if self._pending_count() + len(self._pending_watermarks) >= self.buffer_size:
+            self.flush()
+
+    def _seal_tail(self):
+        """Sort the tail into a run, merging it with any runs no bigger than it"""
+        run = array.array('Q', sorted(self._pending_tail))
+        self._pending_tail = array.array('Q')
+        runs = self._pending_runs
+        while runs and len(runs[-1]) <= len(run):
+            # Two sorted runs back to back, which sorted() merges in one pass
+            run = array.array('Q', sorted(runs.pop() + run))
+        runs.append(run)
+
+    def _stored_watermark(self, user_id):
+        up_to = 0
+        for run in self.watermark_runs:
+            position = run.bisect_left(user_id)
+            if position < len(run):
+                found_user, found_up_to = run[position]
+                if found_user == user_id:
+                    up_to = max(up_to, found_up_to)
+        return up_to
+
+    def is_deleted(self, status_id):
+        with self._lock:
+            if any(status_id in run for run in self.deleted_runs):
+                return True
+            if status_id in self._pending_tail:
+                return True
+            for run in self._pending_runs:
+                position = bisect.bisect_left(run, status_id)
+                if position < len(run) and run[position] == status_id:
+                    return True
+            return False
+
+    def geo_watermark(self, user_id):
+        """Statuses by user_id up to this id must have geo data removed (0 for none)"""
+        with self._lock:
+            return max(self._pending_watermarks.get(user_id, 0), self._stored_watermark(user_id))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(run) for run in self.deleted_runs) + self._pending_count()
+
+    def flush(self):
+        """Write buffered notices to disk"""
+        with self._lock:
+            if self._pending_tail:
+                self._seal_tail()
+            if not self._pending_runs and not self._pending_watermarks:
+                return
+
+            # Only what is not stored already, so runs never overlap
+            obsolete = []
+            if self._pending_runs:
+                pending = _unique_keys(merge_records(*[((status_id,) for status_id in run)
+                                                       for run in self._pending_runs]))
+                new = (record for record in pending
+                       if not any(record[0] in run for run in self.deleted_runs))
+                obsolete += self._add_run(self.deleted_runs, DELETED_FILE, DELETED_ENTRY, new, _unique_keys)
+                self._pending_runs = []
+
+            if self._pending_watermarks:
+                new = [(user_id, up_to) for user_id, up_to in sorted(self._pending_watermarks.items())
+                       if up_to > self._stored_watermark(user_id)]
+                obsolete += self._add_run(self.watermark_runs, WATERMARK_FILE, WATERMARK_ENTRY, new,
+                                          _max_watermarks)
+                self._pending_watermarks = {}
+
+            self._save_manifest()
+
+            # Only now that the manifest no longer lists them
+            for run in obsolete:
+                run.close()
+                os.remove(run.path)
+
+    def apply(self, status):
+        """
+        Bring a status dict into compliance. Returns None if it has been deleted,
+        otherwise the status with geo data removed if required.
+        """
+        if self.is_deleted(status['id']):
+            return None
+
+        user = status.get('user')
+        if user and status['id'] <= self.geo_watermark(user['id']):
+            for key in GEO_KEYS:
+                if status.get(key) is not None:
+                    status[key] = None
+        return status
+
+    def close(self):
+        self.flush()
+        for run in self.deleted_runs + self.watermark_runs:
+            run.close()
+
+
+class ComplianceListener(JsonStreamListener):
+    """
+    A listener that records delete and scrub_geo notices in a TombstoneStore.
+    Extend it as you would JsonStreamListener.
+    """
+
+    def __init__(self, tombstones, api=None):
+        super(ComplianceListener, self).__init__(api)
+        self.tombstones = tombstones
+
+    def on_delete(self, status_id, user_id):
+        self.tombstones.add_delete(status_id)
+        return True
+
+    def on_scrub_geo(self, user_id, up_to_status_id):
+        self.tombstones.add_scrub_geo(user_id, up_to_status_id)
+        return True
+
+    def close(self, timeout=None):
+        self.tombstones.flush()
+
+
+def filter_lines(lines, tombstones):
+    """
+    Yields compliant status dicts from lines of JSON,
+    skipping deleted statuses and scrubbing geo data.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+
+        entity = json.loads(line)
+        if isinstance(entity, dict) and 'id' in entity:
+            entity = tombstones.apply(entity)
+            if entity is None:
+                continue
+        yield entity
+
+
+def compact_file(path, tombstones):
+    """
+    Rewrite a newline-delimited JSON file without deleted statuses
+    and with geo data scrubbed. The file is only replaced if something
+    changed. Returns the number of statuses removed and scrubbed.
+    """
+    removed = 0
+    scrubbed = 0
+    temp_path = path + '.compacting'
+
+    with open(path, 'rb') as infile:
+        with open(temp_path, 'wb') as outfile:
+            for line in infile:
+                if not line.endswith(b'\n'):
+                    # Leave a partial last line alone
+                    outfile.write(line)
+                    continue
+
+                try:
+                    entity = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    outfile.write(line)
+                    continue
+
+                if not isinstance(entity, dict) or 'id' not in entity:
+                    outfile.write(line)
+                    continue
+
+                before = [entity.get(key) for key in GEO_KEYS]
+                if tombstones.apply(entity) is None:
+                    removed += 1
+                elif before != [entity.get(key) for key in GEO_KEYS]:
+                    scrubbed += 1
+                    outfile.write(json.dumps(entity).encode('utf-8') + b'\n')
+                else:
+                    outfile.write(line)
+
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    if removed or scrubbed:
+        replace_file(temp_path, path)
+    else:
+        os.remove(temp_path)
+
+    return removed, scrubbed
+
+
+class Compactor(object):
+    """
+    Periodically applies tombstones to rotated output files in a background thread.
+
+    Compacting replaces a file, so only files that are closed
+    may match pattern. Files still being written must be left out:
+    active is a list of their paths, or a function returning one
+    (such as lambda: [listener.output_path]). As a safeguard,
+    files modified in the last min_age seconds are also skipped.
+    Each file is compacted again only when new notices have
+    arrived since it was last compacted.
+    """
+
+    def __init__(self, tombstones, pattern, interval=300, min_age=60, active=()):
+        self.tombstones = tombstones
+        self.pattern = pattern
+        self.interval = interval
+        self.min_age = min_age
+        self.active = active
+        self.compacted = {}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """Compact every rotated file that needs it"""
+        self.tombstones.flush()
+        version = self.tombstones.version
+        now = time.time()
+
+        active = self.active() if callable(self.active) else self.active
+        active = set(os.path.abspath(path) for path in active if path)
+
+        for path in sorted(glob.glob(self.pattern)):
+            if os.path.abspath(path) in active:
+                continue
+            if now - os.path.getmtime(path) < self.min_age:
+                continue
+            if self.compacted.get(path) == version:
+                continue
+
+            removed, scrubbed = compact_file(path, self.tombstones)
+            if removed or scrubbed:
+                logger.info("Compacted %s: %d deleted, %d scrubbed", path, removed, scrubbed)
+            self.compacted[path] = version
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.error("Compaction failed", exc_info=True)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='compactor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,170 @@
+"""
+A term checker that is told about changes over a local control socket,
+instead of polling for them.
+"""
+
+import json
+import logging
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from .checker import TermChecker
+from .local_server import LocalServer
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SocketTermChecker']
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Reads one JSON command per line and writes one JSON reply per line"""
+
+    def handle(self):
+        checker = self.server.checker
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                command = json.loads(line.decode('utf8'))
+                reply = checker.handle_command(command)
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                reply = {'ok': False, 'error': str(e)}
+
+            self.wfile.write((json.dumps(reply) + '\n').encode('utf8'))
+            self.wfile.flush()
+
+
+class SocketTermChecker(TermChecker):
+    """
+    Keeps the tracked terms in memory and accepts changes over
+    a Unix domain socket (if address is a path) or a local TCP
+    port (if address is a (host, port) tuple).
+
+    Each line sent is a JSON command:
+
+        {"op": "add", "terms": ["cats", "dogs"]}
+        {"op": "remove", "terms": ["dogs"]}
+        {"op": "replace", "terms": [...]}   (the whole term set at once)
+        {"op": "get"}
+
+    Every command is applied as a whole, and wakes the stream's
+    polling loop so it is picked up straight away. The reply comes once
+    the stream has connected with the new terms, or straight after the
+    check if the stream needed no change (or after ack_timeout seconds,
+    with live false), for example:
+
+        {"ok": true, "live": true, "version": 3, "terms": 2}
+    """
+
+    def __init__(self, address, terms=(), ack_timeout=30):
+        super(SocketTermChecker, self).__init__()
+        self.address = address
+        self.ack_timeout = ack_timeout
+
+        self._terms = set(terms)
+        self._stream = None
+        self._server = None
+
+        # Each change gets a generation number, and replies
+        # wait until the stream has caught up with theirs
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._checked = 0
+        self._live = 0
+
+    def start(self):
+        """Start listening for commands"""
+        if self._server is not None:
+            return
+
+        self._server = LocalServer(self.address, _Handler, checker=self)
+        self.address = self._server.start()
+        logger.info("Listening for term changes on %s", self.address)
+
+    def close(self):
+        """Stop listening for commands"""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    def apply(self, op, terms=()):
+        """Change the terms, returning the generation of the change"""
+        with self._condition:
+            if op == 'add':
+                self._terms.update(terms)
+            elif op == 'remove':
+                self._terms.difference_update(terms)
+            elif op == 'replace':
+                self._terms = set(terms)
+            else:
+                raise ValueError("Unknown operation: %s" % op)
+
+            self._generation += 1
+            generation = self._generation
+
+        if self._stream is not None:
+            self._stream.wake()
+        return generation
+
+    def wait_until_live(self, generation, timeout=None):
+        """Wait for the stream to catch up with a change. Returns True if it has."""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self._condition:
+            while self._live < generation:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def handle_command(self, command):
+        op = command['op']
+        if op == 'get':
+            with self._condition:
+                return {'ok': True, 'terms': sorted(self._terms)}
+
+        terms = command.get('terms', [])
+        if not isinstance(terms, list):
+            raise ValueError("terms must be a list")
+
+        generation = self.apply(op, terms)
+
+        live = False
+        if self._stream is not None:
+            live = self.wait_until_live(generation, self.ack_timeout)
+
+        with self._condition:
+            count = len(self._terms)
+        return {'ok': True, 'live': live, 'version': generation, 'terms': count}
+
+    def _mark_live(self, generation):
+        with self._condition:
+            if generation > self._live:
+                self._live = generation
+                self._condition.notify_all()
+
+    def update_tracking_terms(self):
+        with self._condition:
+            self._checked = self._generation
+            return set(self._terms)
+
+    def attach(self, stream):
+        self._stream = stream
+        self.start()
+
+    def on_stream_live(self):
+        self._mark_live(self._checked)
@@ -0,0 +1,201 @@
+"""
+Spotting near-duplicate statuses, such as spam campaigns
+posting the same text with small changes.
+"""
+
+import re
+import hashlib
+import logging
+import collections
+
+from .pipeline import Stage
+from .matching import status_text
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['simhash', 'hamming', 'SimHashIndex', 'NearDuplicateStage']
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_URL_RE = re.compile(r"https?://\S+")
+
+# Each of the 64 bit counts gets its own 16 bit field of one big
+# integer, so a feature's bits are all counted with one addition.
+# _SPREAD[b] spreads the 8 bits of byte b out into 8 fields.
+_FIELD = 16
+_SPREAD = [sum(((byte >> bit) & 1) << (_FIELD * bit) for bit in range(8)) for byte in range(256)]
+_FIELD_MASK = (1 << _FIELD) - 1
+_MAX_FEATURES = _FIELD_MASK
+
+# Each feature's hash is cached already spread out, since words repeat a lot
+_CACHE_SIZE = 100000
+_spread_cache = {}
+
+
+def _spread_hash(feature):
+    digest = bytearray(hashlib.md5(feature.encode('utf8')).digest()[:8])
+    spread = 0
+    for position, byte in enumerate(digest):
+        spread |= _SPREAD[byte] << (_FIELD * 8 * position)
+    return spread
+
+
+def features(text):
+    """The words and word pairs in a text, ignoring case and links"""
+    words = _WORD_RE.findall(_URL_RE.sub(' ', text.lower()))
+    return words + [a + ' ' + b for a, b in zip(words, words[1:])]
+
+
+def simhash(text):
+    """The 64 bit SimHash of a text's features"""
+    items = features(text)[:_MAX_FEATURES]
+    if not items:
+        return 0
+
+    cache = _spread_cache
+    total = 0
+    for item in items:
+        spread = cache.get(item)
+        if spread is None:
+            if len(cache) >= _CACHE_SIZE:
+                cache.clear()
+            spread = cache[item] = _spread_hash(item)
+        total += spread
+
+    # A bit is set if most features had it set
+    count = len(items)
+    fingerprint = 0
+    for bit in range(64):
+        if ((total >> (_FIELD * bit)) & _FIELD_MASK) * 2 > count:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex(object):
+    """
+    The capacity most recently used signatures, with their clusters,
+    split into bands for lookup.
+
+    Two signatures within distance bits of each other must agree
+    on at least one of distance + 1 bands, so only the signatures
+    sharing a band with a new one need to be compared with it.
+    """
+
+    def __init__(self, distance=3, capacity=100000):
+        self.distance = distance
+        self.capacity = capacity
+
+        self.bands = distance + 1
+        self.band_bits = 64 // self.bands
+        self.band_mask = (1 << self.band_bits) - 1
+
+        self.entries = collections.OrderedDict()
+        self.tables = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _keys(self, signature):
+        bits = self.band_bits
+        mask = self.band_mask
+        return [(signature >> (band * bits)) & mask for band in range(self.bands)]
+
+    def query(self, signature):
+        """
+        Returns the (distance, cluster) of the nearest signature
+        in range, or None, and marks that signature as used.
+        """
+        entries = self.entries
+        nearest = None
+        if signature in entries:
+            nearest = (0, signature)
+        else:
+            for table, key in zip(self.tables, self._keys(signature)):
+                for other in table.get(key, ()):
+                    distance = hamming(signature, other)
+                    if distance <= self.distance and (nearest is None or distance < nearest[0]):
+                        nearest = (distance, other)
+
+        if nearest is None:
+            return None
+
+        distance, other = nearest
+        cluster = entries.pop(other)
+        entries[other] = cluster
+        return distance, cluster
+
+    def add(self, signature, cluster):
+        if signature in self.entries:
+            del self.entries[signature]
+        self.entries[signature] = cluster
+
+        for table, key in zip(self.tables, self._keys(signature)):
+            bucket = table.get(key)
+            if bucket is None:
+                bucket = table[key] = set()
+            bucket.add(signature)
+
+        while len(self.entries) > self.capacity:
+            self._evict()
+
+    def _evict(self):
+        signature, _ = self.entries.popitem(last=False)
+        for table, key in zip(self.tables, self._keys(signature)):
+            bucket = table[key]
+            bucket.discard(signature)
+            if not bucket:
+                del table[key]
+
+
+class NearDuplicateStage(Stage):
+    """
+    Gives each status a status['cluster_id']: the id of the first
+    recent status it is a near duplicate of, or its own id.
+    status['near_duplicate'] says whether it was one.
+
+    Texts whose SimHash signatures differ in at most distance bits
+    count as near duplicates. Only the signature of the first status
+    in each cluster is kept, and only for the capacity clusters seen
+    most recently, so memory use and lookup time stay bounded. Texts with fewer than min_words
+    words are never counted as duplicates.
+
+    If drop is True, near duplicates are dropped instead.
+    """
+
+    def __init__(self, distance=3, capacity=100000, drop=False, min_words=4):
+        self.index = SimHashIndex(distance, capacity)
+        self.drop = drop
+        self.min_words = min_words
+
+        self.seen = 0
+        self.duplicates = 0
+
+    def process(self, status):
+        self.seen += 1
+        text = status_text(status)
+
+        # Short texts are left out of the index too, so they
+        # can't take up room or start clusters for longer ones
+        signature = None
+        match = None
+        if len(_WORD_RE.findall(text)) >= self.min_words:
+            signature = simhash(text)
+            match = self.index.query(signature)
+
+        if match is None:
+            cluster = status['id']
+            status['near_duplicate'] = False
+            if signature is not None:
+                self.index.add(signature, cluster)
+        else:
+            cluster = match[1]
+            status['near_duplicate'] = True
+            self.duplicates += 1
+            if self.drop:
+                return None
+
+        status['cluster_id'] = cluster
+        return status
@@ -0,0 +1,286 @@
+"""
+A listener that sends every message to several sinks,
+each fed from its own queue by its own thread.
+"""
+
+import json
+import time
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .listener import JsonStreamListener
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SinkWorker', 'FanOutListener', 'BLOCK', 'DROP_NEWEST', 'DROP_OLDEST']
+
+# What to do with a message when a sink's queue is full
+BLOCK = 'block'
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+OVERFLOW_POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST)
+
+# Marks the end of a sink's queue
+_STOP = object()
+
+
+class SinkWorker(object):
+    """
+    Feeds one sink listener from a bounded queue on its own thread.
+
+    When the queue is full, the overflow policy decides what happens:
+    BLOCK waits for room (for at most block_timeout seconds, if given,
+    then drops the message), DROP_NEWEST drops the new message and
+    DROP_OLDEST drops the oldest queued one to make room.
+
+    A sink that raises is logged and counted as failed for that message.
+    A sink that returns False from a handler is stopped, and
+    the messages for it from then on are dropped.
+    """
+
+    def __init__(self, sink, name=None, queue_size=10000, overflow=DROP_NEWEST, block_timeout=None,
+                 clock=time.time):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+
+        self.sink = sink
+        self.name = name or sink.__class__.__name__
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.clock = clock
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.stopped = False
+        self._stop_sent = False
+        self.enqueued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self._run, name='sink-%s' % self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def put(self, method, *args):
+        """Queue a call to one of the sink's handlers"""
+        if self.stopped:
+            self._count_dropped()
+            return
+
+        item = (method, args, self.clock())
+        if self.overflow == BLOCK:
+            try:
+                self.queue.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                self._count_dropped()
+                return
+        elif self.overflow == DROP_NEWEST:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self._count_dropped()
+                return
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self._count_dropped()
+                    except queue.Empty:
+                        pass
+
+        with self._lock:
+            self.enqueued += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+
+            method, args, enqueued_at = item
+            if self.stopped:
+                self._count_dropped()
+                continue
+
+            try:
+                result = getattr(self.sink, method)(*args)
+            except Exception:
+                logger.error("Sink %s failed in %s", self.name, method, exc_info=True)
+                with self._lock:
+                    self.failed += 1
+                continue
+
+            lag = self.clock() - enqueued_at
+            with self._lock:
+                self.delivered += 1
+                self.lag = lag
+                if lag > self.max_lag:
+                    self.max_lag = lag
+
+            if result is False:
+                logger.warning("Sink %s asked to stop, dropping its messages from now on", self.name)
+                self.stopped = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queue.qsize(),
+                'enqueued': self.enqueued,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'lag': self.lag,
+                'max_lag': self.max_lag,
+                'stopped': self.stopped,
+            }
+
+    def stop(self, timeout=None):
+        """Mark the end of the queue, so the thread finishes once it is drained"""
+        if not self._stop_sent:
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+                self._stop_sent = True
+            except queue.Full:
+                pass
+        return self._stop_sent
+
+    def close(self, timeout=None):
+        """
+        Deliver everything queued, then close the sink,
+        taking no longer than timeout seconds. Returns
+        False if the queue could not be drained in time.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        if not self.stop(timeout):
+            logger.warning("Sink %s still has %d messages queued", self.name, self.queue.qsize())
+            return False
+
+        self.thread.join(None if deadline is None else max(0, deadline - time.time()))
+        if self.thread.is_alive():
+            logger.warning("Sink %s still has %d messages queued", self.name, self.queue.qsize())
+            return False
+
+        # Only now, so the sink doesn't refuse what was queued
+        self.sink.set_terminate()
+        self.sink.close(None if deadline is None else max(0, deadline - time.time()))
+        return True
+
+
+class FanOutListener(JsonStreamListener):
+    """
+    Sends every message to each of its sinks (listeners),
+    through a SinkWorker for each, so a slow or failing sink
+    holds up neither the others nor the stream.
+
+    The same status dict is passed to every sink,
+    so sinks should not modify it.
+
+    Sinks with a write_raw() method are given raw tweets from
+    supervised workers as they are, and the others get them decoded.
+
+    set_terminate() is only passed on to each sink by close(),
+    once everything queued for it has been delivered.
+    """
+
+    def __init__(self, sinks=(), api=None, queue_size=10000, overflow=DROP_NEWEST, projection=None):
+        super(FanOutListener, self).__init__(api, projection=projection)
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.workers = []
+
+        for sink in sinks:
+            self.add_sink(sink)
+
+    def add_sink(self, sink, name=None, queue_size=None, overflow=None, block_timeout=None):
+        """Add a sink, with its own queue size and overflow policy if given"""
+        if name is None:
+            name = '%s-%d' % (sink.__class__.__name__, len(self.workers))
+        if queue_size is None:
+            queue_size = self.queue_size
+        if overflow is None:
+            overflow = self.overflow
+
+        worker = SinkWorker(sink, name, queue_size, overflow, block_timeout)
+        self.workers.append(worker)
+        return worker
+
+    def _send(self, method, *args):
+        for worker in self.workers:
+            worker.put(method, *args)
+        return not self.terminate
+
+    def on_status(self, status):
+        return self._send('on_status', status)
+
+    def write_raw(self, raw):
+        status = None
+        for worker in self.workers:
+            if hasattr(worker.sink, 'write_raw'):
+                worker.put('write_raw', raw)
+            else:
+                if status is None:
+                    status = json.loads(raw)
+                worker.put('on_status', status)
+
+    def on_delete(self, status_id, user_id):
+        self._send('on_delete', status_id, user_id)
+        return True
+
+    def on_scrub_geo(self, user_id, up_to_status_id):
+        self._send('on_scrub_geo', user_id, up_to_status_id)
+        return True
+
+    def on_limit(self, track):
+        self._send('on_limit', track)
+        return True
+
+    def on_status_withheld(self, status_id, user_id, countries):
+        self._send('on_status_withheld', status_id, user_id, countries)
+        return True
+
+    def on_user_withheld(self, user_id, countries):
+        self._send('on_user_withheld', user_id, countries)
+        return True
+
+    def on_disconnect(self, code, stream_name, reason):
+        self._send('on_disconnect', code, stream_name, reason)
+        return True
+
+    def on_stall_warning(self, code, message, percent_full):
+        self._send('on_stall_warning', code, message, percent_full)
+        return True
+
+    def on_unknown(self, entity):
+        self._send('on_unknown', entity)
+        return True
+
+    def stats(self):
+        """Counts and lag (in seconds) for each sink, by name"""
+        return dict((worker.name, worker.stats()) for worker in self.workers)
+
+    def close(self, timeout=None):
+        """Drain every sink's queue and close them, within timeout seconds in all"""
+        deadline = None if timeout is None else time.time() + timeout
+
+        # Let them all drain at once
+        for worker in self.workers:
+            worker.stop(0)
+        for worker in self.workers:
+            worker.close(None if deadline is None else max(0, deadline - time.time()))
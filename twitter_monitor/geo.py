@@ -0,0 +1,182 @@
+"""
+Client-side matching of geotagged statuses against tracked bounding boxes.
+
+Twitter matches the locations filter loosely, so statuses need
+to be checked and attributed to the boxes they actually fall in.
+"""
+
+import math
+import logging
+
+from .pipeline import Stage
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['BoundingBoxIndex', 'LocationAttributionStage', 'status_location']
+
+
+def status_location(status):
+    """
+    Returns ('point', (lon, lat)) for a status with exact coordinates,
+    ('box', (sw_lon, sw_lat, ne_lon, ne_lat)) for one with only a place,
+    or None if it has no location.
+    """
+    coordinates = status.get('coordinates')
+    if coordinates and coordinates.get('coordinates'):
+        lon, lat = coordinates['coordinates'][:2]
+        return 'point', (lon, lat)
+
+    place = status.get('place')
+    if place and place.get('bounding_box') and place['bounding_box'].get('coordinates'):
+        # A polygon, given as a list of rings of [lon, lat] points
+        points = place['bounding_box']['coordinates'][0]
+        lons = [point[0] for point in points]
+        lats = [point[1] for point in points]
+        return 'box', (min(lons), min(lats), max(lons), max(lats))
+
+    return None
+
+
+class BoundingBoxIndex(object):
+    """
+    A uniform grid over the tracked bounding boxes.
+
+    Each grid cell lists the boxes that overlap it, so a point is
+    checked against only a handful of candidates however many boxes
+    are tracked. Boxes covering more than max_cells cells are kept
+    aside and checked directly.
+    """
+
+    def __init__(self, boxes=(), cell_size=1.0, max_cells=4096):
+        self.cell_size = float(cell_size)
+        self.max_cells = max_cells
+        self.boxes = []
+        self.cells = {}
+        self.large = []
+
+        for box in boxes:
+            self.add(box)
+
+    def _cell_range(self, sw_lon, sw_lat, ne_lon, ne_lat):
+        size = self.cell_size
+        return (int(math.floor(sw_lon / size)), int(math.floor(ne_lon / size)),
+                int(math.floor(sw_lat / size)), int(math.floor(ne_lat / size)))
+
+    def add(self, box):
+        box = tuple(float(value) for value in box)
+        number = len(self.boxes)
+        self.boxes.append(box)
+
+        x_min, x_max, y_min, y_max = self._cell_range(*box)
+        if (x_max - x_min + 1) * (y_max - y_min + 1) > self.max_cells:
+            self.large.append(number)
+            return
+
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                self.cells.setdefault((x, y), []).append(number)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def match_point(self, lon, lat):
+        """Returns the boxes containing the point"""
+        size = self.cell_size
+        boxes = self.boxes
+        matched = []
+
+        candidates = self.cells.get((int(math.floor(lon / size)), int(math.floor(lat / size))), ())
+        for number in candidates:
+            sw_lon, sw_lat, ne_lon, ne_lat = boxes[number]
+            if sw_lon <= lon <= ne_lon and sw_lat <= lat <= ne_lat:
+                matched.append(boxes[number])
+
+        for number in self.large:
+            sw_lon, sw_lat, ne_lon, ne_lat = boxes[number]
+            if sw_lon <= lon <= ne_lon and sw_lat <= lat <= ne_lat:
+                matched.append(boxes[number])
+
+        return matched
+
+    def match_box(self, sw_lon, sw_lat, ne_lon, ne_lat):
+        """Returns the boxes that intersect the given box"""
+        x_min, x_max, y_min, y_max = self._cell_range(sw_lon, sw_lat, ne_lon, ne_lat)
+
+        if (x_max - x_min + 1) * (y_max - y_min + 1) > self.max_cells:
+            # A huge place, so just check everything
+            candidates = range(len(self.boxes))
+        else:
+            candidates = set(self.large)
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    candidates.update(self.cells.get((x, y), ()))
+
+        matched = []
+        for number in sorted(candidates):
+            box = self.boxes[number]
+            if box[0] <= ne_lon and sw_lon <= box[2] and box[1] <= ne_lat and sw_lat <= box[3]:
+                matched.append(box)
+        return matched
+
+    def match(self, status):
+        """Returns the boxes a status matched, the way the locations filter does"""
+        location = status_location(status)
+        if location is None:
+            return []
+
+        kind, value = location
+        if kind == 'point':
+            return self.match_point(*value)
+        return self.match_box(*value)
+
+
+class LocationAttributionStage(Stage):
+    """
+    Records the tracked bounding boxes each status falls in as
+    status['matched_locations'], following the location checker.
+
+    If drop_unmatched is True, statuses that match no tracked
+    box and no tracked term (see AttributionStage) are dropped.
+    If the stream also follows users, pass its follow_checker so
+    that statuses delivered for them are kept: those by a followed
+    user, replying to one, or retweeting one.
+    """
+
+    def __init__(self, location_checker, cell_size=1.0, drop_unmatched=False, follow_checker=None):
+        self.location_checker = location_checker
+        self.follow_checker = follow_checker
+        self.cell_size = cell_size
+        self.drop_unmatched = drop_unmatched
+        self.index = BoundingBoxIndex(cell_size=cell_size)
+        self.following = set()
+        self._version = None
+        self._follow_version = None
+
+    def _refresh(self):
+        checker = self.location_checker
+        if checker.version != self._version:
+            self._version = checker.version
+            self.index = BoundingBoxIndex(checker.tracking_terms(), cell_size=self.cell_size)
+
+        checker = self.follow_checker
+        if checker is not None and checker.version != self._follow_version:
+            self._follow_version = checker.version
+            self.following = set(str(user_id) for user_id in checker.tracking_terms())
+
+    def _followed(self, status):
+        """True if the stream may have delivered status for a followed user"""
+        user_ids = [(status.get('user') or {}).get('id'),
+                    status.get('in_reply_to_user_id'),
+                    ((status.get('retweeted_status') or {}).get('user') or {}).get('id')]
+        return any(user_id is not None and str(user_id) in self.following for user_id in user_ids)
+
+    def process(self, status):
+        self._refresh()
+
+        matched = self.index.match(status)
+        status['matched_locations'] = matched
+
+        if self.drop_unmatched and not matched and not status.get('matched_terms') \
+                and not self._followed(status):
+            return None
+        return status
@@ -17,14 +17,23 @@ class JsonStreamListener(StreamListener):
 
     Extending this would allow more conscientious handling of rate
      limit messages or other errors, for example.
+
+    If a projection is given (see twitter_monitor.projection), on_status
+     receives the compact record it makes instead of the status dict.
     """
 
-    def __init__(self, api=None):
+    def __init__(self, api=None, projection=None):
         super(JsonStreamListener, self).__init__(api)
         self.streaming_exception = None
         self.error = False
+        self.terminate = False
+        self.projection = projection
 
     def on_data(self, data):
+        if self.terminate:
+            # Shutting down, so refuse anything new
+            return False
+
         try:
             entity = json.loads(data)
             if not isinstance(entity, dict):
@@ -64,6 +73,8 @@ class JsonStreamListener(StreamListener):
             return self.on_stall_warning(warning['code'], warning['message'], warning['percent_full'])
 
         elif 'in_reply_to_status_id' in entity:
+            if self.projection is not None:
+                entity = self.projection(entity, raw=data.strip())
             return self.on_status(entity)
         else:
             return self.on_unknown(entity)
@@ -122,3 +133,15 @@ class JsonStreamListener(StreamListener):
         """An exception occurred in the streaming thread"""
         logger.error('Exception from stream!', exc_info=True)
         self.streaming_exception = exception
+
+    def set_terminate(self):
+        """Stop accepting new data and tell the tweepy stream to quit"""
+        self.terminate = True
+
+    def close(self, timeout=None):
+        """
+        Called once the stream has stopped during shutdown.
+        Subclasses that buffer or queue data should drain it and flush
+        their outputs here, taking no longer than timeout seconds.
+        """
+        pass
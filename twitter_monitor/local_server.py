@@ -0,0 +1,86 @@
+"""
+Serving a request handler locally, on a Unix domain socket
+or a TCP port, from background threads.
+"""
+
+import os
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+__all__ = ['LocalServer']
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalServer(object):
+    """
+    Serves handler (a socketserver request handler class) on a
+    Unix domain socket (if address is a path) or a local TCP port
+    (if address is a (host, port) tuple), each connection on its
+    own thread. The keyword arguments are set as attributes of the
+    server, for handlers to reach through self.server.
+
+    Once started, address is the address actually bound,
+    so port 0 picks a free port.
+    """
+
+    def __init__(self, address, handler, **attributes):
+        self.address = address
+        self.handler = handler
+        self.attributes = attributes
+        self._server = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self):
+        """Start serving, returning the address bound"""
+        if self._server is not None:
+            return self.address
+
+        if isinstance(self.address, tuple):
+            server = _TCPServer(self.address, self.handler)
+        else:
+            if os.path.exists(self.address):
+                # Left over from a previous run
+                os.unlink(self.address)
+            server = _UnixServer(self.address, self.handler)
+
+        for name, value in self.attributes.items():
+            setattr(server, name, value)
+        self._server = server
+        self.address = server.server_address
+
+        self._thread = threading.Thread(target=server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self.address
+
+    def close(self):
+        """Stop serving, and remove the socket file of a Unix socket"""
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        if self._server.address_family == getattr(socket, 'AF_UNIX', None):
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
+        self._server = None
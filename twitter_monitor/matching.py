@@ -0,0 +1,113 @@
+"""
+Client-side attribution of statuses to the tracked terms they matched.
+
+The streaming API does not say which track terms a status matched,
+so this reproduces its matching rules closely enough to attribute them.
+"""
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['TermMatcher', 'status_tokens']
+
+_TOKEN_RE = re.compile(r"[#@$]?\w+", re.UNICODE)
+
+
+def _add_tokens(tokens, text):
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.add(token)
+        if token[0] in '#@$':
+            # Plain words also match hashtags, mentions and cashtags
+            tokens.add(token[1:])
+
+
+def status_text(status):
+    """Get the full text of a status, even if it was truncated"""
+    extended = status.get('extended_tweet')
+    if extended and 'full_text' in extended:
+        return extended['full_text']
+    return status.get('full_text') or status.get('text') or ''
+
+
+def status_tokens(status):
+    """
+    Get the set of lower-case words that the streaming API
+    matches track terms against: the text, urls and screen name,
+    including those of any retweeted or quoted status.
+    """
+    tokens = set()
+
+    for item in (status, status.get('retweeted_status'), status.get('quoted_status')):
+        if not item:
+            continue
+
+        _add_tokens(tokens, status_text(item))
+
+        user = item.get('user')
+        if user and user.get('screen_name'):
+            _add_tokens(tokens, user['screen_name'])
+
+        entities = item.get('entities') or {}
+        for url in entities.get('urls') or ():
+            if url.get('expanded_url'):
+                _add_tokens(tokens, url['expanded_url'])
+
+    return tokens
+
+
+class TermMatcher(object):
+    """
+    Works out which tracked terms a status matched.
+
+    A term matches if every one of its space-separated words
+    appears in the status, ignoring case.
+
+    If a term checker is given, the matcher follows its
+    current terms, rebuilding its index whenever they change.
+    """
+
+    def __init__(self, term_checker=None, terms=None):
+        self.term_checker = term_checker
+        self._version = None
+        self._index = {}
+
+        if terms is not None:
+            self.set_terms(terms)
+
+    def set_terms(self, terms):
+        """Replace the terms to match"""
+        index = {}
+        for term in terms:
+            words = term.lower().split()
+            if words:
+                index.setdefault(words[0], []).append((term, words[1:]))
+
+        # Swap in the whole index at once, since
+        # matching may be happening in another thread
+        self._index = index
+
+    def _refresh(self):
+        checker = self.term_checker
+        if checker is not None and checker.version != self._version:
+            self._version = checker.version
+            self.set_terms(checker.tracking_terms())
+
+    def match(self, status):
+        """Returns a sorted list of the terms that status matched"""
+        self._refresh()
+
+        index = self._index
+        if not index:
+            return []
+
+        tokens = status_tokens(status)
+        matched = []
+        for token in tokens:
+            for term, rest in index.get(token, ()):
+                if all(word in tokens for word in rest):
+                    matched.append(term)
+
+        matched.sort()
+        return matched
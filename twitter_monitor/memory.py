@@ -0,0 +1,174 @@
+"""
+Tracking down slow memory growth in long-running collectors.
+
+A MemoryMonitor takes a tracemalloc snapshot every so often,
+compares it with one taken at the start, and logs the
+allocation sites that have grown the most. It also keeps
+the process's RSS and the number of live objects of each type.
+"""
+
+import gc
+import sys
+import logging
+import threading
+import collections
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 has no tracemalloc, only RSS and object counts are kept
+    tracemalloc = None
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['rss_bytes', 'object_counts', 'MemoryMonitor']
+
+
+def rss_bytes():
+    """The resident set size of this process, or None if it can't be found"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Only the peak is available here, in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def object_counts(limit=20):
+    """The limit most common types of objects the garbage collector tracks, as (name, count) pairs"""
+    counts = collections.Counter(type(obj).__name__ for obj in gc.get_objects())
+    return counts.most_common(limit)
+
+
+class MemoryMonitor(object):
+    """
+    Every interval seconds, compares a tracemalloc snapshot with
+    the baseline taken at start() and logs the top growing
+    allocation sites, along with RSS, traced memory and the most
+    common types of objects. metrics() gives the latest figures.
+
+    The overhead can be tuned: frames is how much of each
+    allocation's traceback tracemalloc keeps (1 is cheapest,
+    more tells apart allocations made by the same line for
+    different callers), and object counts, which walk every
+    tracked object, can be turned off with count_objects=False.
+    """
+
+    def __init__(self, interval=600, top=10, frames=1, count_objects=True):
+        self.interval = interval
+        self.top = top
+        self.frames = frames
+        self.count_objects = count_objects
+
+        self.baseline = None
+        self.growth = []
+        self.checks = 0
+        self._metrics = {}
+        self._started_tracing = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        # Leave out the monitor's own allocations
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    def start(self):
+        """Take the baseline and start checking every interval seconds"""
+        if tracemalloc is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._started_tracing = True
+            self.baseline = self._snapshot()
+        else:
+            logger.warning("tracemalloc is not available, only tracking RSS and object counts")
+
+        self.update_metrics()
+        logger.info("Memory monitoring started, RSS %s bytes", self._metrics.get('rss'))
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='memory-monitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop checking, and stop tracemalloc if start() started it"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.baseline = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.error("Memory check failed", exc_info=True)
+
+    def check(self):
+        """Compare with the baseline, log the top growth, and update and log the metrics"""
+        self.checks += 1
+        if self.baseline is not None:
+            key = 'lineno' if self.frames <= 1 else 'traceback'
+            differences = self._snapshot().compare_to(self.baseline, key)
+            growth = [stat for stat in differences if stat.size_diff > 0][:self.top]
+
+            with self._lock:
+                self.growth = growth
+
+            logger.info("Top %d growing allocation sites since start:", len(growth))
+            for stat in growth:
+                # Tracebacks run from the oldest frame to the allocation itself
+                frame = stat.traceback[-1]
+                logger.info("  %s:%s: +%d bytes in %+d blocks (%d bytes now)",
+                            frame.filename, frame.lineno, stat.size_diff, stat.count_diff, stat.size)
+                for caller in reversed(stat.traceback[:-1]):
+                    logger.info("    called from %s:%s", caller.filename, caller.lineno)
+
+        self.update_metrics()
+        metrics = self.metrics()
+        self.log_metrics(metrics)
+        return metrics
+
+    def log_metrics(self, metrics):
+        logger.info("Memory: RSS %s bytes, %s bytes traced (peak %s)",
+                    metrics.get('rss'), metrics.get('traced'), metrics.get('traced_peak'))
+        objects = metrics.get('objects')
+        if objects:
+            top = sorted(objects.items(), key=lambda item: item[1], reverse=True)[:self.top]
+            logger.info("Most common objects: %s", ', '.join('%s %d' % item for item in top))
+
+    def update_metrics(self):
+        metrics = {'rss': rss_bytes(), 'checks': self.checks}
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            metrics['traced'], metrics['traced_peak'] = tracemalloc.get_traced_memory()
+        if self.count_objects:
+            metrics['objects'] = dict(object_counts(self.top * 2))
+
+        with self._lock:
+            self._metrics = metrics
+
+    def metrics(self):
+        """The latest RSS, traced memory and object counts by type"""
+        with self._lock:
+            return dict(self._metrics)
@@ -0,0 +1,384 @@
+"""
+Running several streaming connections, each with its own
+credentials, from one process.
+"""
+
+from time import time
+import collections
+import threading
+import logging
+
+from .checker import TermChecker
+from .listener import JsonStreamListener
+from .stream import DynamicTwitterStream
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['MultiStreamManager', 'ConnectionListener', 'ShardTermChecker', 'assign_terms']
+
+# Error codes that mean a connection is being rate limited
+RATE_LIMITED = (420, 429)
+
+
+class ConnectionListener(JsonStreamListener):
+    """
+    Listens to one connection on behalf of a listener shared by all of them.
+
+    Error state is kept per connection, so each stream can be
+    restarted on its own. Messages are handed to the shared listener
+    one at a time, and statuses already delivered by another
+    connection (a tweet can match terms on several) are skipped.
+    """
+
+    def __init__(self, shared, lock, recent, name=None):
+        super(ConnectionListener, self).__init__(projection=getattr(shared, 'projection', None))
+        self.shared = shared
+        self.lock = lock
+        self.recent = recent
+        self.name = name
+
+        self.received = 0
+        self.duplicates = 0
+        self.limited = 0
+
+    def on_status(self, status):
+        with self.lock:
+            self.received += 1
+            if self.recent.seen(status['id']):
+                self.duplicates += 1
+                return not self.terminate
+            return self.shared.on_status(status)
+
+    def _forward(self, name, *args):
+        with self.lock:
+            return getattr(self.shared, name)(*args)
+
+    def on_delete(self, status_id, user_id):
+        return self._forward('on_delete', status_id, user_id)
+
+    def on_scrub_geo(self, user_id, up_to_status_id):
+        return self._forward('on_scrub_geo', user_id, up_to_status_id)
+
+    def on_limit(self, track):
+        self.limited = track
+        return self._forward('on_limit', track)
+
+    def on_status_withheld(self, status_id, user_id, countries):
+        return self._forward('on_status_withheld', status_id, user_id, countries)
+
+    def on_user_withheld(self, user_id, countries):
+        return self._forward('on_user_withheld', user_id, countries)
+
+    def on_disconnect(self, code, stream_name, reason):
+        return self._forward('on_disconnect', code, stream_name, reason)
+
+    def on_stall_warning(self, code, message, percent_full):
+        return self._forward('on_stall_warning', code, message, percent_full)
+
+    def on_unknown(self, entity):
+        return self._forward('on_unknown', entity)
+
+    def on_error(self, status_code):
+        logger.error('Twitter returned error code %s on connection %s', status_code, self.name)
+        self.error = status_code
+        return False
+
+
+class _RecentIds(object):
+    """The last size status ids seen, for spotting duplicates"""
+
+    def __init__(self, size):
+        self.size = size
+        self.ids = set()
+        self.order = collections.deque()
+
+    def seen(self, status_id):
+        """Returns True if status_id was seen recently, and remembers it"""
+        if status_id in self.ids:
+            return True
+
+        self.ids.add(status_id)
+        self.order.append(status_id)
+        if len(self.order) > self.size:
+            self.ids.discard(self.order.popleft())
+        return False
+
+
+class ShardTermChecker(TermChecker):
+    """The terms a MultiStreamManager has assigned to one connection"""
+
+    def __init__(self, manager, shard):
+        super(ShardTermChecker, self).__init__()
+        self.manager = manager
+        self.shard = shard
+
+    def update_tracking_terms(self):
+        return self.manager.shard_terms(self.shard)
+
+    def on_stream_live(self):
+        self.manager.on_connection_live()
+
+
+def assign_terms(terms, previous, shards, capacity):
+    """
+    Spreads terms across shards, at most capacity per shard.
+    Terms stay where they were in the previous assignments
+    (a dict of term to shard) if that shard is in shards and has
+    room, and the rest go to the least loaded shards.
+
+    Returns the new assignments and the set of terms that did not fit.
+    """
+    loads = dict((shard, 0) for shard in shards)
+
+    assignments = {}
+    moving = []
+    for term in sorted(terms):
+        shard = previous.get(term)
+        if shard in loads and loads[shard] < capacity:
+            assignments[term] = shard
+            loads[shard] += 1
+        else:
+            moving.append(term)
+
+    unassigned = set()
+    for term in moving:
+        if loads:
+            shard = min(loads, key=lambda shard: (loads[shard], shard))
+            if loads[shard] < capacity:
+                assignments[term] = shard
+                loads[shard] += 1
+                continue
+        unassigned.add(term)
+
+    if unassigned:
+        logger.warning("Not enough connections for %d terms", len(unassigned))
+
+    return assignments, unassigned
+
+
+class _Connection(object):
+
+    def __init__(self, shard, stream, backoff):
+        self.shard = shard
+        self.stream = stream
+        self.backoff = backoff
+        self.limited_until = None
+        self.available_since = None
+
+    @property
+    def listener(self):
+        return self.stream.listener
+
+    def available(self, now):
+        return self.limited_until is None or now >= self.limited_until
+
+
+class MultiStreamManager(object):
+    """
+    Owns a DynamicTwitterStream for each of several auth objects,
+    sharing one term checker and one listener between them.
+
+    Terms from the term checker are spread across the connections,
+    at most capacity per connection. Assignments are sticky, so
+    adding or removing terms only restarts the connections they
+    belong to. A connection that is rate limited (420) has its terms
+    moved to the others, and is left idle for a backoff that
+    starts at rate_limit_backoff seconds and doubles each time, until
+    the connection has streamed for stable_after seconds unlimited.
+    The term checker hears the stream is live (on_stream_live) once
+    every connection restarted with new terms has connected.
+
+    Use start_polling() and stop_polling() or shutdown()
+    as with a single DynamicTwitterStream.
+    """
+
+    def __init__(self, auths, listener, term_checker, capacity=400,
+                 dedupe_size=100000, rate_limit_backoff=60, stable_after=60, **options):
+        self.listener = listener
+        self.term_checker = term_checker
+        self.capacity = capacity
+        self.rate_limit_backoff = rate_limit_backoff
+        self.stable_after = stable_after
+
+        self.lock = threading.RLock()
+        self.recent = _RecentIds(dedupe_size)
+
+        self.connections = []
+        for shard, auth in enumerate(auths):
+            proxy = ConnectionListener(listener, self.lock, self.recent, name=shard)
+            stream = DynamicTwitterStream(auth, proxy, ShardTermChecker(self, shard), **options)
+            self.connections.append(_Connection(shard, stream, rate_limit_backoff))
+
+        if not self.connections:
+            raise ValueError("At least one auth is required")
+
+        self.assignments = {}
+        self.unassigned = set()
+        self.polling = False
+        self._wakeup = threading.Event()
+
+        # Connections restarted with new terms that have not connected yet
+        self._waiting = set()
+        self._waiting_lock = threading.Lock()
+        self._checking = False
+
+    def shard_terms(self, shard):
+        """The terms assigned to a connection"""
+        return set(term for term, assigned in self.assignments.items() if assigned == shard)
+
+    def check_connections(self, now=None):
+        """
+        Looks for connections that have been rate limited.
+        Returns True if any connection became limited or available.
+        """
+        if now is None:
+            now = time()
+
+        changed = False
+        for connection in self.connections:
+            listener = connection.listener
+
+            if listener.error in RATE_LIMITED:
+                connection.limited_until = now + connection.backoff
+                logger.warning("Connection %s rate limited, moving its terms for %s seconds",
+                               connection.shard, connection.backoff)
+                connection.backoff *= 2
+                listener.error = False
+                changed = True
+
+            elif connection.limited_until is not None and now >= connection.limited_until:
+                logger.info("Connection %s available again", connection.shard)
+                connection.limited_until = None
+                connection.available_since = now
+                changed = True
+
+            elif connection.backoff != self.rate_limit_backoff and connection.limited_until is None \
+                    and now - connection.available_since >= self.stable_after \
+                    and connection.stream.stream is not None and connection.stream.stream.running:
+                # It has streamed unlimited for a while, so start over next time
+                connection.backoff = self.rate_limit_backoff
+
+        return changed
+
+    def rebalance(self, terms=None, now=None):
+        """
+        Assigns terms to available connections. Terms keep their
+        connection if it is still available and has room.
+        """
+        if terms is None:
+            terms = self.term_checker.tracking_terms()
+        if now is None:
+            now = time()
+
+        available = [connection.shard for connection in self.connections if connection.available(now)]
+        self.assignments, self.unassigned = assign_terms(terms, self.assignments, available, self.capacity)
+
+    def update(self):
+        """Check for changes to the terms and connections, and restart streams to match"""
+        # Connections made while checking are reported below instead,
+        # since other connections may be about to restart
+        self._checking = True
+        try:
+            terms_changed = self.term_checker.check()
+            connections_changed = self.check_connections()
+
+            if terms_changed or connections_changed:
+                self.rebalance()
+
+            for connection in self.connections:
+                stream = connection.stream.stream
+                connection.stream.update_stream()
+                if connection.stream.stream is not stream:
+                    with self._waiting_lock:
+                        self._waiting.add(connection.shard)
+        finally:
+            self._checking = False
+
+        self._notify_live()
+
+        for connection in self.connections:
+            connection.stream.handle_exceptions()
+
+    def on_connection_live(self):
+        """Called by a connection's checker once it has connected"""
+        if not self._checking:
+            self._notify_live()
+
+    def _notify_live(self):
+        """Tell the shared checker once every restarted connection has connected"""
+        with self._waiting_lock:
+            for connection in self.connections:
+                stream = connection.stream
+                if stream.connected or stream.stream is None:
+                    self._waiting.discard(connection.shard)
+            if self._waiting:
+                return
+
+        self.term_checker.on_stream_live()
+
+    def start_polling(self, interval):
+        """Start polling for term updates and streaming"""
+        interval = float(interval)
+        self.polling = True
+
+        self.term_checker.reset()
+        self.term_checker.attach(self)
+        for connection in self.connections:
+            connection.stream.term_checker.reset()
+
+        logger.info("Starting polling with %d connections", len(self.connections))
+        while self.polling:
+            loop_start = time()
+            self._wakeup.clear()
+
+            self.update()
+
+            elapsed = time() - loop_start
+            self._wakeup.wait(max(0.1, interval - elapsed))
+
+        logger.warning("Term poll ceased!")
+
+    def wake(self):
+        """Check for changes now instead of waiting out the interval"""
+        self._wakeup.set()
+
+    def stop_polling(self):
+        """Halts the polling loop and all streams"""
+        logger.info("Stopping polling loop")
+        self.polling = False
+        self._wakeup.set()
+        for connection in self.connections:
+            connection.stream.stop_stream()
+
+    def shutdown(self, timeout=None):
+        """Stop all streams and then let the shared listener drain"""
+        deadline = None
+        if timeout is not None:
+            deadline = time() + float(timeout)
+
+        logger.info("Shutting down streams")
+        for connection in self.connections:
+            connection.listener.set_terminate()
+        self.listener.set_terminate()
+        self.stop_polling()
+
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - time())
+        self.listener.close(timeout=remaining)
+
+    def stats(self):
+        """A list of counts for each connection"""
+        now = time()
+        result = []
+        for connection in self.connections:
+            listener = connection.listener
+            result.append({
+                'shard': connection.shard,
+                'terms': len(self.shard_terms(connection.shard)),
+                'received': listener.received,
+                'duplicates': listener.duplicates,
+                'limited': listener.limited,
+                'rate_limited': not connection.available(now),
+            })
+        return result
@@ -0,0 +1,271 @@
+"""
+A sidecar index from tweet id to location in
+newline-delimited JSON captures, such as stream_tweets output.
+
+The index is a sorted file of fixed-size entries (tweet id, file number,
+byte offset, length) searched through a memory map, so lookups take
+O(log n) time without loading the index or the captures into memory.
+A small JSON manifest alongside it records which files have been
+indexed and how far, so that growing files are indexed incrementally.
+
+Usage: python -m twitter_monitor.ndjson_index INDEX FILE [FILE ...]
+"""
+
+import os
+import io
+import json
+import mmap
+import numbers
+import struct
+import logging
+
+from .output import atomic_write
+from .sorted_file import SortedRecordFile, write_records, merge_records
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['NdjsonIndex']
+
+# tweet id, file number, offset, length
+INDEX_ENTRY = struct.Struct('<QIQI')
+
+MANIFEST_SUFFIX = '.manifest'
+
+
+def scan_lines(path, start=0):
+    """
+    Yields (offset, length, line) for each complete line
+    in a file from byte offset start, using a memory map.
+    """
+    size = os.path.getsize(path)
+    if size <= start:
+        return
+
+    with open(path, 'rb') as infile:
+        data = mmap.mmap(infile.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            offset = start
+            while offset < size:
+                end = data.find(b'\n', offset)
+                if end < 0:
+                    # A partial line that is still being written
+                    break
+                yield offset, end - offset, data[offset:end]
+                offset = end + 1
+        finally:
+            data.close()
+
+
+def status_id(line):
+    """Returns the id of the status in a line of JSON, or None"""
+    try:
+        entity = json.loads(line.decode('utf-8'))
+    except ValueError:
+        return None
+    if isinstance(entity, dict) and isinstance(entity.get('id'), numbers.Integral):
+        return entity['id']
+    return None
+
+
+class NdjsonIndex(object):
+    """
+    Indexes tweet ids in newline-delimited JSON files.
+
+    Call update() with the capture files to index any lines
+    added since the last update, then use lookup(), range()
+    and read() to find tweets.
+
+    The index is a few sorted run files (path.1, path.2, ...) and a
+    manifest listing them, their lengths, and how far each capture
+    file has been indexed. Each update writes what it adds as a new run,
+    merged only with runs no bigger than it, so an update costs about
+    as much as what it adds rather than the whole index. The manifest
+    is replaced atomically once the runs it lists are written, so after
+    a crash the previous manifest still matches the runs it lists.
+    """
+
+    # New entries are sorted in runs of this many, spilled to disk,
+    # and merged, so memory stays bounded when indexing huge files
+    RUN_SIZE = 1000000
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = path + MANIFEST_SUFFIX
+        self.files = []
+        self.indexed = []
+        self.runs = []
+        self._next_run = 1
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+
+        with open(self.manifest_path) as infile:
+            manifest = json.load(infile)
+        self.files = [item['path'] for item in manifest['files']]
+        self.indexed = [item['indexed'] for item in manifest['files']]
+        self._next_run = manifest['next_run']
+
+        directory = os.path.dirname(self.path)
+        for item in manifest['runs']:
+            run_path = os.path.join(directory, item['name'])
+            size = os.path.getsize(run_path) if os.path.exists(run_path) else None
+            if size != item['entries'] * INDEX_ENTRY.size:
+                raise ValueError("%s does not match %s, rebuild the index" % (run_path, self.manifest_path))
+            self.runs.append(SortedRecordFile(run_path, INDEX_ENTRY))
+
+    def _save_manifest(self):
+        atomic_write(self.manifest_path, json.dumps({
+            'files': [{'path': path, 'indexed': indexed} for path, indexed in zip(self.files, self.indexed)],
+            'runs': [{'name': os.path.basename(run.path), 'entries': len(run)} for run in self.runs],
+            'next_run': self._next_run}))
+
+    def _write_run(self, entries):
+        # Never one the manifest lists, so that stays valid until replaced
+        path = '%s.%d' % (self.path, self._next_run)
+        self._next_run += 1
+        write_records(path, INDEX_ENTRY, entries)
+        return SortedRecordFile(path, INDEX_ENTRY)
+
+    def update(self, paths):
+        """
+        Index new lines in the given files. Returns the number of tweets added.
+        Files that have shrunk since they were indexed are reindexed from scratch.
+        """
+        new_entries = []
+        spilled = []
+        added = 0
+        reindexed = set()
+
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in self.files:
+                file_number = self.files.index(path)
+            else:
+                file_number = len(self.files)
+                self.files.append(path)
+                self.indexed.append(0)
+
+            start = self.indexed[file_number]
+            if os.path.getsize(path) < start:
+                logger.warning("%s has shrunk, reindexing it", path)
+                reindexed.add(file_number)
+                start = 0
+
+            end = start
+            for offset, length, line in scan_lines(path, start):
+                tweet_id = status_id(line)
+                if tweet_id is not None:
+                    new_entries.append((tweet_id, file_number, offset, length))
+                    added += 1
+                    if len(new_entries) >= self.RUN_SIZE:
+                        spilled.append(self._spill(new_entries, len(spilled)))
+                        new_entries = []
+                end = offset + length + 1
+
+            self.indexed[file_number] = end
+
+        obsolete = []
+        if added or reindexed:
+            new_entries.sort()
+            sources = [new_entries] + spilled
+            if reindexed:
+                # The old entries for those files are in every run, so they all go
+                sources += [(entry for entry in run if entry[1] not in reindexed) for run in self.runs]
+                obsolete, self.runs = self.runs, []
+
+            run = self._write_run(merge_records(*sources))
+            while self.runs and len(self.runs[-1]) <= len(run):
+                previous = self.runs.pop()
+                obsolete += [previous, run]
+                run = self._write_run(merge_records(previous, run))
+
+            if len(run):
+                self.runs.append(run)
+            else:
+                obsolete.append(run)
+
+        for run in spilled:
+            run.close()
+            os.remove(run.path)
+
+        self._save_manifest()
+
+        # Only now that the manifest no longer lists them
+        for run in obsolete:
+            run.close()
+            os.remove(run.path)
+        return added
+
+    def _spill(self, entries, number):
+        """Write a sorted run of entries to a temporary file"""
+        entries.sort()
+        path = '%s.spill%d' % (self.path, number)
+        write_records(path, INDEX_ENTRY, entries)
+        return SortedRecordFile(path, INDEX_ENTRY)
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def lookup(self, tweet_id):
+        """Returns (path, offset, length) for a tweet id, or None"""
+        found = None
+        for run in self.runs:
+            position = run.bisect_left(tweet_id)
+            if position < len(run):
+                entry = run[position]
+                if entry[0] == tweet_id and (found is None or entry < found):
+                    found = entry
+
+        if found is None:
+            return None
+        found_id, file_number, offset, length = found
+        return self.files[file_number], offset, length
+
+    def range(self, low, high):
+        """Yields (tweet id, path, offset, length) for ids with low <= id < high"""
+        for tweet_id, file_number, offset, length in merge_records(*[run.range(low, high) for run in self.runs]):
+            yield tweet_id, self.files[file_number], offset, length
+
+    def read(self, tweet_id):
+        """Returns the raw JSON line for a tweet id, or None"""
+        location = self.lookup(tweet_id)
+        if location is None:
+            return None
+
+        path, offset, length = location
+        with io.open(path, 'rb') as infile:
+            infile.seek(offset)
+            return infile.read(length)
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Index tweet ids in NDJSON capture files.')
+    parser.add_argument('index', help='path of the index file')
+    parser.add_argument('files', nargs='*', help='capture files to index')
+    parser.add_argument('--lookup', type=int, action='append', default=[], help='print the tweet with this id')
+    args = parser.parse_args(argv)
+
+    index = NdjsonIndex(args.index)
+    if args.files:
+        added = index.update(args.files)
+        logger.info("Indexed %d new tweets, %d in total", added, len(index))
+
+    for tweet_id in args.lookup:
+        line = index.read(tweet_id)
+        if line is not None:
+            print(line.decode('utf-8'))
+
+    index.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,190 @@
+"""
+Crash-safe output files for captured tweets.
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['DurableFileWriter', 'replace_file', 'atomic_write']
+
+
+def replace_file(src, dst):
+    """Atomically move src over dst"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
+
+
+def atomic_write(path, data):
+    """
+    Atomically replace path with data, a string or an iterable of
+    strings written in turn (text is encoded as UTF-8). The data is
+    synced to disk first, so after a crash path holds either the
+    old data or the new.
+    """
+    if isinstance(data, (bytes, type(u''))):
+        data = [data]
+
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as outfile:
+            for chunk in data:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                outfile.write(chunk)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+    except Exception:
+        os.remove(temp_path)
+        raise
+    replace_file(temp_path, path)
+
+
+class DurableFileWriter(object):
+    """
+    An append-only file of newline-delimited tweets that is
+    synced to disk in groups, every commit_every tweets or
+    every commit_interval seconds, whichever comes first.
+
+    After each commit a sidecar checkpoint file records the
+    last committed byte offset and tweet id. When an existing
+    file is reopened, any partial line left at the end by a crash
+    is truncated and writing continues from there.
+
+    This is file-like enough to be used as the output of a PrintingListener.
+    Calling flush() commits.
+    """
+
+    CHECKPOINT_SUFFIX = '.checkpoint'
+
+    # Bytes to read at a time when looking for the last newline
+    SCAN_SIZE = 65536
+
+    def __init__(self, filename, commit_every=1000, commit_interval=1.0):
+        self.filename = filename
+        self.checkpoint_filename = filename + self.CHECKPOINT_SUFFIX
+        self.commit_every = int(commit_every)
+        self.commit_interval = float(commit_interval)
+
+        self.committed_offset, self.committed_id = self.read_checkpoint()
+        self.recover()
+
+        self.file = open(filename, 'ab')
+        self.offset = os.path.getsize(filename)
+
+        self.pending = 0
+        self.last_commit = time.time()
+        self._last_line = None
+        self._lock = threading.Lock()
+
+    def read_checkpoint(self):
+        """Returns the committed offset and tweet id from the checkpoint file"""
+        try:
+            with open(self.checkpoint_filename, 'r') as infile:
+                checkpoint = json.load(infile)
+            return int(checkpoint['offset']), checkpoint.get('id')
+        except (IOError, OSError):
+            return 0, None
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring unreadable checkpoint %s", self.checkpoint_filename)
+            return 0, None
+
+    def recover(self):
+        """Truncate any partial line left at the end of the file"""
+        if not os.path.exists(self.filename):
+            return
+
+        size = os.path.getsize(self.filename)
+        floor = self.committed_offset
+        if floor > size:
+            logger.warning("Output file %s is shorter than its checkpoint (%d < %d)",
+                           self.filename, size, floor)
+            floor = 0
+
+        with open(self.filename, 'r+b') as outfile:
+            end = self._find_line_end(outfile, floor, size)
+            if end < size:
+                logger.warning("Truncating %d bytes of partial output from %s",
+                               size - end, self.filename)
+                outfile.truncate(end)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+    def _find_line_end(self, infile, floor, size):
+        """
+        Find the offset just past the last newline in the file,
+        searching backwards no further than floor (which is
+        known to be at the end of a complete line).
+        """
+        position = size
+        while position > floor:
+            start = max(floor, position - self.SCAN_SIZE)
+            infile.seek(start)
+            block = infile.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+        return floor
+
+    def write(self, data):
+        """Append data. Each write ending in a newline counts as one tweet."""
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        with self._lock:
+            self.file.write(data)
+            self.offset += len(data)
+
+            if data.endswith(b'\n'):
+                self.pending += 1
+                self._last_line = data
+
+                if self.pending >= self.commit_every or \
+                        time.time() - self.last_commit >= self.commit_interval:
+                    self._commit()
+
+    def flush(self):
+        """Commit everything written so far"""
+        with self._lock:
+            if self.offset == self.committed_offset:
+                # Nothing new, so no need to sync or rewrite the checkpoint
+                return
+            self._commit()
+
+    def _commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        if self._last_line is not None:
+            try:
+                self.committed_id = json.loads(self._last_line.decode('utf-8')).get('id')
+            except (ValueError, AttributeError):
+                pass
+
+        self.committed_offset = self.offset
+        self.write_checkpoint()
+
+        self.pending = 0
+        self._last_line = None
+        self.last_commit = time.time()
+
+    def write_checkpoint(self):
+        """Atomically replace the checkpoint file"""
+        atomic_write(self.checkpoint_filename,
+                     json.dumps({'offset': self.committed_offset, 'id': self.committed_id}))
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        """Commit and close the file"""
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
@@ -0,0 +1,137 @@
+"""
+Listener pipelines: statuses pass through a sequence of
+processing stages before reaching a sink listener.
+"""
+
+import logging
+
+from .listener import JsonStreamListener
+from .matching import TermMatcher
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Stage', 'AttributionStage', 'PipelineListener']
+
+
+class Stage(object):
+    """
+    A step in a PipelineListener.
+
+    This is intended to be extended. process() should return
+    the status (possibly modified), None to drop it, or a list
+    of statuses for the following stages (for stages that hold
+    statuses back and pass them on later).
+    """
+
+    def process(self, status):
+        return status
+
+    def flush(self):
+        """Called at shutdown, returning a list of any statuses still held back"""
+        return []
+
+    def on_limit(self, track):
+        """Called when a limit notice arrives"""
+        pass
+
+    def close(self, timeout=None):
+        """Called when the pipeline shuts down"""
+        pass
+
+
+class AttributionStage(Stage):
+    """
+    Records the tracked terms each status matched
+    in status['matched_terms'], for the stages after it.
+    """
+
+    def __init__(self, term_checker):
+        self.matcher = TermMatcher(term_checker)
+
+    def process(self, status):
+        status['matched_terms'] = self.matcher.match(status)
+        return status
+
+
+class PipelineListener(JsonStreamListener):
+    """
+    Runs each status through stages in order, then hands
+    it to the sink listener (if there is one).
+    Other messages go straight to the sink.
+    """
+
+    def __init__(self, stages, sink=None, api=None, projection=None):
+        super(PipelineListener, self).__init__(api, projection=projection)
+        self.stages = list(stages)
+        self.sink = sink
+
+    def _run(self, status, start=0):
+        """Pass a status through the stages from start on, then to the sink"""
+        for position in range(start, len(self.stages)):
+            status = self.stages[position].process(status)
+            if status is None:
+                return True
+
+            if isinstance(status, list):
+                for item in status:
+                    if self._run(item, position + 1) is False:
+                        return False
+                return True
+
+        if self.sink is not None and self.sink.on_status(status) is False:
+            return False
+        return True
+
+    def on_status(self, status):
+        if self._run(status) is False:
+            return False
+        return not self.terminate
+
+    def _forward(self, name, *args):
+        if self.sink is not None:
+            return getattr(self.sink, name)(*args)
+        return True
+
+    def on_delete(self, status_id, user_id):
+        return self._forward('on_delete', status_id, user_id)
+
+    def on_scrub_geo(self, user_id, up_to_status_id):
+        return self._forward('on_scrub_geo', user_id, up_to_status_id)
+
+    def on_limit(self, track):
+        for stage in self.stages:
+            stage.on_limit(track)
+        return self._forward('on_limit', track)
+
+    def on_status_withheld(self, status_id, user_id, countries):
+        return self._forward('on_status_withheld', status_id, user_id, countries)
+
+    def on_user_withheld(self, user_id, countries):
+        return self._forward('on_user_withheld', user_id, countries)
+
+    def on_disconnect(self, code, stream_name, reason):
+        return self._forward('on_disconnect', code, stream_name, reason)
+
+    def on_stall_warning(self, code, message, percent_full):
+        return self._forward('on_stall_warning', code, message, percent_full)
+
+    def on_unknown(self, entity):
+        return self._forward('on_unknown', entity)
+
+    def set_terminate(self):
+        super(PipelineListener, self).set_terminate()
+        if self.sink is not None:
+            self.sink.set_terminate()
+
+    def close(self, timeout=None):
+        # Statuses held back by a stage still go through the rest
+        for position, stage in enumerate(self.stages):
+            pending = stage.flush()
+            if isinstance(pending, list):
+                for status in pending:
+                    self._run(status, position + 1)
+
+        for stage in self.stages:
+            stage.close(timeout)
+        if self.sink is not None:
+            self.sink.close(timeout)
@@ -0,0 +1,350 @@
+"""
+Finding out where a running collector spends its time,
+without stopping it.
+
+A HookTimer times every listener hook, term check and stream
+restart all the time, cheaply. A Profiler can also be switched
+on and off (by SIGUSR2, with set_profile_listener()) to sample
+the stacks of all threads or to run cProfile over message
+handling, and dumps its results to files when switched off.
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import pstats
+import cProfile
+import threading
+import functools
+import collections
+from timeit import default_timer
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['HookTimer', 'SamplingProfiler', 'Profiler', 'set_profile_listener']
+
+# The stream methods timed as restarts and checks
+STREAM_METHODS = ('update_stream', 'start_stream', 'stop_stream', 'update')
+
+
+class HookTimer(object):
+    """Counts and times calls by name"""
+
+    def __init__(self, clock=default_timer):
+        self.clock = clock
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                self.stats[name] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+
+    def wrap(self, name, function):
+        """Returns function, timed under name"""
+        clock = self.clock
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, clock() - start)
+
+        return timed
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def report(self):
+        """The timings as a table, the most total time first"""
+        with self._lock:
+            rows = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+
+        lines = ['%-40s %10s %12s %12s %12s' % ('hook', 'calls', 'total (s)', 'mean (ms)', 'max (ms)')]
+        for name, (count, total, longest) in rows:
+            lines.append('%-40s %10d %12.3f %12.3f %12.3f' % (name, count, total, 1000 * total / count, 1000 * longest))
+        return '\n'.join(lines) + '\n'
+
+
+def instrument_listener(listener, timer):
+    """Time on_data, keep_alive, write_raw and every on_* handler of a listener"""
+    for name in dir(listener):
+        if name.startswith('on_') or name in ('keep_alive', 'write_raw'):
+            method = getattr(listener, name)
+            if callable(method):
+                setattr(listener, name, timer.wrap(name, method))
+
+
+def instrument_stream(stream, timer):
+    """Time a stream's restarts and its checkers' checks, and its listener's hooks"""
+    for name in STREAM_METHODS:
+        method = getattr(stream, name, None)
+        if method is not None:
+            setattr(stream, name, timer.wrap(name, method))
+
+    checkers = getattr(stream, 'checkers', None)
+    checkers = checkers() if checkers is not None else [stream.term_checker]
+    for checker in checkers:
+        checker.check = timer.wrap('check:%s' % checker.__class__.__name__, checker.check)
+
+    instrument_listener(stream.listener, timer)
+
+
+def _function(frame):
+    code = frame.f_code
+    return '%s:%s:%d' % (os.path.basename(code.co_filename), code.co_name, code.co_firstlineno)
+
+
+class SamplingProfiler(object):
+    """
+    Looks at the stack of every other thread every interval
+    seconds, and counts the stacks seen. Its overhead depends
+    only on the interval, not on how busy the threads are.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        me = threading.current_thread().ident
+        while not self._stop.wait(self.interval):
+            self.sample(me)
+
+    def sample(self, skip=None):
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(_function(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def folded(self):
+        """The stacks in the folded format flame graph tools read"""
+        return ''.join('%s %d\n' % (';'.join(stack), count) for stack, count in self.stacks.most_common())
+
+    def report(self, limit=50):
+        """The functions seen most, by samples spent in them and below them"""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack[1:]):
+                total[function] += count
+
+        lines = ['%d samples every %gs' % (self.samples, self.interval), '',
+                 '%10s %10s  %s' % ('own', 'total', 'function')]
+        for function, count in total.most_common(limit):
+            lines.append('%10d %10d  %s' % (own[function], count, function))
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler(object):
+    """
+    Profiling that can be switched on and off while running.
+
+    In 'sample' mode a SamplingProfiler covers every thread.
+    In 'cprofile' mode, cProfile runs over the listener's message
+    handling (each on_data call), with exact call counts but more
+    overhead. When switched off, the results are written to
+    directory, along with the hook timings.
+
+    attach() starts timing the stream's hooks straight away.
+    request_toggle() asks for profiling to be switched on or off
+    by a background thread (started by listen()), so it is safe
+    to call from a signal handler.
+    """
+
+    def __init__(self, directory='.', mode='sample', interval=0.01):
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError("Unknown profiling mode: %s" % mode)
+
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self.timer = HookTimer()
+
+        self.running = False
+        self._sampler = None
+        self._profile = None
+        self._lock = threading.Lock()
+
+        self._toggle_requested = threading.Event()
+        self._closing = False
+        self._thread = None
+
+    def attach(self, stream):
+        """Time the stream's hooks, and let cProfile see its listener"""
+        instrument_stream(stream, self.timer)
+
+        listener = stream.listener
+        on_data = listener.on_data
+
+        @functools.wraps(on_data)
+        def profiled(*args, **kwargs):
+            profile = self._profile
+            if profile is None:
+                return on_data(*args, **kwargs)
+
+            # One cProfile can only follow one thread at a time
+            with self._lock:
+                return profile.runcall(on_data, *args, **kwargs)
+
+        listener.on_data = profiled
+
+    def start(self):
+        if self.running:
+            return
+
+        logger.info("Starting %s profiling", self.mode)
+        if self.mode == 'sample':
+            self._sampler = SamplingProfiler(self.interval)
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+        self.running = True
+
+    def stop(self):
+        """Stop profiling and dump the results, returning the files written"""
+        if not self.running:
+            return []
+
+        self.running = False
+        prefix = os.path.join(self.directory, 'profile-%s-%d' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        paths = []
+
+        if self._sampler is not None:
+            self._sampler.stop()
+            paths.append(self._write(prefix + '.txt', self._sampler.report()))
+            paths.append(self._write(prefix + '.folded', self._sampler.folded()))
+            self._sampler = None
+
+        if self._profile is not None:
+            with self._lock:
+                profile, self._profile = self._profile, None
+            profile.dump_stats(prefix + '.prof')
+            paths.append(prefix + '.prof')
+            paths.append(self._write(prefix + '.txt', self._pstats_report(profile)))
+
+        paths.append(self.dump_timings(prefix + '-hooks.txt'))
+        logger.info("Profiling stopped, wrote %s", ', '.join(paths))
+        return paths
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return []
+
+    def listen(self):
+        """Start the thread that switches profiling when requested"""
+        if self._thread is not None:
+            return
+
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name='profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request_toggle(self):
+        """Ask the listening thread to switch profiling on or off"""
+        self._toggle_requested.set()
+
+    def _run(self):
+        while True:
+            self._toggle_requested.wait()
+            self._toggle_requested.clear()
+            if self._closing:
+                return
+
+            try:
+                self.toggle()
+            except Exception:
+                logger.error("Profiling failed", exc_info=True)
+
+    def close(self):
+        """
+        Stop listening and profiling, writing the results, or
+        just the hook timings if profiling was off. Returns the files written.
+        """
+        if self._thread is not None:
+            self._closing = True
+            self._toggle_requested.set()
+            self._thread.join()
+            self._thread = None
+
+        paths = self.stop()
+        if not paths:
+            paths = [self.dump_timings()]
+        return paths
+
+    def dump_timings(self, path=None):
+        """Write the hook timings report, returning the file written"""
+        if path is None:
+            path = os.path.join(self.directory, 'hooks-%s-%d.txt' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        return self._write(path, self.timer.report())
+
+    def _pstats_report(self, profile, limit=50):
+        try:
+            from io import StringIO
+        except ImportError:
+            from StringIO import StringIO
+
+        out = StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def _write(self, path, text):
+        with open(path, 'w') as out:
+            out.write(text)
+        return path
+
+
+def set_profile_listener(profiler, signum=getattr(signal, 'SIGUSR2', None)):
+    """
+    Switch profiling on and off when the signal (SIGUSR2) is received.
+    The switching is done on the profiler's own thread, not in the handler.
+    """
+
+    def toggle(sig, frame):
+        profiler.request_toggle()
+
+    if signum is not None:
+        profiler.listen()
+        signal.signal(signum, toggle)
+    else:
+        logger.warning("Cannot set SIGUSR2 signal for profiling.")
@@ -0,0 +1,137 @@
+"""
+Compact representations of statuses for listeners that keep tweets around.
+
+A decoded status dict is often tens of kilobytes of Python objects.
+A Projection pulls out only the declared fields into a record
+class with __slots__, optionally keeping the raw JSON so that
+the full status can still be decoded on demand.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Projection']
+
+DEFAULT_FIELDS = (
+    'id',
+    'created_at',
+    ('user_id', 'user.id'),
+    ('screen_name', 'user.screen_name'),
+    'text',
+    'lang',
+    ('hashtags', 'entities.hashtags[].text'),
+)
+
+
+def _parse_path(path):
+    """Turn 'entities.hashtags[].text' into ['entities', 'hashtags', [], 'text']"""
+    steps = []
+    for part in path.split('.'):
+        if part.endswith('[]'):
+            steps.append(part[:-2])
+            steps.append(None)
+        else:
+            steps.append(part)
+    return steps
+
+
+def _extract(value, steps):
+    for position, step in enumerate(steps):
+        if value is None:
+            return None
+        if step is None:
+            # Map the rest of the path over a list
+            rest = steps[position + 1:]
+            return tuple(_extract(item, rest) for item in value)
+        if not isinstance(value, dict):
+            return None
+        value = value.get(step)
+    return value
+
+
+class _Record(object):
+    """Base class for projected records"""
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __contains__(self, name):
+        return name in self.__slots__
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def decode(self):
+        """Decode the full status from the raw JSON, if it was kept"""
+        raw = getattr(self, 'raw', None)
+        if raw is None:
+            raise ValueError("The raw status was not kept")
+        return json.loads(raw)
+
+
+class Projection(object):
+    """
+    Projects statuses onto compact records.
+
+    Each field is a key of the status, or a (name, path) pair where
+    path is dotted, like 'user.screen_name'. A path step ending in []
+    maps the rest of the path over a list, so 'entities.hashtags[].text'
+    gives a tuple of hashtag texts.
+
+    If keep_raw is True the record also has a raw field holding the JSON
+    text, which is much smaller than the decoded dict. The full status
+    can be decoded from it with record.decode().
+
+    Pass a Projection to JsonStreamListener to get records in on_status.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, keep_raw=False, name='Tweet'):
+        self.fields = []
+        for field in fields:
+            if isinstance(field, tuple):
+                field_name, path = field
+            else:
+                field_name, path = field, field
+            self.fields.append((field_name, _parse_path(path)))
+
+        self.keep_raw = keep_raw
+        slots = [field_name for field_name, steps in self.fields]
+        if keep_raw:
+            slots.append('raw')
+
+        self.record_class = type(name, (_Record,), {'__slots__': tuple(slots)})
+
+    def __call__(self, status, raw=None):
+        values = [_extract(status, steps) for field_name, steps in self.fields]
+        if self.keep_raw:
+            if raw is None:
+                raw = json.dumps(status)
+            values.append(raw)
+        return self.record_class(*values)
@@ -0,0 +1,206 @@
+"""
+A faster way of reading messages off the streaming connection.
+"""
+
+import sys
+import zlib
+import logging
+
+import tweepy
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['LineReader', 'GzipDecoder', 'FastStream']
+
+if sys.version_info[0] >= 3:
+    # Decodes straight from the memoryview
+    _decode = str
+else:
+    def _decode(view, encoding):
+        return view.tobytes().decode(encoding)
+
+
+class LineReader(object):
+    """
+    Splits a stream of byte chunks into messages.
+
+    Chunks are appended to one reusable buffer, and each message
+    is sliced out of it through a memoryview and decoded straight
+    from there. Messages may be split across chunks in any way.
+    Blank keep-alive lines and the length lines of delimited
+    streams are counted and skipped.
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.buffer = bytearray()
+        self.keep_alives = 0
+        self.messages = 0
+
+    def feed(self, chunk):
+        """Add a chunk, returning the complete messages it finished"""
+        buffer = self.buffer
+        # Lines ending in the previous chunks have been handled already
+        search = len(buffer)
+        buffer += chunk
+
+        messages = []
+        start = 0
+        newline = buffer.find(b'\n', search)
+        if newline < 0:
+            return messages
+
+        view = memoryview(buffer)
+        try:
+            while newline >= 0:
+                end = newline
+                if end > start and buffer[end - 1] == 13:  # \r
+                    end -= 1
+
+                if end == start:
+                    self.keep_alives += 1
+                elif buffer[start] != 123 and view[start:end].tobytes().isdigit():  # not {
+                    # A length line, from a delimited=length stream
+                    pass
+                else:
+                    messages.append(_decode(view[start:end], self.encoding))
+
+                start = newline + 1
+                newline = buffer.find(b'\n', start)
+        finally:
+            if hasattr(view, 'release'):
+                view.release()
+
+        del buffer[:start]
+        self.messages += len(messages)
+        return messages
+
+    def lines(self, chunks):
+        """Yields messages from an iterable of chunks, with None for each keep-alive"""
+        for chunk in chunks:
+            keep_alives = self.keep_alives
+            messages = self.feed(chunk)
+
+            for _ in range(self.keep_alives - keep_alives):
+                yield None
+            for message in messages:
+                yield message
+
+
+class GzipDecoder(object):
+    """
+    Decompresses a gzip stream a chunk at a time,
+    counting the bytes that go in and come out.
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+
+    def decompress(self, chunk):
+        self.compressed_bytes += len(chunk)
+        data = self.decompressor.decompress(chunk)
+
+        # Another gzip member may follow the end of one
+        while self.decompressor.unused_data:
+            rest = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data += self.decompressor.decompress(rest)
+
+        self.decompressed_bytes += len(data)
+        return data
+
+    def chunks(self, chunks):
+        """Yields the decompressed data from an iterable of compressed chunks"""
+        for chunk in chunks:
+            data = self.decompress(chunk)
+            if data:
+                yield data
+
+
+class FastStream(tweepy.Stream):
+    """
+    A tweepy Stream that reads the response with a LineReader.
+
+    The response is read as the chunks arrive, up to chunk_size bytes
+    at a time (64KB by default), instead of one small read at a time.
+    Messages are requested newline-delimited, without length prefixes.
+
+    If gzip is True, the stream is requested gzip compressed and
+    decompressed as it arrives. compressed_bytes and decompressed_bytes
+    count the body bytes received and the bytes they decoded to.
+    """
+
+    def __init__(self, auth, listener, gzip=False, **options):
+        options.setdefault('chunk_size', 65536)
+        if gzip:
+            headers = dict(options.get('headers') or {})
+            headers['Accept-Encoding'] = 'deflate, gzip'
+            options['headers'] = headers
+
+        super(FastStream, self).__init__(auth, listener, **options)
+        self.decoder = None
+        self._compressed_bytes = 0
+        self._decompressed_bytes = 0
+
+    @property
+    def compressed_bytes(self):
+        if self.decoder is not None:
+            return self._compressed_bytes + self.decoder.compressed_bytes
+        return self._compressed_bytes
+
+    @property
+    def decompressed_bytes(self):
+        if self.decoder is not None:
+            return self._decompressed_bytes + self.decoder.decompressed_bytes
+        return self._decompressed_bytes
+
+    def compression_ratio(self):
+        """How many times smaller the stream was on the wire"""
+        if self.compressed_bytes == 0:
+            return 1.0
+        return float(self.decompressed_bytes) / self.compressed_bytes
+
+    def _start(self, is_async):
+        # Newline delimited is all the reader needs, but
+        # sample() keeps its language and stall_warnings here too
+        if self.session.params:
+            self.session.params.pop('delimited', None)
+        super(FastStream, self)._start(is_async)
+
+    def _read_loop(self, resp):
+        content_type = resp.headers.get('content-type', '')
+        encoding = 'utf-8'
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[-1].split(';')[0].strip() or encoding
+
+        reader = LineReader(encoding)
+        listener = self.listener
+
+        decoder = None
+        if resp.headers.get('content-encoding', '').lower() == 'gzip':
+            decoder = self.decoder = GzipDecoder()
+            chunks = decoder.chunks(resp.raw.stream(self.chunk_size, decode_content=False))
+        else:
+            chunks = resp.raw.stream(self.chunk_size, decode_content=True)
+
+        try:
+            for message in reader.lines(chunks):
+                if not self.running:
+                    break
+
+                if message is None:
+                    listener.keep_alive()
+                else:
+                    self._data(message)
+        finally:
+            if decoder is not None:
+                self.decoder = None
+                self._compressed_bytes += decoder.compressed_bytes
+                self._decompressed_bytes += decoder.decompressed_bytes
+                logger.info("Read %d compressed bytes as %d bytes (%.1fx)",
+                            decoder.compressed_bytes, decoder.decompressed_bytes, self.compression_ratio())
+
+        if resp.raw.closed:
+            self.on_closed(resp)
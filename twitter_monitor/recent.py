@@ -0,0 +1,242 @@
+"""
+The most recent tweets for each tracked term, kept in memory
+and served over a small local HTTP API.
+"""
+
+import json
+import logging
+import threading
+import collections
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from urlparse import urlparse, parse_qs
+
+from .pipeline import Stage
+from .local_server import LocalServer
+from .matching import TermMatcher, status_text
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['compact_record', 'record_size', 'RecentTweetStore', 'RecentTweetServer']
+
+# Roughly what a compact record's dict, strings and list
+# take in memory on top of the characters in them
+RECORD_OVERHEAD = 750
+
+
+def compact_record(status, terms):
+    """The few fields of a status the store keeps"""
+    user = status.get('user') or {}
+    return {
+        'id_str': status.get('id_str') or str(status['id']),
+        'created_at': status.get('created_at'),
+        'timestamp_ms': status.get('timestamp_ms'),
+        'user_id_str': user.get('id_str'),
+        'screen_name': user.get('screen_name'),
+        'lang': status.get('lang'),
+        'text': status_text(status),
+        'matched_terms': list(terms),
+    }
+
+
+def record_size(record):
+    """A rough estimate of the bytes a compact record takes up"""
+    size = RECORD_OVERHEAD
+    for value in record.values():
+        if isinstance(value, list):
+            size += sum(len(item) for item in value)
+        elif value is not None:
+            size += len(value)
+    return size
+
+
+class RecentTweetStore(Stage):
+    """
+    Keeps the last per_term tweets for each term, as compact records.
+
+    Memory is capped at about max_bytes across all terms, going by
+    record_size(), and max_records (if given) also caps the number
+    of records. Past either, the oldest records of the least recently
+    used terms (added to or queried) are evicted first. A tweet
+    matching several terms shares one record, but counts once
+    for each of them, so the estimate errs on the high side.
+
+    Terms come from the term checker (or sync_terms()), and tweets
+    of removed terms are dropped. Each status is stored for the terms
+    it matched: its 'matched_terms' if an AttributionStage came first,
+    or else this stage works them out itself. Without a term checker,
+    any term given in 'matched_terms' is kept.
+
+    Everything is guarded by a lock held only briefly, so it can
+    be queried from other threads while the stream is running.
+    """
+
+    def __init__(self, term_checker=None, per_term=100, max_bytes=64 * 1024 * 1024, max_records=None):
+        self.term_checker = term_checker
+        self.per_term = per_term
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+
+        self.matcher = TermMatcher(term_checker)
+        self.terms = None
+        self.records = 0
+        self.bytes = 0
+        self.evicted = 0
+        self._buffers = collections.OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.records
+
+    def sync_terms(self, terms):
+        """Keep tweets for these terms only, dropping those of removed terms"""
+        with self._lock:
+            self.terms = set(terms)
+            for term in list(self._buffers):
+                if term not in self.terms:
+                    buffer = self._buffers.pop(term)
+                    self.records -= len(buffer)
+                    self.bytes -= sum(record_size(record) for record in buffer)
+
+    def _check_terms(self):
+        checker = self.term_checker
+        if checker is not None and checker.version != self._version:
+            self._version = checker.version
+            self.sync_terms(checker.tracking_terms())
+
+    def add(self, terms, record):
+        """Store a record for the given terms"""
+        size = record_size(record)
+        with self._lock:
+            buffers = self._buffers
+            for term in terms:
+                if self.terms is not None and term not in self.terms:
+                    continue
+
+                buffer = buffers.pop(term, None)
+                if buffer is None:
+                    buffer = collections.deque()
+                elif len(buffer) >= self.per_term:
+                    self.records -= 1
+                    self.bytes -= record_size(buffer.popleft())
+                self.records += 1
+                self.bytes += size
+                buffer.append(record)
+                buffers[term] = buffer
+
+            while self._buffers and self._over_limit():
+                self._evict()
+
+    def _over_limit(self):
+        if self.max_records is not None and self.records > self.max_records:
+            return True
+        return self.max_bytes is not None and self.bytes > self.max_bytes
+
+    def _evict(self):
+        term, buffer = next(iter(self._buffers.items()))
+        self.bytes -= record_size(buffer.popleft())
+        self.records -= 1
+        self.evicted += 1
+        if not buffer:
+            del self._buffers[term]
+
+    def process(self, status):
+        self._check_terms()
+
+        terms = status.get('matched_terms')
+        if terms is None:
+            terms = self.matcher.match(status)
+        if terms:
+            self.add(terms, compact_record(status, terms))
+        return status
+
+    def recent(self, term, limit=None):
+        """The latest records for a term, newest first"""
+        with self._lock:
+            buffer = self._buffers.pop(term, None)
+            if buffer is None:
+                return []
+            self._buffers[term] = buffer
+
+            if limit is None or limit >= len(buffer):
+                records = list(buffer)
+            else:
+                records = [buffer[position] for position in range(len(buffer) - limit, len(buffer))]
+
+        records.reverse()
+        return records
+
+    def counts(self):
+        """A dict of the number of records held for each term"""
+        with self._lock:
+            result = dict((term, len(buffer)) for term, buffer in self._buffers.items())
+            if self.terms is not None:
+                for term in self.terms:
+                    result.setdefault(term, 0)
+            return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    GET /terms                      the number of tweets held for each term
+    GET /recent?term=cats&limit=10  the latest tweets for a term, newest first
+    """
+
+    def do_GET(self):
+        store = self.server.store
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/terms':
+            self._reply(200, {'terms': store.counts(), 'records': len(store), 'bytes': store.bytes,
+                              'evicted': store.evicted})
+        elif url.path == '/recent':
+            if 'term' not in query:
+                self._reply(400, {'error': "term is required"})
+                return
+
+            term = query['term'][0]
+            try:
+                limit = int(query['limit'][0]) if 'limit' in query else None
+            except ValueError:
+                self._reply(400, {'error': "limit must be a number"})
+                return
+
+            self._reply(200, {'term': term, 'tweets': store.recent(term, limit)})
+        else:
+            self._reply(404, {'error': "Not found: %s" % url.path})
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class RecentTweetServer(LocalServer):
+    """
+    Serves a RecentTweetStore as JSON over HTTP, on a local
+    TCP port (if address is a (host, port) tuple) or a Unix
+    domain socket (if address is a path), from its own threads.
+    """
+
+    def __init__(self, store, address=('127.0.0.1', 8151)):
+        super(RecentTweetServer, self).__init__(address, _Handler, store=store)
+        self.store = store
+
+    def start(self):
+        """Start serving requests"""
+        if not self.running:
+            super(RecentTweetServer, self).start()
+            logger.info("Serving recent tweets on %s", self.address)
+        return self.address
@@ -0,0 +1,158 @@
+"""
+Storing retweets as small references to their originals.
+
+Most of a retweet is the retweeted status embedded in it, so a
+popular tweet is otherwise stored once for every retweet.
+"""
+
+import json
+import logging
+import collections
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['RetweetCollapser', 'RetweetExpander', 'expand_lines']
+
+# Marks an original written out only so retweets can refer to it
+ORIGINAL_MARKER = 'retweet_original'
+
+
+class _LRU(object):
+    """The most recently used size keys, with their values"""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = collections.OrderedDict()
+
+    def get(self, key):
+        value = self.items.pop(key, None)
+        if value is not None:
+            self.items[key] = value
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def put(self, key, value=True):
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+def reference(retweet):
+    """
+    A compact record standing in for a retweet. The id and user
+    are kept at the top level, like a status's, so deletes and
+    geo scrubbing apply to it and it can be indexed by id.
+    """
+    user = retweet.get('user') or {}
+    return {
+        'id': retweet['id'],
+        'id_str': retweet.get('id_str'),
+        'user': {
+            'id': user.get('id'),
+            'id_str': user.get('id_str'),
+            'screen_name': user.get('screen_name'),
+        },
+        'retweet_ref': {
+            'created_at': retweet.get('created_at'),
+            'timestamp_ms': retweet.get('timestamp_ms'),
+            'retweeted_status_id': retweet['retweeted_status']['id'],
+        },
+    }
+
+
+class RetweetCollapser(object):
+    """
+    Turns statuses into the records to store: each original once,
+    and retweets as references to it.
+
+    The ids of the last cache_size statuses stored are remembered.
+    A retweet of one of them is stored as a reference only, and
+    otherwise its original is stored first, marked as such.
+    """
+
+    def __init__(self, cache_size=100000):
+        self.stored = _LRU(cache_size)
+        self.retweets = 0
+        self.originals = 0
+
+    def collapse(self, status):
+        """Returns the list of records to store for a status"""
+        original = status.get('retweeted_status')
+        if original is None:
+            self.stored.put(status['id'])
+            return [status]
+
+        self.retweets += 1
+        records = []
+        if original['id'] not in self.stored:
+            self.originals += 1
+            original = dict(original)
+            original[ORIGINAL_MARKER] = True
+            records.append(original)
+            self.stored.put(original['id'])
+
+        records.append(reference(status))
+        return records
+
+
+class RetweetExpander(object):
+    """
+    Rebuilds statuses from stored records, for reading them back.
+
+    Statuses are kept as their JSON (the last cache_size of them)
+    and only decoded when a retweet refers to them. The cache
+    should be at least as large as the collapser's was.
+    """
+
+    def __init__(self, cache_size=100000, include_originals=False):
+        self.cache = _LRU(cache_size)
+        self.include_originals = include_originals
+        self.missing = 0
+
+    def expand_line(self, line):
+        """
+        Returns the status for a stored line, or None for originals
+        that were stored for retweets (unless include_originals is True)
+        and references to originals that can no longer be found.
+        """
+        record = json.loads(line)
+
+        ref = record.pop('retweet_ref', None)
+        if ref is None:
+            self.cache.put(record['id'], line)
+            if record.pop(ORIGINAL_MARKER, False) and not self.include_originals:
+                return None
+            return record
+
+        raw = self.cache.get(ref['retweeted_status_id'])
+        if raw is None:
+            self.missing += 1
+            logger.warning("Original %s of retweet %s not found", ref['retweeted_status_id'], record.get('id'))
+            return None
+
+        original = json.loads(raw)
+        original.pop(ORIGINAL_MARKER, None)
+
+        screen_name = (original.get('user') or {}).get('screen_name')
+        status = record
+        status.update((key, value) for key, value in ref.items() if key != 'retweeted_status_id')
+        status['text'] = u'RT @%s: %s' % (screen_name, original.get('text', ''))
+        status['in_reply_to_status_id'] = None
+        status['retweeted_status'] = original
+        return status
+
+
+def expand_lines(lines, cache_size=100000, include_originals=False):
+    """Yields the statuses stored in lines, with retweets rebuilt"""
+    expander = RetweetExpander(cache_size, include_originals)
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        status = expander.expand_line(line)
+        if status is not None:
+            yield status
@@ -0,0 +1,234 @@
+"""
+Sampling busy terms, so a few viral terms cannot swamp
+everything after them in a pipeline.
+
+Each stage keeps exact counts of what it saw and dropped
+for each term, so sampled volumes can be weighted back up.
+"""
+
+import time
+import random
+import logging
+import threading
+
+from .pipeline import Stage
+from .matching import TermMatcher
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['RateCapStage', 'ReservoirStage']
+
+
+class _TermCounts(object):
+    __slots__ = ('seen', 'kept')
+
+    def __init__(self):
+        self.seen = 0
+        self.kept = 0
+
+
+class _SamplingStage(Stage):
+    """Term bookkeeping shared by the sampling stages"""
+
+    def __init__(self, term_checker=None):
+        self.term_checker = term_checker
+        self.matcher = TermMatcher(term_checker)
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def _terms(self, status):
+        terms = status.get('matched_terms')
+        if terms is None:
+            terms = self.matcher.match(status)
+        return terms
+
+    def _count(self, term):
+        counts = self.totals.get(term)
+        if counts is None:
+            counts = self.totals[term] = _TermCounts()
+        return counts
+
+    def counts(self):
+        """A dict of (seen, kept, dropped) for each term since the start"""
+        with self._lock:
+            return dict((term, (counts.seen, counts.kept, counts.seen - counts.kept))
+                        for term, counts in self.totals.items())
+
+    def dropped(self, term):
+        """How many statuses for term have been dropped"""
+        with self._lock:
+            counts = self.totals.get(term)
+            if counts is None:
+                return 0
+            return counts.seen - counts.kept
+
+
+class RateCapStage(_SamplingStage):
+    """
+    Passes on at most rate statuses per second for each term,
+    with bursts of up to burst (by default, one second's worth).
+
+    Each term has a token bucket. A status is kept if any of the
+    terms it matched has a token left, so a status for a quiet
+    term gets through even when it also matched a busy one.
+    Statuses that matched no terms always get through.
+
+    Terms come from each status's 'matched_terms' if an
+    AttributionStage came first, or else are worked out here.
+    """
+
+    def __init__(self, rate, burst=None, term_checker=None, clock=time.time):
+        super(RateCapStage, self).__init__(term_checker)
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.clock = clock
+        self.buckets = {}
+        self._version = None
+
+    def _check_terms(self):
+        checker = self.term_checker
+        if checker is not None and checker.version != self._version:
+            self._version = checker.version
+            terms = checker.tracking_terms()
+            with self._lock:
+                for term in list(self.buckets):
+                    if term not in terms:
+                        del self.buckets[term]
+
+    def _take(self, term, now):
+        """Take a token from term's bucket if it has one"""
+        bucket = self.buckets.get(term)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens, last = bucket
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens >= 1:
+            self.buckets[term] = (tokens - 1, now)
+            return True
+        self.buckets[term] = (tokens, now)
+        return False
+
+    def process(self, status):
+        self._check_terms()
+
+        terms = self._terms(status)
+        if not terms:
+            return status
+
+        now = self.clock()
+        with self._lock:
+            kept = False
+            for term in terms:
+                if self._take(term, now):
+                    kept = True
+
+            for term in terms:
+                counts = self._count(term)
+                counts.seen += 1
+                if kept:
+                    counts.kept += 1
+
+        if kept:
+            return status
+        return None
+
+
+class _Reservoir(object):
+    __slots__ = ('seen', 'statuses')
+
+    def __init__(self):
+        self.seen = 0
+        self.statuses = []
+
+
+class ReservoirStage(_SamplingStage):
+    """
+    Keeps a uniform random sample of up to size statuses for
+    each term in each time window (window seconds long), and
+    passes them on when the window ends. Terms with no more than
+    size statuses in a window are passed on in full.
+
+    Each status passed on gets a status['sample_weight']: how
+    many statuses for its term in that window it stands for.
+    A status that matched several terms is sampled for
+    the one with the fewest statuses in the window so far.
+    Statuses that matched no terms are passed straight on.
+
+    Windows are only closed when a status arrives or the
+    pipeline shuts down, so a sample can arrive late in a quiet
+    stream. counts() only covers completed windows, and the
+    last completed window's counts are in window_counts.
+    """
+
+    def __init__(self, size, window=60, term_checker=None, clock=time.time, seed=None):
+        super(ReservoirStage, self).__init__(term_checker)
+        self.size = size
+        self.window = window
+        self.clock = clock
+        self.random = random.Random(seed)
+
+        self.reservoirs = {}
+        self.window_counts = {}
+        self._current = None
+
+    def _window_of(self, now):
+        return int(now // self.window)
+
+    def _close_window(self):
+        """Returns the samples of the current window, and starts a new one"""
+        sample = []
+        counts = {}
+        for term, reservoir in self.reservoirs.items():
+            kept = len(reservoir.statuses)
+            weight = float(reservoir.seen) / kept if kept else 0.0
+            for status in reservoir.statuses:
+                status['sample_weight'] = weight
+                sample.append(status)
+
+            totals = self._count(term)
+            totals.seen += reservoir.seen
+            totals.kept += kept
+            counts[term] = (reservoir.seen, kept, reservoir.seen - kept)
+
+        self.reservoirs = {}
+        self.window_counts = counts
+        return sample
+
+    def process(self, status):
+        terms = self._terms(status)
+        now = self.clock()
+
+        with self._lock:
+            window = self._window_of(now)
+            sample = []
+            if self._current is not None and window != self._current:
+                sample = self._close_window()
+            self._current = window
+
+            if not terms:
+                sample.append(status)
+                return sample
+
+            # The quietest term this window gets the status
+            reservoirs = self.reservoirs
+            term = min(terms, key=lambda term: reservoirs[term].seen if term in reservoirs else 0)
+            reservoir = reservoirs.get(term)
+            if reservoir is None:
+                reservoir = reservoirs[term] = _Reservoir()
+
+            reservoir.seen += 1
+            if len(reservoir.statuses) < self.size:
+                reservoir.statuses.append(status)
+            else:
+                position = self.random.randrange(reservoir.seen)
+                if position < self.size:
+                    reservoir.statuses[position] = status
+
+        return sample
+
+    def flush(self):
+        with self._lock:
+            self._current = None
+            return self._close_window()
@@ -0,0 +1,365 @@
+"""
+An append-only, segmented log of captured tweets that
+other processes can tail without re-parsing whole files.
+
+A log directory holds pairs of segment files named by the sequence
+number of their first record. NNN.log contains the raw tweets, one per line,
+and NNN.idx contains one fixed-size entry per record: byte offset,
+length, tweet id and capture timestamp (in milliseconds).
+Consumers record the next sequence number they want in
+consumers/NAME.offset.
+"""
+
+import os
+import json
+import mmap
+import glob
+import struct
+import logging
+import threading
+import time
+
+from .listener import JsonStreamListener
+from .output import atomic_write
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SegmentLogWriter', 'SegmentLogReader', 'LogListener']
+
+# offset, length, tweet id, timestamp in ms
+INDEX_ENTRY = struct.Struct('<QIQQ')
+
+LOG_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+CONSUMER_DIR = 'consumers'
+
+
+def _segment_name(directory, base, suffix):
+    return os.path.join(directory, '%020d%s' % (base, suffix))
+
+
+def list_segments(directory):
+    """Returns the sorted base sequence numbers of the segments in directory"""
+    bases = []
+    for path in glob.glob(os.path.join(directory, '*' + INDEX_SUFFIX)):
+        name = os.path.basename(path)[:-len(INDEX_SUFFIX)]
+        if name.isdigit():
+            bases.append(int(name))
+    bases.sort()
+    return bases
+
+
+class SegmentLogWriter(object):
+    """
+    Appends records to the log in directory, starting a
+    new segment once the current one reaches segment_size bytes.
+
+    On opening an existing log, any records that were only
+    partially written are discarded.
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.last_timestamp = 0
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        bases = list_segments(directory)
+        if bases:
+            self._open_segment(bases[-1], recover=True)
+        else:
+            self._open_segment(0)
+
+    def _open_segment(self, base, recover=False):
+        log_path = _segment_name(self.directory, base, LOG_SUFFIX)
+        index_path = _segment_name(self.directory, base, INDEX_SUFFIX)
+
+        count = 0
+        log_size = 0
+        if recover:
+            count, log_size = self._recover(log_path, index_path)
+
+        self.base = base
+        self.next_seq = base + count
+        self.log_size = log_size
+        self.log = open(log_path, 'ab')
+        self.index = open(index_path, 'ab')
+
+    def _recover(self, log_path, index_path):
+        """Drop partial index entries and records, returning what is left"""
+        log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        index_size = os.path.getsize(index_path)
+
+        count = index_size // INDEX_ENTRY.size
+        end = 0
+        with open(index_path, 'rb') as index:
+            # Walk back from the end to the last entry whose record is complete
+            while count > 0:
+                index.seek((count - 1) * INDEX_ENTRY.size)
+                offset, length, tweet_id, timestamp = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+                end = offset + length + 1
+                if end <= log_size:
+                    self.last_timestamp = timestamp
+                    break
+                count -= 1
+                end = 0
+
+        if count * INDEX_ENTRY.size < index_size:
+            logger.warning("Discarding partial index entries in %s", index_path)
+            with open(index_path, 'r+b') as index:
+                index.truncate(count * INDEX_ENTRY.size)
+
+        if end < log_size:
+            logger.warning("Discarding %d unindexed bytes in %s", log_size - end, log_path)
+            with open(log_path, 'r+b') as log:
+                log.truncate(end)
+
+        return count, end
+
+    def append(self, data, tweet_id=0, timestamp=None):
+        """
+        Append a record (one line of bytes, without the newline).
+        Returns its sequence number.
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+
+        with self._lock:
+            # Keep timestamps ordered, so readers can search them
+            timestamp = max(timestamp, self.last_timestamp)
+            self.last_timestamp = timestamp
+
+            if self.log_size >= self.segment_size:
+                self._roll()
+
+            seq = self.next_seq
+            self.log.write(data)
+            self.log.write(b'\n')
+            self.index.write(INDEX_ENTRY.pack(self.log_size, len(data), tweet_id or 0, timestamp))
+
+            self.log_size += len(data) + 1
+            self.next_seq += 1
+            return seq
+
+    def _roll(self):
+        self.log.close()
+        self.index.close()
+        self._open_segment(self.next_seq)
+
+    def flush(self):
+        """Make appended records visible to readers, log before index"""
+        with self._lock:
+            self.log.flush()
+            self.index.flush()
+
+    def sync(self):
+        """Flush and sync to disk"""
+        with self._lock:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.index.flush()
+            os.fsync(self.index.fileno())
+
+    def close(self):
+        self.sync()
+        self.log.close()
+        self.index.close()
+
+
+class _Segment(object):
+    """A memory map of one segment's log and index"""
+
+    def __init__(self, directory, base):
+        self.base = base
+        self.log_path = _segment_name(directory, base, LOG_SUFFIX)
+        self.index_path = _segment_name(directory, base, INDEX_SUFFIX)
+        self.count = 0
+        self.log = None
+        self.index = None
+        self.refresh()
+
+    def refresh(self):
+        """Remap the files if more records have been written"""
+        index_size = os.path.getsize(self.index_path)
+        count = index_size // INDEX_ENTRY.size
+        if count == self.count:
+            return
+
+        log_size = os.path.getsize(self.log_path)
+        index = self._map(self.index_path, count * INDEX_ENTRY.size)
+
+        # Only expose records whose bytes have been written
+        while count > 0:
+            offset, length = INDEX_ENTRY.unpack_from(index, (count - 1) * INDEX_ENTRY.size)[:2]
+            if offset + length <= log_size:
+                break
+            count -= 1
+
+        # Old maps are left for the garbage collector,
+        # as callers may still hold slices of them
+        self.index = index
+        self.log = self._map(self.log_path, log_size)
+        self.count = count
+
+    def _map(self, path, size):
+        if size == 0:
+            return b''
+        with open(path, 'rb') as infile:
+            return mmap.mmap(infile.fileno(), size, access=mmap.ACCESS_READ)
+
+    def entry(self, position):
+        return INDEX_ENTRY.unpack_from(self.index, position * INDEX_ENTRY.size)
+
+    def record(self, position):
+        offset, length, tweet_id, timestamp = self.entry(position)
+        return memoryview(self.log)[offset:offset + length]
+
+    def timestamp(self, position):
+        return self.entry(position)[3]
+
+
+class SegmentLogReader(object):
+    """
+    Reads a segment log through memory maps.
+
+    Records are returned as memoryview slices of the mapped
+    segment files, so nothing is copied until they are parsed.
+    Call refresh() to pick up records written since the reader was opened.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        self.refresh()
+
+    def refresh(self):
+        """Map new segments and any growth of the last one"""
+        # The last segment may have grown before the writer moved on,
+        # however many segments it has started since
+        stale = self.segments[-1:]
+
+        known = set(segment.base for segment in self.segments)
+        for base in list_segments(self.directory):
+            if base not in known:
+                segment = _Segment(self.directory, base)
+                self.segments.append(segment)
+                stale.append(segment)
+
+        for segment in stale:
+            segment.refresh()
+
+    @property
+    def end(self):
+        """The sequence number after the last readable record"""
+        if not self.segments:
+            return 0
+        last = self.segments[-1]
+        return last.base + last.count
+
+    def _find_segment(self, seq):
+        low, high = 0, len(self.segments)
+        while low < high:
+            middle = (low + high) // 2
+            if self.segments[middle].base <= seq:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return None
+        segment = self.segments[low - 1]
+        if seq - segment.base >= segment.count:
+            return None
+        return segment
+
+    def read(self, seq):
+        """Returns (tweet id, timestamp, record) for a sequence number, or None"""
+        segment = self._find_segment(seq)
+        if segment is None:
+            return None
+        position = seq - segment.base
+        offset, length, tweet_id, timestamp = segment.entry(position)
+        return tweet_id, timestamp, segment.record(position)
+
+    def seek_time(self, timestamp):
+        """Returns the sequence number of the first record captured at or after timestamp (ms)"""
+        for segment in self.segments:
+            if segment.count and segment.timestamp(segment.count - 1) >= timestamp:
+                low, high = 0, segment.count
+                while low < high:
+                    middle = (low + high) // 2
+                    if segment.timestamp(middle) < timestamp:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return segment.base + low
+        return self.end
+
+    def records(self, start=0):
+        """Yields (seq, tweet id, timestamp, record) from sequence number start"""
+        seq = start
+        for segment in self.segments:
+            if seq >= segment.base + segment.count:
+                continue
+            for position in range(max(0, seq - segment.base), segment.count):
+                offset, length, tweet_id, timestamp = segment.entry(position)
+                yield segment.base + position, tweet_id, timestamp, \
+                    memoryview(segment.log)[offset:offset + length]
+            seq = segment.base + segment.count
+
+    def committed(self, consumer):
+        """The next sequence number a consumer wants, or 0"""
+        path = os.path.join(self.directory, CONSUMER_DIR, consumer + '.offset')
+        try:
+            with open(path) as infile:
+                return int(infile.read().strip() or 0)
+        except (IOError, OSError):
+            return 0
+
+    def commit(self, consumer, seq):
+        """Record that a consumer has handled everything before seq"""
+        consumer_dir = os.path.join(self.directory, CONSUMER_DIR)
+        if not os.path.isdir(consumer_dir):
+            os.makedirs(consumer_dir)
+
+        atomic_write(os.path.join(consumer_dir, consumer + '.offset'), str(seq))
+
+
+class LogListener(JsonStreamListener):
+    """
+    A listener that appends each status to a segment log,
+    exactly as it was received.
+    """
+
+    def __init__(self, directory, api=None, segment_size=256 * 1024 * 1024):
+        super(LogListener, self).__init__(api)
+        self.writer = SegmentLogWriter(directory, segment_size=segment_size)
+        self._raw = None
+
+    def on_data(self, data):
+        # Keep the raw text so it does not need to be serialized again
+        self._raw = data.strip()
+        try:
+            return super(LogListener, self).on_data(data)
+        finally:
+            self._raw = None
+
+    def on_status(self, status):
+        data = self._raw
+        if data is None:
+            data = json.dumps(status)
+
+        self.writer.append(data, tweet_id=status.get('id'))
+        return not self.terminate
+
+    def keep_alive(self):
+        # Quiet moments are a good time to let readers catch up
+        self.writer.flush()
+
+    def close(self, timeout=None):
+        self.writer.close()
@@ -0,0 +1,94 @@
+"""
+Choosing which terms to track when there are more
+than the streaming connection can carry.
+"""
+
+import logging
+
+from .checker import TermChecker
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['PrioritizingTermChecker']
+
+
+class PrioritizingTermChecker(TermChecker):
+    """
+    Wraps another term checker, tracking at most capacity of its terms
+    (the filter endpoint accepts 400).
+
+    Terms are ranked by their priority (from the priorities dict,
+    default 1). If volumes (a TermVolumeAggregator fed by the stream)
+    is given and limit notices show tweets are being lost, terms are
+    also penalized in proportion to their observed volume, since
+    they use up the most of the connection's share.
+
+    Selected terms get a (1 + hysteresis) bonus when the ranking
+    is redone on each poll, so small changes in volume do not
+    swap terms in and out and cause reconnects.
+    """
+
+    def __init__(self, source, capacity=400, priorities=None, volumes=None,
+                 window=300, hysteresis=0.25, volume_weight=1.0):
+        super(PrioritizingTermChecker, self).__init__()
+        self.source = source
+        self.capacity = capacity
+        self.priorities = priorities or {}
+        self.volumes = volumes
+        self.window = window
+        self.hysteresis = hysteresis
+        self.volume_weight = volume_weight
+
+        # The last rate seen for each term, so that dropped
+        # terms are not mistaken for quiet ones
+        self.known_rates = {}
+
+    def loss_fraction(self):
+        """The fraction of matching tweets lost to limits recently"""
+        if self.volumes is None:
+            return 0.0
+        lost = self.volumes.lost_count(self.window)
+        received = self.volumes.received_count(self.window)
+        if lost + received == 0:
+            return 0.0
+        return float(lost) / (lost + received)
+
+    def score(self, term, loss):
+        score = float(self.priorities.get(term, 1))
+
+        if loss > 0:
+            rate = self.known_rates.get(term, 0.0)
+            score /= 1.0 + self.volume_weight * loss * rate
+
+        if term in self._tracking_terms_set:
+            score *= 1.0 + self.hysteresis
+        return score
+
+    def update_tracking_terms(self):
+        candidates = self.source.update_tracking_terms()
+
+        if self.volumes is not None:
+            for term in self._tracking_terms_set:
+                self.known_rates[term] = self.volumes.rate(term, self.window)
+
+        # Forget about terms that are gone for good
+        for term in list(self.known_rates):
+            if term not in candidates:
+                del self.known_rates[term]
+
+        if len(candidates) <= self.capacity:
+            return set(candidates)
+
+        loss = self.loss_fraction()
+        ranked = sorted(candidates, key=lambda term: (-self.score(term, loss), term))
+        selected = set(ranked[:self.capacity])
+
+        logger.info("Tracking %d of %d terms (%.1f%% loss)",
+                    len(selected), len(candidates), loss * 100)
+        return selected
+
+    def attach(self, stream):
+        self.source.attach(stream)
+
+    def on_stream_live(self):
+        self.source.on_stream_live()
@@ -0,0 +1,90 @@
+"""
+Files of fixed-size binary records, sorted by their first field,
+that can be searched through a memory map without loading them.
+"""
+
+import os
+import mmap
+import heapq
+
+from .output import atomic_write
+
+__all__ = ['SortedRecordFile', 'write_records', 'merge_records']
+
+
+class SortedRecordFile(object):
+    """
+    A read-only view of a file of records packed with record_struct
+    and sorted by their first field. A missing file is treated as empty.
+    """
+
+    def __init__(self, path, record_struct):
+        self.path = path
+        self.record = record_struct
+        self.count = 0
+        self._map = None
+
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            self.count = size // record_struct.size
+            if self.count:
+                with open(path, 'rb') as infile:
+                    self._map = mmap.mmap(infile.fileno(), self.count * record_struct.size,
+                                          access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        return self.record.unpack_from(self._map, position * self.record.size)
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self.record.unpack_from(self._map, position * self.record.size)
+
+    def key(self, position):
+        return self.record.unpack_from(self._map, position * self.record.size)[0]
+
+    def bisect_left(self, key):
+        """The position of the first record whose key is >= key"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __contains__(self, key):
+        position = self.bisect_left(key)
+        return position < self.count and self.key(position) == key
+
+    def range(self, low, high):
+        """Yields the records with low <= key < high"""
+        position = self.bisect_left(low)
+        while position < self.count:
+            record = self[position]
+            if record[0] >= high:
+                break
+            yield record
+            position += 1
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self.count = 0
+
+
+def write_records(path, record_struct, records):
+    """Atomically replace path with the given (already sorted) records"""
+    pack = record_struct.pack
+    atomic_write(path, (pack(*record) for record in records))
+
+
+def merge_records(*sorted_iterables):
+    """Merge sorted streams of records into one sorted stream"""
+    return heapq.merge(*sorted_iterables)
@@ -0,0 +1,145 @@
+"""
+A term checker backed by a SQLite table of terms.
+"""
+
+import logging
+import sqlite3
+
+from .checker import TermChecker
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SQLiteTermChecker']
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS {table} (term TEXT PRIMARY KEY)',
+
+    # Every change to the terms table is logged here by triggers,
+    # so that checkers only need to fetch what has changed
+    'CREATE TABLE IF NOT EXISTS {table}_changes ('
+    '  version INTEGER PRIMARY KEY AUTOINCREMENT,'
+    '  term TEXT NOT NULL,'
+    '  added INTEGER NOT NULL)',
+
+    'CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {table} BEGIN'
+    '  INSERT INTO {table}_changes (term, added) VALUES (NEW.term, 1);'
+    ' END',
+
+    'CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {table} BEGIN'
+    '  INSERT INTO {table}_changes (term, added) VALUES (OLD.term, 0);'
+    ' END',
+
+    'CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF term ON {table} BEGIN'
+    '  INSERT INTO {table}_changes (term, added) VALUES (OLD.term, 0);'
+    '  INSERT INTO {table}_changes (term, added) VALUES (NEW.term, 1);'
+    ' END',
+]
+
+
+class SQLiteTermChecker(TermChecker):
+    """
+    Checks for tracked terms in a SQLite table.
+
+    Triggers record every change to the table in a changelog,
+    so each check first reads the latest changelog version
+    (a cheap query) and only fetches the changed rows when it
+    has moved. The terms themselves are kept in memory.
+
+    Other programs can simply insert into or delete from the
+    terms table, or use add_terms() and remove_terms().
+    """
+
+    def __init__(self, filename, table='terms'):
+        super(SQLiteTermChecker, self).__init__()
+        self.filename = filename
+        self.table = table
+
+        self._connection = None
+        self._terms = set()
+        self._db_version = None
+        self._dirty = True
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.filename)
+            with self._connection:
+                for statement in SCHEMA:
+                    self._connection.execute(statement.format(table=self.table))
+        return self._connection
+
+    def add_terms(self, terms):
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO %s (term) VALUES (?)' % self.table,
+                                        [(term,) for term in terms])
+
+    def remove_terms(self, terms):
+        with self.connection:
+            self.connection.executemany('DELETE FROM %s WHERE term = ?' % self.table,
+                                        [(term,) for term in terms])
+
+    def prune_changes(self, keep=10000):
+        """Delete all but the latest keep changelog entries"""
+        with self.connection:
+            self.connection.execute('DELETE FROM %s_changes WHERE version <= '
+                                    '(SELECT MAX(version) FROM %s_changes) - ?' % (self.table, self.table),
+                                    (keep,))
+
+    def _poll(self):
+        """
+        Bring the in-memory terms up to date with the database.
+        Returns True if they changed.
+        """
+        connection = self.connection
+        with connection:
+            first, last = connection.execute('SELECT MIN(version), MAX(version) FROM %s_changes'
+                                             % self.table).fetchone()
+            last = last or 0
+
+            if last == self._db_version:
+                return False
+
+            if self._db_version is None or first is None or first > self._db_version + 1:
+                # Starting out, or the changes we need were pruned
+                rows = connection.execute('SELECT term FROM %s' % self.table).fetchall()
+                terms = set(row[0] for row in rows)
+            else:
+                terms = set(self._terms)
+                rows = connection.execute('SELECT term, added FROM %s_changes WHERE version > ? '
+                                          'ORDER BY version' % self.table, (self._db_version,))
+                for term, added in rows:
+                    if added:
+                        terms.add(term)
+                    else:
+                        terms.discard(term)
+
+        self._db_version = last
+        changed = terms != self._terms
+        self._terms = terms
+        return changed
+
+    def update_tracking_terms(self):
+        self._poll()
+        return set(self._terms)
+
+    def reset(self):
+        super(SQLiteTermChecker, self).reset()
+        self._dirty = True
+
+    def check(self):
+        """
+        Checks if the list of tracked terms has changed.
+        Returns True if changed, otherwise False.
+        """
+        changed = self._poll()
+        if self._dirty:
+            # Only compare the whole set after a reset
+            changed = self._terms != self._tracking_terms_set
+            self._dirty = False
+
+        if changed:
+            logger.debug("Tracking terms changed")
+            self._tracking_terms_set = set(self._terms)
+            self.version += 1
+
+        return changed
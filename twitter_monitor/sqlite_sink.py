@@ -0,0 +1,272 @@
+"""
+A listener that stores tweets in a SQLite database.
+
+Tweets are handed to a dedicated writer thread, which
+inserts them in large transactions on a database in WAL mode.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .listener import JsonStreamListener
+from .matching import TermMatcher, status_text
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SQLiteListener']
+
+
+def _user_id(status):
+    return status['user']['id']
+
+
+def _screen_name(status):
+    return status['user'].get('screen_name')
+
+
+def _coordinates(status):
+    coordinates = status.get('coordinates')
+    if coordinates:
+        return json.dumps(coordinates['coordinates'])
+
+
+def _place(status):
+    place = status.get('place')
+    if place:
+        return place.get('full_name')
+
+
+# The columns that may be projected out of each status,
+# with their SQL types and how to get their values
+COLUMNS = {
+    'id': ('INTEGER PRIMARY KEY', lambda status: status['id']),
+    'user_id': ('INTEGER', _user_id),
+    'screen_name': ('TEXT', _screen_name),
+    'created_at': ('TEXT', lambda status: status.get('created_at')),
+    'text': ('TEXT', status_text),
+    'lang': ('TEXT', lambda status: status.get('lang')),
+    'coordinates': ('TEXT', _coordinates),
+    'place': ('TEXT', _place),
+    'raw': ('TEXT', json.dumps),
+}
+
+DEFAULT_FIELDS = ('id', 'user_id', 'screen_name', 'created_at', 'text', 'lang', 'matched_terms')
+
+# Columns that must be cleared in response to a scrub_geo notice
+GEO_FIELDS = ('coordinates', 'place')
+
+# Marks the end of the writer queue
+_STOP = object()
+
+
+def scrub_geo(status):
+    """Strip geolocation from a status dict"""
+    for key in ('coordinates', 'geo', 'place'):
+        if key in status:
+            status[key] = None
+    return status
+
+
+class SQLiteListener(JsonStreamListener):
+    """
+    Stores statuses in a SQLite table.
+
+    fields selects which columns are stored. The available fields
+    are id, user_id, screen_name, created_at, text, lang,
+    coordinates, place, matched_terms and raw (the full JSON).
+    'id' is always included. matched_terms needs a term_checker.
+
+    Writes happen on a separate thread, in transactions of up
+    to batch_size tweets or commit_interval seconds.
+    Delete and scrub_geo notices are applied in the same batches
+    (scrub_geo needs the user_id field).
+
+    If the database can't be opened, the error is raised here.
+    A batch that fails to write is logged and dropped, and if the
+    writer thread stops anyway, on_status returns False.
+    """
+
+    def __init__(self, filename, api=None, fields=DEFAULT_FIELDS, table='tweets',
+                 term_checker=None, batch_size=5000, commit_interval=1.0, queue_size=100000):
+        super(SQLiteListener, self).__init__(api)
+        self.filename = filename
+        self.table = table
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+
+        fields = list(fields)
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        for field in fields:
+            if field not in COLUMNS and field != 'matched_terms':
+                raise ValueError("Unknown field %s" % field)
+        self.fields = fields
+
+        self.matcher = None
+        if 'matched_terms' in fields:
+            self.matcher = TermMatcher(term_checker)
+
+        self.written = 0
+        self.failed = 0
+        self.writer_error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer = threading.Thread(target=self._write_loop, name='sqlite-writer')
+        self.writer.daemon = True
+
+        # Create the table before accepting anything
+        self._ready = threading.Event()
+        self.writer.start()
+        self._ready.wait()
+        if self.writer_error is not None:
+            raise self.writer_error
+
+    def _project(self, status):
+        row = []
+        for field in self.fields:
+            if field == 'matched_terms':
+                row.append(','.join(self.matcher.match(status)))
+            else:
+                row.append(COLUMNS[field][1](status))
+        return tuple(row)
+
+    def _put(self, item, timeout=None):
+        """Queue an item for the writer, returning False if the writer has stopped"""
+        while self.writer.is_alive():
+            try:
+                # Wake up now and then to make sure the writer is still there
+                self.queue.put(item, timeout=1.0 if timeout is None else timeout)
+                return True
+            except queue.Full:
+                if timeout is not None:
+                    return False
+        logger.error("SQLite writer has stopped, dropping new items")
+        return False
+
+    def on_status(self, status):
+        if not self._put(('insert', self._project(status))):
+            return False
+        return not self.terminate
+
+    def on_delete(self, status_id, user_id):
+        self._put(('delete', (status_id,)))
+        return True
+
+    def on_scrub_geo(self, user_id, up_to_status_id):
+        self._put(('scrub_geo', (user_id, up_to_status_id)))
+        return True
+
+    def close(self, timeout=None):
+        """Write out everything queued so far and stop the writer thread"""
+        if not self.writer.is_alive():
+            return
+        if not self._put(_STOP, timeout):
+            if self.writer.is_alive():
+                logger.warning("SQLite writer still has %d items queued", self.queue.qsize())
+            return
+        self.writer.join(timeout)
+        if self.writer.is_alive():
+            logger.warning("SQLite writer still has %d items queued", self.queue.qsize())
+
+    def connect(self):
+        connection = sqlite3.connect(self.filename)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+
+        columns = []
+        for field in self.fields:
+            if field == 'matched_terms':
+                columns.append('matched_terms TEXT')
+            else:
+                columns.append('%s %s' % (field, COLUMNS[field][0]))
+
+        connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (self.table, ', '.join(columns)))
+        if 'user_id' in self.fields:
+            connection.execute('CREATE INDEX IF NOT EXISTS %s_user_id ON %s (user_id)' % (self.table, self.table))
+        connection.commit()
+        return connection
+
+    def _write_loop(self):
+        try:
+            connection = self.connect()
+        except Exception as e:
+            logger.error("Failed to open %s", self.filename, exc_info=True)
+            self.writer_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self.queue.get()
+            deadline = time.time() + self.commit_interval
+
+            # Gather up a batch, until full, stopped, or out of time
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self.write_batch(connection, batch)
+                except Exception:
+                    # Keep the writer going, or everything after would block
+                    logger.error("Failed to write %d items to SQLite", len(batch), exc_info=True)
+                    self.failed += len(batch)
+
+        connection.close()
+
+    def write_batch(self, connection, batch):
+        """Apply a batch of inserts, deletes, and geo scrubs in one transaction"""
+        inserts = []
+        deletes = []
+        scrubs = []
+        for kind, values in batch:
+            if kind == 'insert':
+                inserts.append(values)
+            elif kind == 'delete':
+                deletes.append(values)
+            else:
+                scrubs.append(values)
+
+        with connection:
+            if inserts:
+                connection.executemany('INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+                    self.table, ', '.join(self.fields), ', '.join('?' * len(self.fields))), inserts)
+            if deletes:
+                connection.executemany('DELETE FROM %s WHERE id = ?' % self.table, deletes)
+            if scrubs and 'user_id' in self.fields:
+                self._scrub_geo(connection, scrubs)
+
+        self.written += len(inserts)
+
+    def _scrub_geo(self, connection, scrubs):
+        clear = [field for field in GEO_FIELDS if field in self.fields]
+        if clear:
+            connection.executemany('UPDATE %s SET %s WHERE user_id = ? AND id <= ?' % (
+                self.table, ', '.join('%s = NULL' % field for field in clear)), scrubs)
+
+        if 'raw' in self.fields:
+            # The stored JSON has to be rewritten too
+            for user_id, up_to_status_id in scrubs:
+                rows = connection.execute('SELECT id, raw FROM %s WHERE user_id = ? AND id <= ?' % self.table,
+                                          (user_id, up_to_status_id)).fetchall()
+                connection.executemany('UPDATE %s SET raw = ? WHERE id = ?' % self.table,
+                                       [(json.dumps(scrub_geo(json.loads(raw))), status_id)
+                                        for status_id, raw in rows])
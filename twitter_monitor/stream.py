@@ -1,8 +1,11 @@
 from time import sleep, time
 import logging
+import threading
 
 import tweepy
 
+from .reader import FastStream
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,7 +15,16 @@ class DynamicTwitterStream(object):
     streaming to be executed in a secondary thread.
 
     Meanwhile the primary thread sleeps for an interval between checking for
-    term list updates.
+    term list updates. Checkers that learn of changes themselves can
+    call wake() to have them checked straight away.
+
+    The stream_class option replaces tweepy.Stream, for example
+    with twitter_monitor.reader.FastStream. With the gzip option,
+    streams are requested compressed, using FastStream.
+
+    Besides the term checker, a follow_checker (returning user id strings)
+    and a location_checker (returning (sw_lon, sw_lat, ne_lon, ne_lat) boxes)
+    may be given. They are polled alongside it, and any change restarts the stream.
     """
 
     # Number of seconds to wait for the stream to stop
@@ -25,10 +37,57 @@ class DynamicTwitterStream(object):
 
         self.polling = False
         self.stream = None
+        self.connected = False
+        self._checking = False
+        self._wakeup = threading.Event()
+
+        # Bytes received and decoded by the streams stopped so far
+        self._compressed_bytes = 0
+        self._decompressed_bytes = 0
+        self._watch_connect()
         
         self.retry_count = options.get("retry_count", 5)
         self.unfiltered = options.get('unfiltered', False)
         self.languages = options.get('languages', None)
+        self.follow_checker = options.get('follow_checker', None)
+        self.location_checker = options.get('location_checker', None)
+        self.stream_class = options.get('stream_class', None)
+        self.gzip = options.get('gzip', False)
+
+        if self.gzip:
+            # Only FastStream knows how to decompress as it reads
+            if self.stream_class is None:
+                self.stream_class = FastStream
+            elif not issubclass(self.stream_class, FastStream):
+                raise ValueError("gzip streams need a FastStream stream_class")
+
+    def _fast_stream(self):
+        stream = self.stream
+        return stream if isinstance(stream, FastStream) else None
+
+    @property
+    def compressed_bytes(self):
+        """Body bytes received by FastStreams, across restarts"""
+        stream = self._fast_stream()
+        return self._compressed_bytes + (stream.compressed_bytes if stream is not None else 0)
+
+    @property
+    def decompressed_bytes(self):
+        """The bytes those decoded to"""
+        stream = self._fast_stream()
+        return self._decompressed_bytes + (stream.decompressed_bytes if stream is not None else 0)
+
+    def compression_ratio(self):
+        """How many times smaller the streams have been on the wire"""
+        compressed = self.compressed_bytes
+        if compressed == 0:
+            return 1.0
+        return float(self.decompressed_bytes) / compressed
+
+    def checkers(self):
+        """All of the checkers in use"""
+        return [checker for checker in (self.term_checker, self.follow_checker, self.location_checker)
+                if checker is not None]
 
     def start_polling(self, interval):
         """
@@ -39,19 +98,22 @@ class DynamicTwitterStream(object):
         self.polling = True
 
         # clear the stored list of terms - we aren't tracking any
-        self.term_checker.reset()
+        for checker in self.checkers():
+            checker.reset()
+            checker.attach(self)
 
         logger.info("Starting polling for changes to the track list")
         while self.polling:
 
             loop_start = time()
+            self._wakeup.clear()
 
             self.update_stream()
             self.handle_exceptions()
 
             # wait for the interval unless interrupted, compensating for time elapsed in the loop
             elapsed = time() - loop_start
-            sleep(max(0.1, interval - elapsed))
+            self._wakeup.wait(max(0.1, interval - elapsed))
 
         logger.warning("Term poll ceased!")
 
@@ -60,61 +122,126 @@ class DynamicTwitterStream(object):
         logger.info("Stopping polling loop")
 
         self.polling = False
+        self._wakeup.set()
         self.stop_stream()
 
+    def wake(self):
+        """Check for changes now instead of waiting out the interval"""
+        self._wakeup.set()
+
     def update_stream(self):
         """
         Restarts the stream with the current list of tracking terms.
         """
 
-        need_to_restart = False
+        # A connection made while checking is reported below instead,
+        # since its terms may be about to be replaced
+        self._checking = True
+        try:
+            need_to_restart = False
+
+            # If we think we are running, but something has gone wrong in the streaming thread
+            # Restart it.
+            if self.stream is not None and not self.stream.running:
+                logger.warning("Stream exists but isn't running")
+                self.listener.error = False
+                self.listener.streaming_exception = None
+                need_to_restart = True
+
+            # Check if the tracking list has changed
+            if self.term_checker.check():
+                logger.info("Terms have changed")
+                need_to_restart = True
+
+            if self.follow_checker is not None and self.follow_checker.check():
+                logger.info("Followed users have changed")
+                need_to_restart = True
+
+            if self.location_checker is not None and self.location_checker.check():
+                logger.info("Locations have changed")
+                need_to_restart = True
+
+            # If we aren't running and we are allowing unfiltered streams
+            if self.stream is None and self.unfiltered:
+                need_to_restart = True
+
+            if need_to_restart:
+                logger.info("Restarting stream...")
+
+                # Stop any old stream
+                self.stop_stream()
+        finally:
+            self._checking = False
 
-        # If we think we are running, but something has gone wrong in the streaming thread
-        # Restart it.
-        if self.stream is not None and not self.stream.running:
-            logger.warning("Stream exists but isn't running")
-            self.listener.error = False
-            self.listener.streaming_exception = None
-            need_to_restart = True
+        if not need_to_restart:
+            # The running stream already has the checked terms
+            if self.connected:
+                self.notify_live()
+            return
 
-        # Check if the tracking list has changed
-        if self.term_checker.check():
-            logger.info("Terms have changed")
-            need_to_restart = True
+        # Start a new stream, and the checkers hear when it connects
+        self.start_stream()
 
-        # If we aren't running and we are allowing unfiltered streams
-        if self.stream is None and self.unfiltered:
-            need_to_restart = True
+    def notify_live(self):
+        """Tell the checkers the stream is connected with the terms from their last check"""
+        for checker in self.checkers():
+            checker.on_stream_live()
 
-        if not need_to_restart:
-            return
+    def _watch_connect(self):
+        """Have the listener's on_connect also report that the stream is live"""
+        on_connect = self.listener.on_connect
 
-        logger.info("Restarting stream...")
-        
-        # Stop any old stream
-        self.stop_stream()
+        def connected(*args, **kwargs):
+            result = on_connect(*args, **kwargs)
+            self.connected = True
+            if not self._checking:
+                self.notify_live()
+            return result
 
-        # Start a new stream
-        self.start_stream()
+        self.listener.on_connect = connected
 
     def start_stream(self):
         """Starts a stream with teh current tracking terms"""
 
         tracking_terms = self.term_checker.tracking_terms()
 
-        if len(tracking_terms) > 0 or self.unfiltered:
+        follow = []
+        if self.follow_checker is not None:
+            follow = [str(user_id) for user_id in self.follow_checker.tracking_terms()]
+
+        locations = []
+        if self.location_checker is not None:
+            for box in self.location_checker.tracking_terms():
+                locations.extend(box)
+
+        filters = {}
+        if len(tracking_terms) > 0:
+            filters['track'] = tracking_terms
+        if len(follow) > 0:
+            filters['follow'] = follow
+        if len(locations) > 0:
+            filters['locations'] = locations
+
+        if len(filters) > 0 or self.unfiltered:
             # we have terms to track, so build a new stream
-            self.stream = tweepy.Stream(self.auth, self.listener,
-                                        stall_warnings=True,
-                                        timeout=90,
-                                        retry_count=self.retry_count)
-
-            if len(tracking_terms) > 0:
-                logger.info("Starting new twitter stream with %s terms:", len(tracking_terms))
-                logger.info("  %s", repr(tracking_terms))
+            stream_options = {}
+            if self.gzip:
+                stream_options['gzip'] = True
+
+            stream_class = self.stream_class or tweepy.Stream
+            self.stream = stream_class(self.auth, self.listener,
+                                       stall_warnings=True,
+                                       timeout=90,
+                                       retry_count=self.retry_count,
+                                       **stream_options)
+
+            if len(filters) > 0:
+                logger.info("Starting new twitter stream with %s terms, %s users and %s locations:",
+                            len(tracking_terms), len(follow), len(locations) // 4)
+                logger.info("  %s", repr(filters))
                 
                 # Launch it in a new thread
-                self.stream.filter(track=tracking_terms, is_async=True, languages=self.languages)
+                self.stream.filter(is_async=True, languages=self.languages, **filters)
             else:
                 logger.info("Starting new unfiltered stream")
                 self.stream.sample(is_async=True, languages=self.languages)
@@ -130,10 +257,42 @@ class DynamicTwitterStream(object):
             logger.warning("Stopping twitter stream...")
             self.stream.disconnect()
 
+            thread = getattr(self.stream, '_thread', None)
+            stream = self._fast_stream()
             self.stream = None
+            self.connected = False
+
+            # wait a few seconds to allow the streaming to actually stop,
+            # so that any tweet being handled is finished
+            if thread is not None:
+                thread.join(self.STOP_TIMEOUT)
+            else:
+                sleep(self.STOP_TIMEOUT)
+
+            # Keep its byte counts, which the next stream starts over
+            if stream is not None:
+                self._compressed_bytes += stream.compressed_bytes
+                self._decompressed_bytes += stream.decompressed_bytes
+
+    def shutdown(self, timeout=None):
+        """
+        Stop accepting tweets, halt polling and streaming,
+        and then give the listener until the deadline to drain
+        and flush whatever it is still holding.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time() + float(timeout)
+
+        logger.info("Shutting down stream")
+        self.listener.set_terminate()
+        self.stop_polling()
+
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - time())
 
-            # wait a few seconds to allow the streaming to actually stop
-            sleep(self.STOP_TIMEOUT)
+        self.listener.close(timeout=remaining)
 
     def handle_exceptions(self):
         # check to see if an exception was raised in the streaming thread
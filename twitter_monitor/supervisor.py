@@ -0,0 +1,433 @@
+"""
+Streaming from several worker processes, each with its own
+credentials and shard of the terms, into one output.
+"""
+
+from time import time, sleep
+import multiprocessing
+import threading
+import logging
+import signal
+
+import tweepy
+
+from .checker import TermChecker
+from .listener import JsonStreamListener
+from .stream import DynamicTwitterStream
+from .multi_stream import assign_terms, RATE_LIMITED, _RecentIds
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Supervisor', 'run_worker']
+
+# Sent on a worker's term queue to make it exit,
+# and on the output queue to stop the writer
+_STOP = None
+
+
+class WorkerListener(JsonStreamListener):
+    """
+    Runs in a worker process, passing statuses (as their raw JSON)
+    and the notices the supervisor cares about to the output queue.
+    """
+
+    def __init__(self, shard, output):
+        super(WorkerListener, self).__init__()
+        self.shard = shard
+        self.output = output
+        self._raw = None
+
+    def on_data(self, data):
+        self._raw = data
+        return super(WorkerListener, self).on_data(data)
+
+    def on_status(self, status):
+        self.output.put((self.shard, 'status', status['id'], self._raw.strip()))
+        return not self.terminate
+
+    def on_limit(self, track):
+        self.output.put((self.shard, 'limit', track))
+        return True
+
+    def on_error(self, status_code):
+        logger.error('Twitter returned error code %s', status_code)
+        self.error = status_code
+        self.output.put((self.shard, 'error', status_code))
+        return False
+
+
+class QueueTermChecker(TermChecker):
+    """The terms most recently sent to a worker by the supervisor"""
+
+    def __init__(self):
+        super(QueueTermChecker, self).__init__()
+        self.terms = set()
+        self.lock = threading.Lock()
+
+    def set_terms(self, terms):
+        with self.lock:
+            self.terms = set(terms)
+
+    def update_tracking_terms(self):
+        with self.lock:
+            return set(self.terms)
+
+
+def run_worker(shard, credentials, terms, output, options):
+    """
+    Streams the terms sent on the terms queue, putting
+    what arrives on the output queue, until told to stop.
+    """
+    auth = tweepy.OAuthHandler(credentials['api_key'], credentials['api_secret'])
+    auth.set_access_token(credentials['access_token'], credentials['access_token_secret'])
+
+    listener = WorkerListener(shard, output)
+    checker = QueueTermChecker()
+    stream = DynamicTwitterStream(auth, listener, checker,
+                                  languages=options.get('languages'),
+                                  retry_count=options.get('retry_count', 5),
+                                  gzip=options.get('gzip', False))
+    stopping = threading.Event()
+    finished = threading.Event()
+
+    def receive_terms():
+        while True:
+            message = terms.get()
+            if message is _STOP:
+                stopping.set()
+                # Polling may not have started yet, so keep stopping it until done
+                stream.stop_polling()
+                while not finished.wait(0.5):
+                    stream.stop_polling()
+                return
+            checker.set_terms(message)
+            stream.wake()
+
+    thread = threading.Thread(target=receive_terms)
+    thread.daemon = True
+    thread.start()
+
+    interval = options.get('poll_interval', 15)
+    while not stopping.is_set():
+        try:
+            stream.start_polling(interval)
+        except Exception:
+            logger.error("Exception in worker %s. Restarting in 1 second.", shard, exc_info=True)
+            sleep(1)
+
+    finished.set()
+
+
+def _worker_main(target, shard, credentials, terms, output, options):
+    # The supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    target(shard, credentials, terms, output, options)
+
+
+class _Worker(object):
+
+    def __init__(self, shard, credentials):
+        self.shard = shard
+        self.credentials = credentials
+        self.process = None
+        self.terms = None
+        self.sent = None
+        self.restarts = 0
+        self.started_at = None
+        self.exited_at = None
+        self.restart_delay = None
+        self.next_start = 0
+        self.rate_limited = False
+        self.limited_until = None
+        self.available_since = None
+        self.backoff = None
+
+        self.received = 0
+        self.duplicates = 0
+        self.limited = 0
+        self.errors = 0
+
+    def available(self, now):
+        return self.limited_until is None or now >= self.limited_until
+
+
+class Supervisor(object):
+    """
+    Runs a worker process for each set of credentials, each streaming
+    its own shard of the terms from term_checker. Workers decode the
+    stream and send statuses back over a queue to a single writer
+    thread, which skips duplicates and hands them to listener.write_raw()
+    (see basic_stream.PrintingListener).
+
+    Terms are assigned to workers as in MultiStreamManager: stickily,
+    at most capacity per worker, and moved away from workers that are
+    rate limited. Workers that die are restarted restart_delay seconds
+    after they exit, and the delay doubles (up to max_restart_delay)
+    each time a worker dies within stable_after seconds of starting.
+    Likewise, the rate limit backoff starts over once a worker has
+    gone stable_after seconds without being limited.
+    stats() reports counts for each worker.
+
+    This has the same start_polling(), stop_polling() and shutdown()
+    methods as DynamicTwitterStream, so it can be used in its place.
+    """
+
+    # The function each worker process runs
+    target = staticmethod(run_worker)
+
+    def __init__(self, credentials, listener, term_checker, capacity=400, queue_size=10000,
+                 restart_delay=5, max_restart_delay=300, rate_limit_backoff=60, stable_after=60,
+                 dedupe_size=100000, **options):
+        self.listener = listener
+        self.term_checker = term_checker
+        self.capacity = capacity
+        self.queue_size = queue_size
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.rate_limit_backoff = rate_limit_backoff
+        self.stable_after = stable_after
+        self.options = options
+
+        self.workers = [_Worker(shard, creds) for shard, creds in enumerate(credentials)]
+        if not self.workers:
+            raise ValueError("At least one set of credentials is required")
+
+        self.output = multiprocessing.Queue(queue_size)
+        self.recent = _RecentIds(dedupe_size)
+        self.lock = threading.Lock()
+        self.written = 0
+
+        self.assignments = {}
+        self.unassigned = set()
+        self.polling = False
+        self._writer = None
+        self._wakeup = threading.Event()
+
+    def _start_worker(self, worker):
+        worker.terms = multiprocessing.Queue()
+        worker.sent = None
+        options = dict(self.options)
+        worker.process = multiprocessing.Process(target=_worker_main,
+                                                 args=(self.target, worker.shard, worker.credentials,
+                                                       worker.terms, self.output, options),
+                                                 name='twitter-monitor-worker-%d' % worker.shard)
+        worker.process.daemon = True
+        worker.process.start()
+        logger.info("Started worker %d (pid %s)", worker.shard, worker.process.pid)
+
+    def _write(self):
+        """Moves everything from the workers into the listener"""
+        while True:
+            message = self.output.get()
+            if message is _STOP:
+                return
+
+            worker = self.workers[message[0]]
+            kind = message[1]
+
+            with self.lock:
+                if kind == 'status':
+                    worker.received += 1
+                    if self.recent.seen(message[2]):
+                        worker.duplicates += 1
+                        continue
+                    self.written += 1
+                elif kind == 'limit':
+                    worker.limited = message[2]
+                    continue
+                elif kind == 'error':
+                    worker.errors += 1
+                    if message[2] in RATE_LIMITED:
+                        worker.rate_limited = True
+                    continue
+                else:
+                    continue
+
+            self.listener.write_raw(message[3])
+
+    def start(self):
+        """Start the writer and worker processes"""
+        if self._writer is not None:
+            return
+
+        self._writer = threading.Thread(target=self._write)
+        self._writer.daemon = True
+        self._writer.start()
+
+        now = time()
+        for worker in self.workers:
+            worker.started_at = now
+            self._start_worker(worker)
+
+    def _worker_exited(self, worker, now):
+        """Note when a worker died, and when it can be restarted"""
+        worker.exited_at = now
+        if worker.restart_delay is None or now - worker.started_at >= self.stable_after:
+            worker.restart_delay = self.restart_delay
+        else:
+            # It keeps dying, so give whatever is wrong time to clear
+            worker.restart_delay = min(worker.restart_delay * 2, self.max_restart_delay)
+
+        worker.next_start = now + worker.restart_delay
+        logger.warning("Worker %d exited with code %s, restarting in %s seconds",
+                       worker.shard, worker.process.exitcode, worker.restart_delay)
+
+    def check_workers(self, now=None):
+        """
+        Restarts dead workers and looks for rate limited ones.
+        Returns True if terms need to be reassigned.
+        """
+        if now is None:
+            now = time()
+
+        changed = False
+        for worker in self.workers:
+            if not worker.process.is_alive():
+                if worker.exited_at is None:
+                    self._worker_exited(worker, now)
+
+                if now >= worker.next_start:
+                    worker.restarts += 1
+                    worker.started_at = now
+                    worker.exited_at = None
+                    self._start_worker(worker)
+
+            with self.lock:
+                if worker.rate_limited:
+                    worker.rate_limited = False
+                    if worker.backoff is None:
+                        worker.backoff = self.rate_limit_backoff
+                    worker.limited_until = now + worker.backoff
+                    logger.warning("Worker %d rate limited, moving its terms for %s seconds",
+                                   worker.shard, worker.backoff)
+                    worker.backoff *= 2
+                    changed = True
+
+                elif worker.limited_until is not None and now >= worker.limited_until:
+                    logger.info("Worker %d available again", worker.shard)
+                    worker.limited_until = None
+                    worker.available_since = now
+                    changed = True
+
+                elif worker.backoff is not None and worker.limited_until is None \
+                        and now - worker.available_since >= self.stable_after:
+                    # It has streamed unlimited for a while, so start over next time
+                    worker.backoff = None
+
+        return changed
+
+    def rebalance(self, now=None):
+        """Assign the terms to available workers, and send any changes"""
+        if now is None:
+            now = time()
+
+        available = [worker.shard for worker in self.workers if worker.available(now)]
+        self.assignments, self.unassigned = assign_terms(self.term_checker.tracking_terms(),
+                                                         self.assignments, available, self.capacity)
+
+    def send_terms(self):
+        """Send each worker its terms, if they have changed since they were last sent"""
+        shards = dict((worker.shard, set()) for worker in self.workers)
+        for term, shard in self.assignments.items():
+            shards[shard].add(term)
+
+        for worker in self.workers:
+            terms = shards[worker.shard]
+            if terms != worker.sent:
+                worker.terms.put(sorted(terms))
+                worker.sent = terms
+
+    def update(self):
+        """Check for changes to the terms and workers, and update the workers to match"""
+        terms_changed = self.term_checker.check()
+        workers_changed = self.check_workers()
+
+        if terms_changed or workers_changed:
+            self.rebalance()
+        self.send_terms()
+
+        # Workers connect on their own, so the terms count as live once sent
+        self.term_checker.on_stream_live()
+
+    def start_polling(self, interval):
+        """Start the workers and poll for term updates"""
+        interval = float(interval)
+        self.polling = True
+        self.options.setdefault('poll_interval', interval)
+
+        self.term_checker.reset()
+        self.term_checker.attach(self)
+        self.start()
+
+        logger.info("Supervising %d workers", len(self.workers))
+        while self.polling:
+            loop_start = time()
+            self._wakeup.clear()
+
+            self.update()
+
+            elapsed = time() - loop_start
+            self._wakeup.wait(max(0.1, interval - elapsed))
+
+        logger.warning("Term poll ceased!")
+
+    def wake(self):
+        """Check for changes now instead of waiting out the interval"""
+        self._wakeup.set()
+
+    def stop_polling(self):
+        """Halts the polling loop (the workers keep going until shutdown)"""
+        logger.info("Stopping polling loop")
+        self.polling = False
+        self._wakeup.set()
+
+    def shutdown(self, timeout=None):
+        """Stop the workers, write out what they sent, then close the listener"""
+        deadline = None
+        if timeout is not None:
+            deadline = time() + float(timeout)
+
+        def remaining():
+            if deadline is None:
+                return None
+            return max(0, deadline - time())
+
+        logger.info("Shutting down workers")
+        self.stop_polling()
+
+        if self._writer is not None:
+            for worker in self.workers:
+                worker.terms.put(_STOP)
+            for worker in self.workers:
+                worker.process.join(remaining())
+                if worker.process.is_alive():
+                    logger.warning("Worker %d did not stop, terminating it", worker.shard)
+                    worker.process.terminate()
+
+            self.output.put(_STOP)
+            self._writer.join(remaining())
+            self._writer = None
+
+        self.listener.close(timeout=remaining())
+
+    def stats(self):
+        """A list of counts for each worker"""
+        now = time()
+        counts = dict((worker.shard, 0) for worker in self.workers)
+        for shard in self.assignments.values():
+            counts[shard] += 1
+
+        with self.lock:
+            return [{
+                'shard': worker.shard,
+                'pid': worker.process.pid if worker.process is not None else None,
+                'alive': worker.process is not None and worker.process.is_alive(),
+                'terms': counts[worker.shard],
+                'received': worker.received,
+                'duplicates': worker.duplicates,
+                'limited': worker.limited,
+                'errors': worker.errors,
+                'restarts': worker.restarts,
+                'rate_limited': worker.rate_limited or not worker.available(now),
+            } for worker in self.workers]